@@ -0,0 +1,192 @@
+"""Чтение с реплик базы данных.
+
+Реплики — подключения с алиасом replica_<n>, их создают настройки
+из переменной DB_REPLICA_HOSTS. ReplicaRoutingMiddleware направляет
+на реплику чтение в безопасных запросах к вьюсетам из REPLICA_READ_VIEWS,
+остальные запросы, управляющие команды и записи идут в основную БД.
+
+После успешного изменяющего запроса клиент на REPLICA_PIN_SECONDS
+закрепляется за основной БД, чтобы видеть свои изменения, пока реплика
+их не догнала. Клиент узнается по хэшу заголовка Authorization, по
+токену, выданному в ответе (вход после регистрации), и по пользователю
+сессии. Метка хранится в кэше Django, между воркерами она общая только
+при общем кэше (Redis).
+
+Если реплика отказала посреди безопасного запроса, вьюха один раз
+выполняется заново с чтением из основной БД.
+"""
+import hashlib
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from django.core.cache import cache
+from django.db import (DEFAULT_DB_ALIAS, DatabaseError, OperationalError,
+                       connections)
+from foodgram.settings import (REPLICA_HEALTH_INTERVAL, REPLICA_PIN_SECONDS,
+                               REPLICA_READ_VIEWS)
+from rest_framework.permissions import SAFE_METHODS
+
+logger = logging.getLogger(__name__)
+
+REPLICA_PREFIX = 'replica'
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+def get_replicas():
+    return [alias for alias in connections.databases
+            if alias.startswith(REPLICA_PREFIX)]
+
+
+class ReplicaHealth:
+    """Доступность реплик с проверкой подключения не чаще раза
+    в interval секунд на процесс."""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._checked = {}
+
+    def _check(self, alias):
+        try:
+            connections[alias].ensure_connection()
+        except DatabaseError as error:
+            logger.warning('Реплика %s недоступна: %s', alias, error)
+            return False
+        return True
+
+    def is_healthy(self, alias):
+        now = time.monotonic()
+        healthy, checked = self._checked.get(alias, (True, None))
+        if checked is None or now - checked >= self.interval:
+            healthy = self._check(alias)
+            self._checked[alias] = (healthy, now)
+        return healthy
+
+    def mark_down(self, alias):
+        self._checked[alias] = (False, time.monotonic())
+
+
+replica_health = ReplicaHealth(REPLICA_HEALTH_INTERVAL)
+
+
+class ReplicaRouter:
+    """Чтение из реплики, выбранной для текущего запроса, запись
+    и миграции — только в основную БД."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная БД.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+def _authorization_pin_key(authorization):
+    digest = hashlib.sha256(authorization.encode()).hexdigest()
+    return f'db:pinned:{digest}'
+
+
+def _user_pin_key(user):
+    return f'db:pinned:user:{user.pk}'
+
+
+def _request_user(request):
+    user = getattr(request, 'user', None)
+    return user if user is not None and user.is_authenticated else None
+
+
+def _read_pin_keys(request):
+    """Ключи, по которым проверяется закрепление перед чтением."""
+    keys = []
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        keys.append(_authorization_pin_key(authorization))
+    else:
+        # Пользователь сессии грузится только при наличии cookie, его же
+        # затем использует SessionAuthentication.
+        user = _request_user(request)
+        if user is not None:
+            keys.append(_user_pin_key(user))
+    return keys
+
+
+def _write_pin_keys(request, response):
+    """Ключи закрепления после изменяющего запроса: заголовок
+    Authorization, выданный в ответе токен и пользователь запроса."""
+    keys = []
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        keys.append(_authorization_pin_key(authorization))
+    data = getattr(response, 'data', None)
+    if isinstance(data, dict) and data.get('auth_token'):
+        keys.append(_authorization_pin_key(f'Token {data["auth_token"]}'))
+    user = _request_user(request)
+    if user is not None:
+        keys.append(_user_pin_key(user))
+    return keys
+
+
+def _view_name(view_func):
+    view = getattr(view_func, 'cls', view_func)
+    return f'{view.__module__}.{view.__name__}'
+
+
+def choose_replica(request, view_func):
+    """Алиас реплики для запроса или None, если читать из основной БД."""
+    if (request.method not in SAFE_METHODS
+            or _view_name(view_func) not in REPLICA_READ_VIEWS):
+        return None
+    replicas = get_replicas()
+    if not replicas:
+        return None
+    pin_keys = _read_pin_keys(request)
+    if pin_keys and cache.get_many(pin_keys):
+        return None
+    healthy = [alias for alias in replicas
+               if replica_health.is_healthy(alias)]
+    return random.choice(healthy) if healthy else None
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.read_alias_token = None
+        try:
+            response = self.get_response(request)
+        finally:
+            if request.read_alias_token is not None:
+                _read_alias.reset(request.read_alias_token)
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            cache.set_many(dict.fromkeys(
+                _write_pin_keys(request, response), True),
+                REPLICA_PIN_SECONDS)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        alias = choose_replica(request, view_func)
+        if alias is not None:
+            request.read_alias_token = _read_alias.set(alias)
+            request.replica_view = (view_func, view_args, view_kwargs)
+
+    def process_exception(self, request, exception):
+        # Реплика отказала посреди запроса: до следующей проверки
+        # чтение идет из основной БД, а безопасный запрос повторяется.
+        alias = _read_alias.get()
+        if alias is None or not isinstance(exception, OperationalError):
+            return None
+        replica_health.mark_down(alias)
+        logger.warning('Запрос %s повторен на основной БД после ошибки '
+                       'реплики %s: %s', request.path, alias, exception)
+        _read_alias.set(None)
+        view_func, view_args, view_kwargs = request.replica_view
+        return view_func(request, *view_args, **view_kwargs)
@@ -0,0 +1,244 @@
+"""Метрики запросов: число и время SQL-запросов, время кода вьюхи
+и рендеринга, размер ответа.
+
+MetricsMiddleware считает их для каждого запроса, добавляет заголовок
+Server-Timing, пишет в лог медленные запросы с самыми частыми
+повторяющимися запросами (признак N+1) и копит гистограммы по вьюхам.
+Гистограммы отдает metrics_view в текстовом формате Prometheus только
+адресам из METRICS_ALLOWED_IPS. Они хранятся в памяти процесса: при
+нескольких воркерах gunicorn каждый отдает свою часть.
+"""
+import ipaddress
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+from foodgram.settings import (METRICS_ALLOWED_IPS, METRICS_SERVER_TIMING,
+                               SLOW_REQUEST_MS, SLOW_REQUEST_QUERIES)
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERIES_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+SLOW_REQUEST_FINGERPRINTS = 3
+METRICS_NETWORKS = tuple(
+    ipaddress.ip_network(value.strip()) for value in METRICS_ALLOWED_IPS)
+
+LITERALS = re.compile(r"(%s|\b\d+\b|'[^']*')(, (%s|\b\d+\b|'[^']*'))*")
+
+
+def fingerprint(sql):
+    """SQL без значений: запросы, отличающиеся только параметрами
+    и длиной списка IN, получают один отпечаток."""
+    return LITERALS.sub('?', sql)
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, view, value):
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(view)
+            if series is None:
+                series = self._series[view] = [
+                    [0] * (len(self.buckets) + 1), 0]
+            series[0][position] += 1
+            series[1] += value
+
+    def expose(self):
+        lines = [f'# HELP {self.name} {self.documentation}',
+                 f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {view: (list(counts), total)
+                      for view, (counts, total) in self._series.items()}
+        for view, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+            for bound, count in zip(bounds, counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket'
+                             f'{{view="{view}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{view="{view}"}} {total}')
+            lines.append(f'{self.name}_count{{view="{view}"}} {cumulative}')
+        return lines
+
+
+HISTOGRAMS = {
+    'duration': Histogram(
+        'foodgram_request_duration_seconds',
+        'Полное время обработки запроса.', DURATION_BUCKETS),
+    'db': Histogram(
+        'foodgram_request_db_seconds',
+        'Время SQL-запросов за запрос.', DURATION_BUCKETS),
+    'view': Histogram(
+        'foodgram_request_view_seconds',
+        'Время кода вьюхи без SQL (фильтры, сериализаторы).',
+        DURATION_BUCKETS),
+    'render': Histogram(
+        'foodgram_request_render_seconds',
+        'Время рендеринга ответа.', DURATION_BUCKETS),
+    'queries': Histogram(
+        'foodgram_request_queries',
+        'Число SQL-запросов за запрос.', QUERIES_BUCKETS),
+    'size': Histogram(
+        'foodgram_response_size_bytes',
+        'Размер тела ответа.', SIZE_BUCKETS),
+}
+
+
+class RequestMetrics:
+    """Счетчики одного запроса; __call__ — обертка выполнения SQL."""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.view = 'unresolved'
+        self.view_start = self.view_end = None
+        self.db_time = 0
+        self.view_db_time = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.db_time += elapsed
+            if self.view_start is not None and self.view_end is None:
+                self.view_db_time += elapsed
+            self.statements[sql] += 1
+
+    @property
+    def queries(self):
+        return sum(self.statements.values())
+
+    def timings(self, end):
+        """Фазы запроса в секундах: db, view, render, total."""
+        view_end = self.view_end or end
+        view_time = render_time = 0
+        if self.view_start is not None:
+            view_time = view_end - self.view_start - self.view_db_time
+            render_time = end - view_end
+        return {
+            'db': self.db_time,
+            'view': max(view_time, 0),
+            'render': render_time,
+            'total': end - self.start,
+        }
+
+    def repeated(self):
+        """Самые частые повторяющиеся отпечатки запросов."""
+        fingerprints = Counter()
+        for sql, count in self.statements.items():
+            fingerprints[fingerprint(sql)] += count
+        return [(sql, count) for sql, count in fingerprints.most_common(
+            SLOW_REQUEST_FINGERPRINTS) if count > 1]
+
+
+def view_name(request, view_func):
+    """Имя вьюхи для меток: Класс.действие для DRF, имя URL для
+    остальных."""
+    view = getattr(view_func, 'cls', None)
+    if view is None:
+        match = request.resolver_match
+        return match.view_name if match else view_func.__name__
+    method = request.method.lower()
+    action = getattr(view_func, 'actions', {}).get(method, method)
+    return f'{view.__name__}.{action}'
+
+
+def server_timing(timings, queries):
+    return ', '.join(
+        f'{name};dur={value * 1000:.1f}'
+        + (f';desc="{queries} queries"' if name == 'db' else '')
+        for name, value in timings.items())
+
+
+def response_size(response):
+    if response.streaming:
+        return None
+    return len(response.content)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = request.metrics = RequestMetrics()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(metrics))
+            response = self.get_response(request)
+        timings = metrics.timings(time.perf_counter())
+        if METRICS_SERVER_TIMING:
+            response['Server-Timing'] = server_timing(
+                timings, metrics.queries)
+        self.record(metrics, timings, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request.metrics.view = view_name(request, view_func)
+        request.metrics.view_start = time.perf_counter()
+
+    def process_template_response(self, request, response):
+        # Вызывается сразу после вьюхи, до рендеринга ответа DRF.
+        request.metrics.view_end = time.perf_counter()
+        return response
+
+    def record(self, metrics, timings, response):
+        view = metrics.view
+        for name in ('db', 'view', 'render'):
+            HISTOGRAMS[name].observe(view, timings[name])
+        HISTOGRAMS['duration'].observe(view, timings['total'])
+        HISTOGRAMS['queries'].observe(view, metrics.queries)
+        size = response_size(response)
+        if size is not None:
+            HISTOGRAMS['size'].observe(view, size)
+        if (timings['total'] * 1000 >= SLOW_REQUEST_MS
+                or metrics.queries >= SLOW_REQUEST_QUERIES):
+            log_slow_request(metrics, timings)
+
+
+def log_slow_request(metrics, timings):
+    repeated = ''.join(
+        f'\n  {count} x {sql}' for sql, count in metrics.repeated())
+    logger.warning(
+        'Медленный запрос %s: %.0f ms, SQL %d за %.0f ms%s',
+        metrics.view, timings['total'] * 1000, metrics.queries,
+        timings['db'] * 1000, repeated)
+
+
+def metrics_allowed(request):
+    """Адрес клиента из METRICS_ALLOWED_IPS. X-Forwarded-For не
+    учитывается: его может подставить сам клиент."""
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in network for network in METRICS_NETWORKS)
+
+
+def metrics_view(request):
+    if not metrics_allowed(request):
+        return HttpResponseForbidden()
+    lines = []
+    for histogram in HISTOGRAMS.values():
+        lines.extend(histogram.expose())
+    return HttpResponse(
+        '\n'.join(lines) + '\n',
+        content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -25,6 +25,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'foodgram.metrics.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -34,6 +35,7 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.common.CommonMiddleware",
+    'foodgram.db_router.ReplicaRoutingMiddleware',
 ]
 
 CORS_ALLOWED_ORIGINS = [
@@ -75,6 +77,48 @@ DATABASES = {
     }
 }
 
+# Реплики для чтения: DB_REPLICA_HOSTS=host1,host2:5433. Для локальной
+# проверки можно указать хост основной БД — получатся два алиаса
+# одной базы. В тестах реплики отражают тестовую основную БД.
+for number, replica in enumerate(
+        filter(None, os.getenv('DB_REPLICA_HOSTS', '').split(',')), 1):
+    host, _, port = replica.strip().partition(':')
+    DATABASES[f'replica_{number}'] = dict(
+        DATABASES['default'],
+        HOST=host,
+        PORT=port or DATABASES['default']['PORT'],
+        OPTIONS={'connect_timeout': 2},
+        TEST={'MIRROR': 'default'},
+    )
+
+DATABASE_ROUTERS = ['foodgram.db_router.ReplicaRouter']
+REPLICA_READ_VIEWS = (
+    'recipe_book.views.RecipesViewSet',
+    'recipe_book.views.TagsViewSet',
+    'recipe_book.views.IngredientsViewSet',
+    'recipe_book.views.SubscriptionsViewSet',
+)
+# Сколько секунд после своего изменения клиент читает из основной БД.
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+REPLICA_HEALTH_INTERVAL = 10
+
+# Кэш в памяти процесса годится только для одного воркера gunicorn
+# (как в Dockerfile): версии справочников, журнал индекса ингредиентов
+# рецептов, отзыв токенов и закрепление за основной БД видны только
+# своему процессу. При нескольких воркерах нужен общий кэш: REDIS_URL.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    }
+}
+
+if os.getenv('REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    }
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -108,7 +152,7 @@ REST_FRAMEWORK = {
     ],
 
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'users.authentication.CachedTokenAuthentication',
     ],
 
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
@@ -122,7 +166,9 @@ DJOSER = {
     },
     'PERMISSIONS': {
         'user': ['djoser.permissions.CurrentUserOrAdminOrReadOnly'],
-    }
+    },
+    # Смена пароля удаляет токены: иначе старый токен продолжал бы работать.
+    'LOGOUT_ON_PASSWORD_CHANGE': True,
 }
 
 STATIC_ROOT = os.path.join(BASE_DIR, 'static')
@@ -130,6 +176,7 @@ STATIC_URL = '/static/'
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+DEFAULT_FILE_STORAGE = 'recipe_book.storage.ContentAddressedStorage'
 
 FIXTURE_DIRS = (
     os.path.join(BASE_DIR, 'fixtures'),
@@ -137,3 +184,34 @@ FIXTURE_DIRS = (
 
 MAX_INGREDIENT_AMOUNT = 9999
 MIN_INGREDIENT_AMOUNT = 1
+
+INGREDIENT_SEARCH_LIMIT = 50
+# Сколько лучших рецептов возвращает поиск по имеющимся ингредиентам.
+PANTRY_SEARCH_LIMIT = 1000
+# Сколько рецептов можно добавить в корзину или убрать из нее за запрос.
+MAX_BULK_RECIPES = 100
+
+# Обработка изображений рецептов: 0 воркеров — обработка сразу после
+# коммита в потоке запроса.
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+IMAGE_MAX_SIZE = 1600
+IMAGE_THUMBNAIL_WIDTHS = (320, 640, 960)
+
+# Кэш токенов аутентификации. В памяти процесса отзыв токена в других
+# воркерах виден только по истечении AUTH_TOKEN_CACHE_TIMEOUT, в общем
+# кэше (Redis) — сразу.
+AUTH_TOKEN_CACHE_TIMEOUT = int(os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', 60))
+AUTH_TOKEN_CACHE_SIZE = 10000
+AUTH_TOKEN_CACHE_SHARED = os.getenv(
+    'AUTH_TOKEN_CACHE_SHARED', str(bool(os.getenv('REDIS_URL')))
+).lower() in ('1', 'true', 'yes')
+
+# Метрики запросов: заголовок Server-Timing и порог медленного запроса
+# (по времени или числу SQL-запросов) для записи в лог.
+METRICS_SERVER_TIMING = True
+SLOW_REQUEST_MS = int(os.getenv('SLOW_REQUEST_MS', 500))
+SLOW_REQUEST_QUERIES = 50
+# Адреса и подсети, которым отдается /metrics, через запятую. nginx этот
+# путь наружу не проксирует, прямые обращения к gunicorn ограничены здесь.
+METRICS_ALLOWED_IPS = tuple(filter(None, os.getenv(
+    'METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')))
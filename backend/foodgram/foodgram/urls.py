@@ -1,8 +1,11 @@
 from django.contrib import admin
 from django.urls import include, path
+from foodgram.metrics import metrics_view
 
 urlpatterns = [
     path('api/', include('recipe_book.urls')),
     path('api/', include('users.urls')),
     path('admin/', admin.site.urls),
+    # Не проксируется nginx наружу, доступен адресам METRICS_ALLOWED_IPS.
+    path('metrics', metrics_view, name='metrics'),
 ]
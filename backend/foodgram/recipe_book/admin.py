@@ -1,36 +1,212 @@
+from collections import Counter
+from contextlib import contextmanager
+
 from django.contrib import admin
-from recipe_book.models import (Favorite, Ingredient, Recipe, Structure,
-                                Subscription, Tag)
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+from recipe_book.cache import invalidate_cached_recipes
+from recipe_book.counters import change_counter, change_counters
+from recipe_book.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                                Structure, Subscription, Tag)
+from recipe_book.pagination import EstimatedCountPaginator
+from recipe_book.pantry import pantry_index
+from recipe_book.search import update_search_vectors
+from recipe_book.shopping_list import (get_recipe_amounts, lock_recipes,
+                                       remove_recipes_from_shopping_lists,
+                                       update_shopping_lists)
+from recipe_book.toggles import favorites, shopping_carts, subscriptions
+
+User = get_user_model()
+
 
+@contextmanager
+def structure_change(recipe_ids):
+    """Переносит сделанное в блоке изменение состава рецептов в списки
+    покупок, поисковые векторы и индекс по ингредиентам."""
+    recipe_ids = set(recipe_ids)
+    old_amounts = {pk: get_recipe_amounts([pk]) for pk in recipe_ids}
+    yield
+    lock_recipes(recipe_ids)
+    for pk in sorted(recipe_ids):
+        update_shopping_lists(pk, old_amounts[pk], get_recipe_amounts([pk]))
+    recipes = Recipe.objects.filter(pk__in=recipe_ids)
+    # Состав входит в кэшированное представление рецепта.
+    recipes.update(updated_at=timezone.now())
+    update_search_vectors(recipes)
+    pantry_index.recipes_changed(recipe_ids)
 
-class RecipeIngredientInline(admin.StackedInline):
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Список без полного COUNT(*) и с оценкой числа строк."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    empty_value_display = '-пусто-'
+
+
+class RecipeIngredientInline(admin.TabularInline):
     model = Ingredient.recipe.through
     min_num = 1
+    extra = 0
+    autocomplete_fields = ('ingredients',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related(
+            'recipe', 'ingredients')
 
 
 @admin.register(Recipe)
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(LargeTableAdmin):
     inlines = (RecipeIngredientInline,)
-    list_display = ('name', 'author', 'count_is_favorites')
+    list_display = ('name', 'author', 'pub_date', 'count_is_favorites')
+    list_select_related = ('author',)
     ordering = ('name', 'author',)
-    search_fields = ('author', 'name', 'tags')
-    list_filter = ('author', 'name', 'tags')
-    empty_value_display = '-пусто-'
+    search_fields = ('name', 'author__username', 'author__email')
+    list_filter = ('tags', ('pub_date', admin.DateFieldListFilter))
+    autocomplete_fields = ('author',)
+    filter_horizontal = ('tags',)
 
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        if not change:
+            change_counter(User, obj.author_id, 'recipes_count', 1)
+        elif 'author' in form.changed_data:
+            change_counter(User, form.initial['author'], 'recipes_count', -1)
+            change_counter(User, obj.author_id, 'recipes_count', 1)
+
+    def save_related(self, request, form, formsets, change):
+        with structure_change([form.instance.pk]):
+            super().save_related(request, form, formsets, change)
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        self.recipes_deleted([obj])
+        super().delete_model(request, obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        self.recipes_deleted(list(queryset))
+        super().delete_queryset(request, queryset)
+
+    def recipes_deleted(self, recipes):
+        recipe_ids = [recipe.pk for recipe in recipes]
+        remove_recipes_from_shopping_lists(recipe_ids)
+        authors = Counter(recipe.author_id for recipe in recipes)
+        for count in set(authors.values()):
+            change_counters(User, [
+                author_id for author_id, recipes_count in authors.items()
+                if recipes_count == count
+            ], 'recipes_count', -count)
+        invalidate_cached_recipes(recipes)
+        pantry_index.recipes_changed(recipe_ids)
+
+    @admin.display(description='В избранном',
+                   ordering='favorites_count')
     def count_is_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(LargeTableAdmin):
     list_display = ('name', 'measurement_unit',)
     ordering = ('name',)
     search_fields = ('name',)
-    list_filter = ('name',)
-    empty_value_display = '-пусто-'
+    list_filter = ('measurement_unit',)
+
+
+@admin.register(Structure)
+class StructureAdmin(LargeTableAdmin):
+    list_display = ('recipe', 'ingredients', 'amount')
+    list_select_related = ('recipe', 'ingredients')
+    autocomplete_fields = ('recipe', 'ingredients')
+    ordering = ('-id',)
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        recipe_ids = [obj.recipe_id]
+        if change:
+            recipe_ids.append(form.initial['recipe'])
+        with structure_change(recipe_ids):
+            super().save_model(request, obj, form, change)
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        with structure_change([obj.recipe_id]):
+            super().delete_model(request, obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        with structure_change(queryset.values_list('recipe_id', flat=True)):
+            super().delete_queryset(request, queryset)
+
+
+class ToggleAdmin(LargeTableAdmin):
+    """Связи пользователя (избранное, корзина, подписки), добавленные,
+    измененные или удаленные в админке, меняют счетчики и списки
+    покупок так же, как действия API."""
+    toggle = None
+
+    @transaction.atomic
+    def save_model(self, request, obj, form, change):
+        if change and not form.changed_data:
+            return super().save_model(request, obj, form, change)
+        target = self.toggle.field
+        if change:
+            self.links_changed(
+                [(form.initial['user'], form.initial[target.name])], -1)
+        super().save_model(request, obj, form, change)
+        self.links_changed([(obj.user_id, getattr(obj, target.attname))], 1)
+
+    @transaction.atomic
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        self.links_changed(
+            [(obj.user_id, getattr(obj, self.toggle.field.attname))], -1)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        links = list(queryset.values_list(
+            'user_id', self.toggle.field.attname))
+        super().delete_queryset(request, queryset)
+        self.links_changed(links, -1)
+
+    def links_changed(self, links, delta):
+        """Переносит добавленные (delta > 0) или удаленные пары
+        (id пользователя, id объекта) в счетчики и списки покупок."""
+        targets = {}
+        for user_id, target_id in links:
+            targets.setdefault(user_id, []).append(target_id)
+        for user_id, target_ids in targets.items():
+            self.toggle.changed(User(pk=user_id), target_ids, delta)
+
+
+@admin.register(Subscription)
+class SubscriptionAdmin(ToggleAdmin):
+    list_display = ('user', 'author')
+    list_select_related = ('user', 'author')
+    autocomplete_fields = ('user', 'author')
+    search_fields = ('user__username', 'author__username')
+    ordering = ('-id',)
+    toggle = subscriptions
+
+
+class UserRecipeAdmin(ToggleAdmin):
+    list_display = ('user', 'recipe')
+    list_select_related = ('user', 'recipe')
+    autocomplete_fields = ('user', 'recipe')
+    search_fields = ('user__username', 'recipe__name')
+    ordering = ('-id',)
+
+
+@admin.register(Favorite)
+class FavoriteAdmin(UserRecipeAdmin):
+    toggle = favorites
+
+
+@admin.register(ShoppingCart)
+class ShoppingCartAdmin(UserRecipeAdmin):
+    toggle = shopping_carts
 
 
 admin.site.register(Tag)
-admin.site.register(Structure)
-admin.site.register(Subscription)
-admin.site.register(Favorite)
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class RecipeBookConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'recipe_book'
+
+    def ready(self):
+        import recipe_book.signals  # noqa: F401
@@ -0,0 +1,22 @@
+"""Сценарии команды benchmark: модуль на сценарий с функцией run(repeat),
+возвращающей [(подпись, результат замера)]. Сценарии с WRITES = True
+оставляют изменения в БД и запускаются только с --allow-writes."""
+from recipe_book.benchmarks import (api_recipe_detail, api_recipe_list,
+                                    api_recipe_write, api_shopping_list,
+                                    api_subscriptions, auth, ingredient_search,
+                                    pantry, recipe_feed, recipe_write,
+                                    toggle_concurrency)
+
+SCENARIOS = {
+    'ingredient_search': ingredient_search,
+    'recipe_feed': recipe_feed,
+    'recipe_write': recipe_write,
+    'pantry': pantry,
+    'auth': auth,
+    'api_recipe_list': api_recipe_list,
+    'api_recipe_detail': api_recipe_detail,
+    'api_subscriptions': api_subscriptions,
+    'api_shopping_list': api_shopping_list,
+    'api_recipe_write': api_recipe_write,
+    'toggle_concurrency': toggle_concurrency,
+}
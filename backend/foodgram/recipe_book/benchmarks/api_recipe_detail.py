@@ -0,0 +1,20 @@
+"""Страница рецепта по кругу из популярных и случайных рецептов."""
+from itertools import cycle
+
+from django.core.management.base import CommandError
+from recipe_book.benchmarks.common import api_call, api_client, measure
+from recipe_book.models import Recipe
+
+
+def run(repeat):
+    client = api_client()
+    ids = list(Recipe.objects.order_by('-favorites_count').values_list(
+        'pk', flat=True)[:25])
+    ids += list(Recipe.objects.order_by('?').values_list(
+        'pk', flat=True)[:25])
+    if not ids:
+        raise CommandError('Нет рецептов, сначала выполните seed_data')
+    recipes = cycle(ids)
+    return [('GET /api/recipes/<id>/', measure(
+        lambda: api_call(client, 'get', f'/api/recipes/{next(recipes)}/'),
+        repeat))]
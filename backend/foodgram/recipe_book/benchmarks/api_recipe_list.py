@@ -0,0 +1,25 @@
+"""Список рецептов без фильтров и с каждым из фильтров."""
+from django.contrib.auth import get_user_model
+from recipe_book.benchmarks.common import api_call, api_client, measure
+from recipe_book.models import Recipe, Tag
+
+User = get_user_model()
+
+
+def run(repeat):
+    client = api_client()
+    tag = Tag.objects.order_by('pk').first()
+    author = User.objects.order_by('-recipes_count').first()
+    recipe = Recipe.objects.order_by('-favorites_count').first()
+    filters = {
+        'no filters': {},
+        'tags': {'tags': tag.slug if tag else ''},
+        'author': {'author': author.pk},
+        'is_favorited': {'is_favorited': 1},
+        'is_in_shopping_cart': {'is_in_shopping_cart': 1},
+        'search': {'search': recipe.name.split()[0] if recipe else ''},
+        'ordering=popular': {'ordering': 'popular'},
+    }
+    return [(label, measure(
+        lambda params=params: api_call(client, 'get', '/api/recipes/', params),
+        repeat)) for label, params in filters.items()]
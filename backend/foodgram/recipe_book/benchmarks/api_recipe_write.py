@@ -0,0 +1,56 @@
+"""Создание и редактирование рецепта через API. Все изменения
+откатываются."""
+import base64
+import io
+from itertools import cycle
+
+from django.core.management.base import CommandError
+from django.db import transaction
+from PIL import Image
+from recipe_book.benchmarks.common import (WRITE_RECIPE_SIZE, api_call,
+                                           api_client, measure)
+from recipe_book.models import Ingredient, Tag
+
+
+def image_data():
+    buffer = io.BytesIO()
+    Image.new('RGB', (32, 32), (200, 120, 60)).save(buffer, 'PNG')
+    return ('data:image/png;base64,'
+            + base64.b64encode(buffer.getvalue()).decode())
+
+
+def run(repeat):
+    client = api_client()
+    ingredients = list(Ingredient.objects.order_by('pk').values_list(
+        'pk', flat=True)[:WRITE_RECIPE_SIZE])
+    tags = list(Tag.objects.order_by('pk').values_list('pk', flat=True)[:2])
+    if not ingredients or not tags:
+        raise CommandError('Нужны теги и ингредиенты')
+    payload = {
+        'tags': tags,
+        'ingredients': [{'id': pk, 'amount': 100} for pk in ingredients],
+        'image': image_data(),
+        'text': 'benchmark',
+        'cooking_time': 10,
+    }
+    numbers = iter(range(repeat + 1))
+    rows = []
+    with transaction.atomic():
+        rows.append(('POST /api/recipes/', measure(
+            lambda: api_call(client, 'post', '/api/recipes/', dict(
+                payload, name=f'benchmark-{next(numbers)}'), 201),
+            repeat)))
+        recipe_id = api_call(client, 'post', '/api/recipes/', dict(
+            payload, name='benchmark-edit'), 201).data['id']
+        edits = cycle((150, 100))
+        rows.append(('PATCH /api/recipes/<id>/', measure(
+            lambda: api_call(
+                client, 'patch', f'/api/recipes/{recipe_id}/', {
+                    'ingredients': [
+                        {'id': pk, 'amount': next(edits)}
+                        for pk in ingredients[:2]] + payload[
+                            'ingredients'][2:],
+                }),
+            repeat)))
+        transaction.set_rollback(True)
+    return rows
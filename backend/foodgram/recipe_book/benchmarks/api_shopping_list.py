@@ -0,0 +1,11 @@
+"""Выгрузка списка покупок в каждом из форматов."""
+from recipe_book.benchmarks.common import api_call, api_client, measure
+
+
+def run(repeat):
+    client = api_client()
+    return [(f'format={export_format}', measure(
+        lambda export_format=export_format: api_call(
+            client, 'get', '/api/recipes/download_shopping_cart/',
+            {'format': export_format}),
+        repeat)) for export_format in ('txt', 'csv', 'json')]
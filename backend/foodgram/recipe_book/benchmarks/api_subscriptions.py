@@ -0,0 +1,11 @@
+"""Подписки с разным числом рецептов каждого автора."""
+from recipe_book.benchmarks.common import api_call, api_client, measure
+
+
+def run(repeat):
+    client = api_client()
+    return [(f'recipes_limit={limit}', measure(
+        lambda limit=limit: api_call(
+            client, 'get', '/api/users/subscriptions/',
+            {'recipes_limit': limit}),
+        repeat)) for limit in (3, 10)]
@@ -0,0 +1,37 @@
+"""Запросы к БД на аутентификацию по токену: TokenAuthentication против
+кэша токенов. Пользователь и токен удаляются откатом."""
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from recipe_book.benchmarks.common import measure
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient, APIRequestFactory
+from users.authentication import CachedTokenAuthentication, token_cache
+
+User = get_user_model()
+
+
+def run(repeat):
+    rows = []
+    with transaction.atomic():
+        user = User.objects.create(
+            username='benchmark-auth', email='benchmark-auth@localhost')
+        token = Token.objects.create(user=user)
+        header = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        request = APIRequestFactory().get('/', **header)
+        for label, authentication in (
+                ('TokenAuthentication', TokenAuthentication),
+                ('CachedTokenAuthentication', CachedTokenAuthentication)):
+            rows.append((label, measure(
+                lambda authentication=authentication:
+                    authentication().authenticate(request),
+                repeat)))
+        client = APIClient(SERVER_NAME='localhost')
+        token_cache.delete(token.key)
+        rows.append(('GET /api/users/me/ (cold)', measure(
+            lambda: client.get('/api/users/me/', **header), 1)))
+        rows.append(('GET /api/users/me/', measure(
+            lambda: client.get('/api/users/me/', **header), repeat)))
+        token_cache.delete(token.key)
+        transaction.set_rollback(True)
+    return rows
@@ -0,0 +1,137 @@
+"""Общие помощники замеров: время, запросы к БД, клиент API и раунды
+одновременных вызовов."""
+import threading
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from recipe_book.models import ShoppingCart
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+WRITE_RECIPE_SIZE = 20
+
+User = get_user_model()
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[round((len(values) - 1) * percent / 100)]
+
+
+def measure(func, repeat):
+    """Время выполнения в мс (p50, p95), запросов к БД за вызов
+    и вызовов в секунду при последовательном выполнении."""
+    timings = []
+    queries = 0
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries += len(context)
+    return {
+        'p50': percentile(timings, 50),
+        'p95': percentile(timings, 95),
+        'queries': queries / repeat,
+        'rps': repeat * 1000 / max(sum(timings), 1e-9),
+    }
+
+
+def api_client():
+    """Клиент API от имени пользователя с самой большой корзиной,
+    чтобы фильтры и список покупок были непустыми."""
+    user_id = (ShoppingCart.objects.values('user').annotate(
+        total=Count('pk')).order_by('-total').values_list(
+            'user', flat=True).first()
+        or User.objects.values_list('pk', flat=True).first())
+    if user_id is None:
+        raise CommandError('База пуста, сначала выполните seed_data')
+    token, _ = Token.objects.get_or_create(user_id=user_id)
+    return APIClient(SERVER_NAME='localhost',
+                     HTTP_AUTHORIZATION=f'Token {token.key}')
+
+
+def api_call(client, method, path, data=None, expected=200):
+    """Запрос к API с проверкой кода ответа: замер ошибок ничего
+    не говорит о производительности."""
+    response = getattr(client, method)(path, data, format='json')
+    if response.status_code != expected:
+        raise CommandError(
+            f'{method.upper()} {path}: {response.status_code}, '
+            f'ожидался {expected}')
+    return response
+
+
+def run_concurrently(func, threads):
+    """Вызывает func одновременно из threads потоков.
+
+    Возвращает [(результат, мс, запросов)] и общее время в мс.
+    """
+    barrier = threading.Barrier(threads)
+    results = [None] * threads
+
+    def worker(number):
+        try:
+            barrier.wait()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                try:
+                    outcome = func()
+                except IntegrityError:
+                    outcome = 500
+                elapsed = (time.perf_counter() - start) * 1000
+            results[number] = (outcome, elapsed, len(context))
+        finally:
+            connection.close()
+
+    workers = [threading.Thread(target=worker, args=(number,))
+               for number in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return results, (time.perf_counter() - start) * 1000
+
+
+class ConcurrentStats:
+    """Времена, запросы и коды ответов, накопленные по раундам
+    одновременных вызовов."""
+
+    def __init__(self, threads):
+        self.threads = threads
+        self.timings = []
+        self.queries = 0
+        self.wall = 0
+        self.statuses = Counter()
+
+    def run(self, func, expected=None):
+        """Раунд из threads одновременных вызовов. Ошибка, если коды
+        ответов раунда отличаются от ожидаемых."""
+        results, elapsed = run_concurrently(func, self.threads)
+        statuses = Counter(outcome for outcome, _, _ in results)
+        if expected and statuses != expected:
+            raise CommandError(f'Ожидались коды {dict(expected)}, '
+                               f'получены {dict(statuses)}')
+        self.wall += elapsed
+        self.statuses.update(statuses)
+        self.timings.extend(elapsed for _, elapsed, _ in results)
+        self.queries += sum(count for _, _, count in results)
+
+    @property
+    def label(self):
+        return ' '.join(f'{code}:{count}'
+                        for code, count in sorted(self.statuses.items()))
+
+    def result(self):
+        return {
+            'p50': percentile(self.timings, 50),
+            'p95': percentile(self.timings, 95),
+            'queries': self.queries / len(self.timings),
+            'rps': len(self.timings) * 1000 / max(self.wall, 1e-9),
+        }
@@ -0,0 +1,24 @@
+"""Автодополнение ингредиентов: ORM с istartswith против индекса."""
+from foodgram.settings import INGREDIENT_SEARCH_LIMIT
+from recipe_book.benchmarks.common import measure
+from recipe_book.ingredient_index import ingredient_index
+from recipe_book.models import Ingredient
+from recipe_book.serializers import IngredientSerializers
+
+SEARCH_QUERIES = ('а', 'мо', 'сах', 'карт', 'томатная', 'оль')
+
+
+def run(repeat):
+    ingredient_index.search('', 1)
+    rows = []
+    for query in SEARCH_QUERIES:
+        rows.append((f'orm "{query}"', measure(
+            lambda query=query: IngredientSerializers(
+                Ingredient.objects.filter(name__istartswith=query),
+                many=True).data,
+            repeat)))
+        rows.append((f'index "{query}"', measure(
+            lambda query=query: ingredient_index.search(
+                query, INGREDIENT_SEARCH_LIMIT),
+            repeat)))
+    return rows
@@ -0,0 +1,55 @@
+"""Поиск по имеющимся ингредиентам: GROUP BY по составу в БД против
+индекса в памяти на синтетическом каталоге."""
+import random
+import time
+from itertools import accumulate
+
+from django.db.models import Count
+from recipe_book.benchmarks.common import measure
+from recipe_book.models import Ingredient, Recipe
+from recipe_book.pantry import MODES, PantryIndex
+
+PANTRY_RECIPES = 1000000
+PANTRY_INGREDIENTS = 2000
+PANTRY_SIZE = 12
+
+
+def synthetic_structure(recipes, ingredients, seed=0):
+    """Пары (рецепт, ингредиент) с неравномерной популярностью
+    ингредиентов: соль и масло встречаются чаще экзотики."""
+    rng = random.Random(seed)
+    population = range(1, ingredients + 1)
+    cum_weights = list(accumulate(1 / rank for rank in population))
+    for recipe_id in range(1, recipes + 1):
+        for ingredient_id in sorted(set(rng.choices(
+                population, cum_weights=cum_weights,
+                k=rng.randint(4, 12)))):
+            yield recipe_id, ingredient_id
+
+
+def run(repeat):
+    rows = []
+    pantry = list(Ingredient.objects.order_by('pk').values_list(
+        'pk', flat=True)[:PANTRY_SIZE])
+    rows.append(('sql group by (текущая БД)', measure(
+        lambda: list(Recipe.objects.filter(
+            structure__ingredients__in=pantry).annotate(
+                matched=Count('structure')).order_by(
+                    '-matched').values_list('pk', flat=True)[:100]),
+        repeat)))
+    start = time.perf_counter()
+    index = PantryIndex.from_rows(
+        synthetic_structure(PANTRY_RECIPES, PANTRY_INGREDIENTS))
+    build = (time.perf_counter() - start) * 1000
+    rows.append((f'index build {PANTRY_RECIPES} recipes',
+                 {'p50': build, 'p95': build, 'queries': 0}))
+    rng = random.Random(1)
+    pantry = rng.sample(range(1, 200), PANTRY_SIZE)
+    exclude = rng.sample(range(200, 400), 3)
+    for mode in MODES:
+        ingredients = pantry[:3] if mode == 'all' else pantry
+        rows.append((f'index mode={mode}', measure(
+            lambda mode=mode, ingredients=ingredients: index.search(
+                ingredients, mode, exclude, sync=False),
+            repeat)))
+    return rows
@@ -0,0 +1,33 @@
+"""Лента рецептов на разной глубине: OFFSET-пагинация против курсора."""
+from recipe_book.benchmarks.common import measure
+from recipe_book.models import Recipe
+from recipe_book.pagination import RecipeKeysetPagination
+from rest_framework.test import APIClient
+
+FEED_DEPTHS = (0, 0.1, 0.5, 0.9, 0.99)
+
+
+def run(repeat):
+    client = APIClient(SERVER_NAME='localhost')
+    paginator = RecipeKeysetPagination()
+    size = paginator.page_size
+    total = Recipe.objects.count()
+    rows = []
+    for depth in FEED_DEPTHS:
+        offset = int(total * depth) // size * size
+        if offset and offset >= total:
+            continue
+        page = offset // size + 1
+        rows.append((f'page={page}', measure(
+            lambda page=page: client.get(
+                f'/api/recipes/?limit={size}&page={page}'),
+            repeat)))
+        cursor = ''
+        if offset:
+            cursor = paginator.encode_cursor(paginator.get_position(
+                Recipe.objects.order_by(*paginator.ordering)[offset - 1]))
+        rows.append((f'cursor at {offset}', measure(
+            lambda cursor=cursor: client.get(
+                f'/api/recipes/?limit={size}&cursor={cursor}'),
+            repeat)))
+    return rows
@@ -0,0 +1,74 @@
+"""Редактирование состава: удаление и вставка заново против применения
+отличий. Все изменения откатываются."""
+from itertools import cycle
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+from django.db import transaction
+from django.shortcuts import get_object_or_404
+from recipe_book.benchmarks.common import WRITE_RECIPE_SIZE, measure
+from recipe_book.models import Ingredient, Recipe, Structure
+from recipe_book.serializers import RecipeWriteSerializer
+
+User = get_user_model()
+
+
+def legacy_write(ingredients, recipe):
+    """Прежняя запись состава: удаление всех строк и вставка заново
+    с отдельным запросом на каждый ингредиент."""
+    recipe.ingredients.clear()
+    Structure.objects.bulk_create([Structure(
+        ingredients=get_object_or_404(Ingredient, id=ingredient['id']),
+        recipe=recipe,
+        amount=ingredient['amount'],
+    ) for ingredient in ingredients])
+
+
+def diff_write(ingredients, recipe):
+    serializer = RecipeWriteSerializer()
+    serializer.update_ingredients(
+        serializer.validate_ingredients(ingredients), recipe)
+
+
+def row_churn(write, payloads, recipe):
+    """Число вставленных, удаленных и измененных строк состава
+    при переходе между вариантами рецепта."""
+    churn = 0
+    for payload in payloads:
+        before = dict(recipe.structure.values_list('pk', 'amount'))
+        write(payload, recipe)
+        after = dict(recipe.structure.values_list('pk', 'amount'))
+        churn += len(before.keys() ^ after.keys()) + sum(
+            before[pk] != after[pk] for pk in before.keys() & after.keys())
+    return churn / len(payloads)
+
+
+def run(repeat):
+    ids = list(Ingredient.objects.order_by('pk').values_list(
+        'pk', flat=True)[:WRITE_RECIPE_SIZE + 1])
+    if len(ids) <= WRITE_RECIPE_SIZE:
+        raise CommandError(
+            f'Нужно хотя бы {WRITE_RECIPE_SIZE + 1} ингредиентов')
+    original = [{'id': pk, 'amount': 100} for pk in ids[:-1]]
+    # Типичная правка: два количества изменены, один ингредиент заменен.
+    edited = [dict(item) for item in original[1:]]
+    edited[0]['amount'] = edited[1]['amount'] = 150
+    edited.append({'id': ids[-1], 'amount': 100})
+    payloads = (edited, original)
+    rows = []
+    with transaction.atomic():
+        author = User.objects.create(
+            username='benchmark-writer', email='benchmark@localhost')
+        recipe = Recipe.objects.create(
+            author=author, name='benchmark', text='benchmark',
+            cooking_time=1, image='benchmark.jpg')
+        for label, write in (('clear and insert', legacy_write),
+                             ('diff', diff_write)):
+            write(original, recipe)
+            variants = cycle(payloads)
+            result = measure(
+                lambda write=write: write(next(variants), recipe), repeat)
+            result['rows'] = row_churn(write, payloads, recipe)
+            rows.append((label, result))
+        transaction.set_rollback(True)
+    return rows
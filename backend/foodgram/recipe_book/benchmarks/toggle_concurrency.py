@@ -0,0 +1,85 @@
+"""Одновременные нажатия «в избранное», «в корзину» и «подписаться»
+от одного пользователя: ровно один 201 и один 204, остальные 400 и 404,
+без 500 и без расхождения счетчиков.
+
+Потоки работают в своих соединениях, поэтому откат не подходит: сценарий
+создает и удаляет настоящих пользователей и запускается только
+с --allow-writes."""
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import CommandError
+from django.db import connection
+from recipe_book.benchmarks.common import ConcurrentStats
+from recipe_book.models import Ingredient, Recipe, ShoppingListItem, Structure
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+TOGGLE_THREADS = 8
+WRITES = True
+
+User = get_user_model()
+
+
+def check_toggle_state(user, recipe):
+    recipe.refresh_from_db()
+    author = User.objects.get(pk=recipe.author_id)
+    state = {
+        'favorites_count': recipe.favorites_count,
+        'in_carts_count': recipe.in_carts_count,
+        'subscribers_count': author.subscribers_count,
+        'shopping list': ShoppingListItem.objects.filter(user=user).count(),
+    }
+    if any(state.values()):
+        raise CommandError(f'Рассогласование после удаления: {state}')
+
+
+def toggle_rows(user, recipe, token, repeat):
+    header = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+    phases = (
+        ('post', Counter({201: 1, 400: TOGGLE_THREADS - 1})),
+        ('delete', Counter({204: 1, 404: TOGGLE_THREADS - 1})),
+    )
+    rows = []
+    for name, path in (
+            ('favorite', f'/api/recipes/{recipe.pk}/favorite/'),
+            ('shopping_cart', f'/api/recipes/{recipe.pk}/shopping_cart/'),
+            ('subscribe', f'/api/users/{recipe.author_id}/subscribe/')):
+        stats = {method: ConcurrentStats(TOGGLE_THREADS)
+                 for method, _ in phases}
+        for _ in range(repeat):
+            for method, expected in phases:
+                stats[method].run(
+                    lambda method=method, path=path: getattr(
+                        APIClient(SERVER_NAME='localhost'), method)(
+                            path, **header).status_code,
+                    expected)
+        for method, _ in phases:
+            rows.append((f'{name} {method.upper()} {stats[method].label}',
+                         stats[method].result()))
+    check_toggle_state(user, recipe)
+    return rows
+
+
+def run(repeat):
+    if connection.vendor != 'postgresql':
+        raise CommandError('Проверка конкурентности работает только '
+                           'с PostgreSQL')
+    ingredient = Ingredient.objects.order_by('pk').first()
+    if ingredient is None:
+        raise CommandError('Справочник ингредиентов пуст')
+    User.objects.filter(username__startswith='benchmark-toggle').delete()
+    user = User.objects.create(
+        username='benchmark-toggle-user', email='toggle-user@localhost')
+    author = User.objects.create(
+        username='benchmark-toggle-author', email='toggle-author@localhost')
+    try:
+        recipe = Recipe.objects.create(
+            author=author, name='benchmark-toggle', text='benchmark',
+            cooking_time=1, image='benchmark.jpg')
+        Structure.objects.create(
+            recipe=recipe, ingredients=ingredient, amount=100)
+        token = Token.objects.create(user=user)
+        return toggle_rows(user, recipe, token, repeat)
+    finally:
+        User.objects.filter(pk__in=(user.pk, author.pk)).delete()
@@ -0,0 +1,69 @@
+"""Ключи и версии кэша сериализованных данных.
+
+Справочники и рецепты хранятся в кэше под ключами с номером версии.
+При изменении данных версия меняется, старые записи перестают читаться
+и вытесняются кэшем сами.
+"""
+import time
+
+from django.core.cache import cache
+
+RECIPE_CACHE_TIMEOUT = 60 * 60 * 24
+# Меняется вместе с форматом закэшированного представления рецепта.
+RECIPE_CACHE_FORMAT = 2
+
+
+def _version_key(name):
+    return f'catalog:{name}:version'
+
+
+def get_catalog_version(name):
+    version = cache.get(_version_key(name))
+    if version is None:
+        # Начальная версия берется от времени, чтобы после вытеснения
+        # счетчика не совпасть с номером уже закэшированного блоба.
+        cache.add(_version_key(name), time.time_ns(), timeout=None)
+        version = cache.get(_version_key(name))
+    return version
+
+
+def bump_catalog_version(name):
+    """Меняет версию и возвращает новую."""
+    try:
+        return cache.incr(_version_key(name))
+    except ValueError:
+        version = time.time_ns()
+        cache.set(_version_key(name), version, timeout=None)
+        return version
+
+
+def _recipe_key(recipe, versions):
+    return (f'recipe:{RECIPE_CACHE_FORMAT}:{recipe.pk}:'
+            f'{recipe.updated_at.timestamp()}:{versions}')
+
+
+def _recipe_keys(recipes):
+    # Представление рецепта содержит теги и ингредиенты, поэтому ключ
+    # зависит и от версий этих справочников.
+    versions = ':'.join(
+        str(get_catalog_version(name)) for name in ('tags', 'ingredients'))
+    return {recipe.pk: _recipe_key(recipe, versions) for recipe in recipes}
+
+
+def get_cached_recipes(recipes):
+    """Возвращает {id: представление} для рецептов, найденных в кэше."""
+    keys = _recipe_keys(recipes)
+    cached = cache.get_many(keys.values())
+    return {pk: cached[key] for pk, key in keys.items() if key in cached}
+
+
+def set_cached_recipes(recipes, representations):
+    keys = _recipe_keys(recipes)
+    cache.set_many({
+        keys[pk]: representation
+        for pk, representation in representations.items()
+    }, RECIPE_CACHE_TIMEOUT)
+
+
+def invalidate_cached_recipes(recipes):
+    cache.delete_many(list(_recipe_keys(recipes).values()))
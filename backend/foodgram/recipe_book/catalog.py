@@ -0,0 +1,51 @@
+"""Кэш справочников (теги и ингредиенты) в сериализованном виде.
+
+Каждый справочник хранится в кэше готовым JSON, ключ включает номер
+версии. Версию повышают сигналы при изменении справочника. Версия и JSON
+лежат в кэше Django, так что другие воркеры видят изменение только при
+общем кэше (Redis). С кэшем в памяти процесса воркер отдает свою копию
+справочника, пока она не истечет через CATALOG_TIMEOUT.
+"""
+import hashlib
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponse, HttpResponseNotModified
+from recipe_book.cache import get_catalog_version
+from recipe_book.models import Ingredient, Tag
+from recipe_book.serializers import IngredientSerializers, TagSerializer
+from recipe_book.utils import etag_matches
+from rest_framework.renderers import JSONRenderer
+
+CATALOG_TIMEOUT = 60 * 60 * 24
+
+# Блоб кэшируется под текущей версией, поэтому читается из основной БД:
+# отстающая реплика сохранила бы старые данные под новой версией.
+CATALOGS = {
+    'tags': lambda: TagSerializer(
+        Tag.objects.using(DEFAULT_DB_ALIAS), many=True).data,
+    'ingredients': lambda: IngredientSerializers(
+        Ingredient.objects.using(DEFAULT_DB_ALIAS), many=True).data,
+}
+
+
+def get_catalog(name):
+    """Возвращает справочник в виде (JSON в байтах, ETag)."""
+    key = f'catalog:{name}:{get_catalog_version(name)}'
+    cached = cache.get(key)
+    if cached is None:
+        content = JSONRenderer().render(CATALOGS[name]())
+        etag = f'"{name}-{hashlib.sha1(content).hexdigest()}"'
+        cached = (content, etag)
+        cache.set(key, cached, CATALOG_TIMEOUT)
+    return cached
+
+
+def catalog_response(request, name):
+    content, etag = get_catalog(name)
+    if etag_matches(request, etag):
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    return response
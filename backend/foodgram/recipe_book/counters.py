@@ -0,0 +1,54 @@
+"""Денормализованные счетчики популярности рецептов и авторов."""
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from recipe_book.models import Favorite, Recipe, ShoppingCart, Subscription
+
+User = get_user_model()
+
+# (модель, поле счетчика): (модель строк, поле ссылки на счетчик)
+COUNTERS = {
+    (Recipe, 'favorites_count'): (Favorite, 'recipe'),
+    (Recipe, 'in_carts_count'): (ShoppingCart, 'recipe'),
+    (User, 'recipes_count'): (Recipe, 'author'),
+    (User, 'subscribers_count'): (Subscription, 'author'),
+}
+
+
+def change_counters(model, pks, field, delta):
+    """Атомарно меняет счетчик у набора объектов одним UPDATE,
+    не уходя ниже нуля."""
+    objects = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        objects = objects.filter(**{f'{field}__gte': -delta})
+    objects.update(**{field: F(field) + delta})
+
+
+def change_counter(model, pk, field, delta):
+    change_counters(model, [pk], field, delta)
+
+
+def expected_count(source, field):
+    return Coalesce(Subquery(
+        source.objects.filter(**{field: OuterRef('pk')}).order_by().values(
+            field).annotate(total=Count('pk')).values('total'),
+        output_field=IntegerField(),
+    ), Value(0))
+
+
+def reconcile_counters(check=False):
+    """Сверяет счетчики с таблицами и исправляет расхождения.
+
+    Возвращает {'модель.поле': число рассогласованных строк}.
+    """
+    drift = {}
+    for (model, field), (source, source_field) in COUNTERS.items():
+        expected = expected_count(source, source_field)
+        stale = model.objects.annotate(expected=expected).exclude(
+            **{field: F('expected')}).values_list('pk', flat=True)
+        label = f'{model._meta.model_name}.{field}'
+        drift[label] = stale.count()
+        if drift[label] and not check:
+            model.objects.filter(pk__in=list(stale)).update(
+                **{field: expected})
+    return drift
@@ -1,6 +1,7 @@
 from django.contrib.auth import get_user_model
 from django_filters import rest_framework as filters
 from recipe_book.models import Ingredient, Recipe, Tag
+from recipe_book.search import search_recipes
 
 User = get_user_model()
 
@@ -17,6 +18,11 @@ class RecipeFilter(filters.FilterSet):
     is_favorited = filters.NumberFilter(method='get_is_favorited')
     is_in_shopping_cart = filters.NumberFilter(
         method='get_is_in_shopping_cart')
+    search = filters.CharFilter(method='get_search')
+    ordering = filters.ChoiceFilter(
+        choices=(('popular', 'По популярности'),),
+        method='get_ordering',
+    )
 
     def get_is_favorited(self, queryset, name, value):
         if self.request.user.is_anonymous:
@@ -36,9 +42,18 @@ class RecipeFilter(filters.FilterSet):
             return queryset.exclude(shopping_carts__user=self.request.user)
         return queryset.none()
 
+    def get_search(self, queryset, name, value):
+        if not value.strip():
+            return queryset
+        return search_recipes(queryset, value)
+
+    def get_ordering(self, queryset, name, value):
+        return queryset.order_by('-favorites_count', '-pub_date', '-id')
+
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',)
+        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search', 'ordering',)
 
 
 class IngredientFilter(filters.FilterSet):
@@ -0,0 +1,131 @@
+"""Фоновая обработка изображений рецептов.
+
+Загруженный файл сохраняется как есть, а после коммита транзакции
+в пуле потоков у него убираются EXIF-данные, ограничивается размер
+и строятся уменьшенные копии в WebP. Очередь пула живет в памяти
+процесса: задачи, не выполненные до перезапуска воркера, теряются,
+их повторяет команда process_images.
+"""
+import io
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from foodgram.settings import (IMAGE_MAX_SIZE, IMAGE_PROCESSING_WORKERS,
+                               IMAGE_THUMBNAIL_WIDTHS)
+from PIL import Image, ImageOps
+from recipe_book.models import Recipe, directory_path
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {'.jpg': 'JPEG', '.jpeg': 'JPEG', '.png': 'PNG', '.webp': 'WEBP'}
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+executor = (ThreadPoolExecutor(max_workers=IMAGE_PROCESSING_WORKERS,
+                               thread_name_prefix='recipe-images')
+            if IMAGE_PROCESSING_WORKERS else None)
+
+
+def variant_name(name, width):
+    return f'{os.path.splitext(name)[0]}_{width}w.webp'
+
+
+def upload_name(name):
+    """Имя для сохранения новой версии файла в каталоге изображений."""
+    return directory_path(None, os.path.basename(name))
+
+
+def encode(image, image_format):
+    buffer = io.BytesIO()
+    if image_format == 'JPEG':
+        image.convert('RGB').save(
+            buffer, image_format, quality=JPEG_QUALITY, optimize=True)
+    elif image_format == 'WEBP':
+        image.save(buffer, image_format, quality=WEBP_QUALITY)
+    else:
+        image.save(buffer, image_format, optimize=True)
+    return buffer.getvalue()
+
+
+def store(name, content):
+    """Сохраняет новый файл, старый остается до сборки мусора:
+    на него могут ссылаться другие рецепты."""
+    return default_storage.save(name, ContentFile(content))
+
+
+def process_image(name):
+    """Обрабатывает оригинал и возвращает {ширина: имя копии}."""
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        image_format = FORMATS.get(
+            os.path.splitext(name)[1].lower(), image.format)
+        # exif_transpose поворачивает по EXIF, сохранение без exif=
+        # выбрасывает метаданные.
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info
+                              else 'RGB')
+    image.thumbnail((IMAGE_MAX_SIZE, IMAGE_MAX_SIZE), Image.LANCZOS)
+    name = store(upload_name(name), encode(image, image_format))
+    variants = {}
+    for width in IMAGE_THUMBNAIL_WIDTHS:
+        if width >= image.width:
+            continue
+        height = round(image.height * width / image.width)
+        variants[str(width)] = store(
+            upload_name(variant_name(name, width)),
+            encode(image.resize((width, height), Image.LANCZOS), 'WEBP'))
+    return name, variants
+
+
+def needs_processing(name, variants):
+    """Не обработан ли файл: у обработанного нет EXIF, размер
+    не больше IMAGE_MAX_SIZE и есть копии всех ширин меньше его
+    собственной. Читается только заголовок файла."""
+    with default_storage.open(name) as file:
+        image = Image.open(file)
+        if image.getexif() or max(image.size) > IMAGE_MAX_SIZE:
+            return True
+        return any(str(width) not in variants
+                   for width in IMAGE_THUMBNAIL_WIDTHS
+                   if width < image.width)
+
+
+def process_recipe_image(recipe_id, name):
+    """Обрабатывает изображение рецепта, возвращает True, если
+    результат сохранен."""
+    try:
+        new_name, variants = process_image(name)
+        # Если изображение успели заменить, результат не сохраняется.
+        return bool(Recipe.objects.filter(pk=recipe_id, image=name).update(
+            image=new_name, image_variants=variants,
+            updated_at=timezone.now()))
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+        return False
+
+
+def process_in_worker(recipe_id, name):
+    try:
+        process_recipe_image(recipe_id, name)
+    finally:
+        # У каждого потока пула свое соединение с БД.
+        connection.close()
+
+
+def schedule_image_processing(recipe):
+    """Ставит обработку изображения рецепта в очередь после коммита."""
+    if not recipe.image:
+        return
+    args = (recipe.pk, recipe.image.name)
+    if executor is None:
+        transaction.on_commit(lambda: process_recipe_image(*args))
+    else:
+        transaction.on_commit(
+            lambda: executor.submit(process_in_worker, *args))
@@ -0,0 +1,72 @@
+"""Индекс ингредиентов в памяти процесса для автодополнения."""
+import threading
+from bisect import bisect_left
+
+from django.db import DEFAULT_DB_ALIAS
+from recipe_book.cache import get_catalog_version
+from recipe_book.models import UNIT_LABELS, Ingredient
+
+
+class IngredientIndex:
+    """Отсортированный по названию в нижнем регистре список ингредиентов.
+
+    Загружается лениво при первом поиске и перезагружается при смене
+    версии справочника ингредиентов. Поиск по префиксу идет бинарным
+    поиском, совпадения по подстроке добавляются после совпадений
+    по префиксу.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data = None
+
+    def invalidate(self):
+        self._data = None
+
+    def _load(self):
+        rows = sorted(
+            (name.casefold(), pk, name, unit)
+            for pk, name, unit in Ingredient.objects.using(
+                DEFAULT_DB_ALIAS).values_list(
+                'id', 'name', 'measurement_unit')
+        )
+        keys = [row[0] for row in rows]
+        payloads = [{
+            'id': pk,
+            'name': name,
+            'measurement_unit': UNIT_LABELS.get(unit, unit),
+        } for _, pk, name, unit in rows]
+        return keys, payloads
+
+    def _get_data(self):
+        # Версия справочника хранится в кэше Django. С общим кэшем (Redis)
+        # индекс перезагружается и после изменений в других воркерах,
+        # с кэшем в памяти процесса — только после изменений в своем.
+        version = get_catalog_version('ingredients')
+        data = self._data
+        if data is None or data[0] != version:
+            with self._lock:
+                data = self._data
+                if data is None or data[0] != version:
+                    data = self._data = (version,) + self._load()
+        return data[1:]
+
+    def search(self, query, limit):
+        keys, payloads = self._get_data()
+        query = query.casefold()
+        results = []
+        position = bisect_left(keys, query)
+        while (position < len(keys) and len(results) < limit
+               and keys[position].startswith(query)):
+            results.append(payloads[position])
+            position += 1
+        if len(results) < limit:
+            for key, payload in zip(keys, payloads):
+                if query in key and not key.startswith(query):
+                    results.append(payload)
+                    if len(results) >= limit:
+                        break
+        return results
+
+
+ingredient_index = IngredientIndex()
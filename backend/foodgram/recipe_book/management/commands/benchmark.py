@@ -0,0 +1,91 @@
+import json
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from recipe_book.benchmarks import SCENARIOS
+
+
+def format_row(label, result, previous=None):
+    line = (f'  {label:<40} p50 {result["p50"]:8.3f} ms  '
+            f'p95 {result["p95"]:8.3f} ms  '
+            f'queries {result["queries"]:5.1f}')
+    # У разовых замеров (построение индекса) нет пропускной способности.
+    if 'rps' in result:
+        line += f'  rps {result["rps"]:8.1f}'
+    if 'rows' in result:
+        line += f'  rows {result["rows"]:.1f}'
+    if previous:
+        change = (result['p50'] / max(previous['p50'], 1e-9) - 1) * 100
+        line += f'  p50 {change:+.0f}%'
+    return line
+
+
+class Command(BaseCommand):
+    help = ('Замеры производительности основных сценариев. Сценарии api_* '
+            'работают через HTTP-клиент на заполненной базе (seed_data).')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'scenarios', nargs='*',
+            help=f'Сценарии ({", ".join(SCENARIOS)}), по умолчанию все',
+        )
+        parser.add_argument('--repeat', type=int, default=50)
+        parser.add_argument(
+            '--output', help='Сохранить результаты в JSON-файл')
+        parser.add_argument(
+            '--compare',
+            help='JSON-файл прошлого замера для сравнения p50',
+        )
+        parser.add_argument(
+            '--allow-writes', action='store_true',
+            help='Разрешить сценарии, которые создают и удаляют данные '
+                 'в БД без отката (toggle_concurrency)',
+        )
+
+    def select_scenarios(self, names, allow_writes):
+        """Сценарии к запуску. Меняющие данные без --allow-writes
+        пропускаются, а если названы явно — ошибка."""
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(
+                f'Неизвестные сценарии: {", ".join(sorted(unknown))}')
+        if allow_writes:
+            return names or list(SCENARIOS)
+        writes = [name for name in names
+                  if getattr(SCENARIOS[name], 'WRITES', False)]
+        if writes:
+            raise CommandError(
+                f'Сценарии {", ".join(writes)} меняют данные в БД, '
+                f'запустите их с --allow-writes')
+        if names:
+            return names
+        skipped = [name for name, scenario in SCENARIOS.items()
+                   if getattr(scenario, 'WRITES', False)]
+        self.stdout.write(self.style.WARNING(
+            f'Пропущены без --allow-writes: {", ".join(skipped)}'))
+        return [name for name in SCENARIOS if name not in skipped]
+
+    def handle(self, *args, **options):
+        names = self.select_scenarios(
+            options['scenarios'], options['allow_writes'])
+        previous = {}
+        if options['compare']:
+            with open(options['compare']) as file:
+                previous = json.load(file)['results']
+        results = {}
+        for name in names:
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            results[name] = {}
+            for label, result in SCENARIOS[name].run(options['repeat']):
+                results[name][label] = result
+                self.stdout.write(format_row(
+                    label, result, previous.get(name, {}).get(label)))
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({
+                    'date': datetime.now().isoformat(timespec='seconds'),
+                    'vendor': connection.vendor,
+                    'repeat': options['repeat'],
+                    'results': results,
+                }, file, ensure_ascii=False, indent=2)
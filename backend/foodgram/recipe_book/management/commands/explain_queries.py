@@ -0,0 +1,127 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipe_book.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                                ShoppingListItem, Subscription, Tag)
+from recipe_book.views import RecipesViewSet, SubscriptionsViewSet
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+User = get_user_model()
+
+WATCHED_TABLES = (
+    'recipe_book_recipe',
+    'recipe_book_recipe_tags',
+    'recipe_book_structure',
+    'recipe_book_favorite',
+    'recipe_book_shoppingcart',
+    'recipe_book_shoppinglistitem',
+    'recipe_book_subscription',
+    'recipe_book_ingredient',
+)
+SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+# Запросы, которые должны идти по конкретному индексу: отсутствие
+# последовательного сканирования для них ничего не доказывает, при
+# enable_seqscan = off планировщик прочтет таблицу целиком по любому
+# индексу, подходящему под ORDER BY.
+EXPECTED_INDEXES = {
+    'ingredient substring': 'ingredient_name_upper_trgm_idx',
+    'ingredient prefix': 'ingredient_name_upper_trgm_idx',
+}
+
+
+def list_queryset(viewset, user, params=None):
+    """Выборка списка в том виде, в каком ее строит вьюсет."""
+    request = APIRequestFactory().get('/', params or {})
+    force_authenticate(request, user=user)
+    view = viewset()
+    view.action_map = {'get': 'list'}
+    view.args, view.kwargs = (), {}
+    view.format_kwarg = None
+    view.request = view.initialize_request(request)
+    view.request.user = user
+    return view.filter_queryset(view.get_queryset())
+
+
+class Command(BaseCommand):
+    help = ('Проверяет планы основных запросов списков через EXPLAIN и '
+            'завершается с ошибкой, если какой-то из них читает большую '
+            'таблицу последовательным сканированием. Запускать на '
+            'заполненной базе PostgreSQL.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--allow-seqscan', action='store_true',
+            help='Не запрещать планировщику последовательное сканирование: '
+                 'проверяется выбор плана на реальных объемах данных',
+        )
+        parser.add_argument('--verbose-plans', action='store_true')
+
+    def get_queries(self):
+        user = (Favorite.objects.values_list('user', flat=True).first()
+                or User.objects.values_list('pk', flat=True).first())
+        if user is None:
+            raise CommandError('База пуста, сначала заполните ее данными')
+        user = User.objects.get(pk=user)
+        recipe = Recipe.objects.first()
+        tag = Tag.objects.first()
+        recipes = {
+            'recipes': {},
+            'recipes by tag': {'tags': tag.slug if tag else ''},
+            'recipes by author': {'author': recipe.author_id if recipe else 0},
+            'favorite recipes': {'is_favorited': 1},
+            'recipes in cart': {'is_in_shopping_cart': 1},
+        }
+        queries = {
+            name: list_queryset(RecipesViewSet, user, params)[:6]
+            for name, params in recipes.items()
+        }
+        queries.update({
+            'subscriptions': list_queryset(
+                SubscriptionsViewSet, user, {'recipes_limit': 3})[:6],
+            'favorite exists': Favorite.objects.filter(
+                user=user, recipe=recipe),
+            'cart exists': ShoppingCart.objects.filter(
+                user=user, recipe=recipe),
+            'subscribers': Subscription.objects.filter(
+                author=recipe.author if recipe else user),
+            'shopping list': ShoppingListItem.objects.filter(user=user),
+            'ingredient substring': Ingredient.objects.filter(
+                name__icontains='сах'),
+            'ingredient prefix': Ingredient.objects.filter(
+                name__istartswith='сах'),
+        })
+        return queries
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            raise CommandError('Проверка планов работает только с PostgreSQL')
+        failures = []
+        with transaction.atomic():
+            if not options['allow_seqscan']:
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            for name, queryset in self.get_queries().items():
+                plan = queryset.explain()
+                error = self.check_plan(name, plan)
+                status = (self.style.ERROR(error) if error
+                          else self.style.SUCCESS('ok'))
+                self.stdout.write(f'{name:<24} {status}')
+                if options['verbose_plans'] or error:
+                    self.stdout.write(plan)
+                if error:
+                    failures.append(name)
+        if failures:
+            raise CommandError(
+                f'Неверный план запросов: {", ".join(failures)}')
+
+    def check_plan(self, name, plan):
+        """Описание ошибки плана или None."""
+        scanned = sorted(set(SEQ_SCAN.findall(plan)) & set(WATCHED_TABLES))
+        if scanned:
+            return 'SEQ SCAN ' + ', '.join(scanned)
+        index = EXPECTED_INDEXES.get(name)
+        if index and not re.search(rf'\b(on|using) {index}\b', plan):
+            return f'NO INDEX {index}'
+        return None
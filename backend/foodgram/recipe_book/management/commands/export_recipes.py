@@ -0,0 +1,84 @@
+import base64
+import json
+import sys
+
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch, prefetch_related_objects
+from recipe_book.models import Recipe, Structure
+
+storage = Recipe._meta.get_field('image').storage
+
+
+def iter_chunks(chunk_size):
+    """Рецепты пачками по возрастанию id без OFFSET."""
+    last = 0
+    while True:
+        chunk = list(Recipe.objects.filter(pk__gt=last).select_related(
+            'author').order_by('pk')[:chunk_size])
+        if not chunk:
+            return
+        prefetch_related_objects(chunk, 'tags', Prefetch(
+            'structure',
+            queryset=Structure.objects.select_related(
+                'ingredients').order_by('pk'),
+            to_attr='prefetched_structure',
+        ))
+        yield chunk
+        last = chunk[-1].pk
+
+
+class Command(BaseCommand):
+    help = ('Выгружает рецепты в JSONL: одна строка на рецепт вместе с '
+            'тегами, составом, автором и изображением.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл или - для stdout')
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--inline-images', action='store_true',
+            help='Встраивать содержимое изображений в base64',
+        )
+
+    def serialize(self, recipe, inline_images):
+        data = {
+            'name': recipe.name,
+            'text': recipe.text,
+            'cooking_time': recipe.cooking_time,
+            'pub_date': recipe.pub_date.isoformat(),
+            'author': recipe.author.email,
+            'tags': [tag.slug for tag in recipe.tags.all()],
+            'ingredients': [{
+                'name': row.ingredients.name,
+                'measurement_unit': row.ingredients.measurement_unit,
+                'amount': row.amount,
+            } for row in recipe.prefetched_structure],
+            'image': recipe.image.name or None,
+        }
+        if inline_images and recipe.image:
+            if storage.exists(recipe.image.name):
+                with storage.open(recipe.image.name) as file:
+                    data['image_data'] = base64.b64encode(
+                        file.read()).decode()
+            else:
+                self.stderr.write(f'Файл не найден: {recipe.image.name}')
+        elif recipe.image_variants:
+            data['image_variants'] = recipe.image_variants
+        return data
+
+    def handle(self, *args, **options):
+        path = options['path']
+        output = (sys.stdout if path == '-'
+                  else open(path, 'w', encoding='utf-8'))
+        exported = 0
+        try:
+            for chunk in iter_chunks(options['chunk_size']):
+                for recipe in chunk:
+                    output.write(json.dumps(
+                        self.serialize(recipe, options['inline_images']),
+                        ensure_ascii=False) + '\n')
+                exported += len(chunk)
+        finally:
+            if output is not sys.stdout:
+                output.close()
+        self.stderr.write(self.style.SUCCESS(
+            f'Выгружено рецептов: {exported}'))
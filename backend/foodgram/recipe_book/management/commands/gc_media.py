@@ -0,0 +1,71 @@
+import os
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from recipe_book.models import Recipe
+
+storage = Recipe._meta.get_field('image').storage
+
+
+def walk(path):
+    """Имена всех файлов хранилища внутри каталога path."""
+    try:
+        directories, files = storage.listdir(path)
+    except FileNotFoundError:
+        return
+    for name in files:
+        yield os.path.join(path, name)
+    for directory in directories:
+        yield from walk(os.path.join(path, directory))
+
+
+def referenced_files():
+    """Файлы, на которые ссылаются рецепты: изображения и их копии.
+
+    Ссылки собираются заново при каждом запуске, а не хранятся
+    счетчиками, поэтому не расходятся с данными рецептов.
+    """
+    referenced = set()
+    for image, variants in Recipe.objects.values_list(
+            'image', 'image_variants').order_by().iterator():
+        if image:
+            referenced.add(image)
+        referenced.update(variants.values())
+    return referenced
+
+
+class Command(BaseCommand):
+    help = ('Удаляет файлы изображений, на которые не ссылается ни один '
+            'рецепт. Недавние файлы не трогаются: они могут принадлежать '
+            'еще не сохраненным рецептам.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--prefix', nargs='+', default=['recipes', 'reciepts'],
+            help='Каталоги хранилища с изображениями рецептов',
+        )
+        parser.add_argument(
+            '--grace-hours', type=int, default=24,
+            help='Не удалять файлы моложе указанного числа часов',
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        threshold = timezone.now() - timedelta(hours=options['grace_hours'])
+        referenced = referenced_files()
+        removed = size = 0
+        for prefix in options['prefix']:
+            for name in walk(prefix):
+                if (name in referenced
+                        or storage.get_modified_time(name) > threshold):
+                    continue
+                removed += 1
+                size += storage.size(name)
+                if options['verbosity'] > 1:
+                    self.stdout.write(name)
+                if not options['dry_run']:
+                    storage.delete(name)
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {removed}, {size / 1024 / 1024:.1f} МБ'))
@@ -0,0 +1,133 @@
+import csv
+import json
+import os
+import re
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from recipe_book.cache import bump_catalog_version
+from recipe_book.ingredient_index import ingredient_index
+from recipe_book.models import UNIT_KEYS, Ingredient
+
+CHUNK_SIZE = 64 * 1024
+SEPARATORS = re.compile(r'[\s,]*')
+
+
+def iter_json_array(file):
+    """Объекты JSON-массива из файла, читаемого кусками."""
+    decoder = json.JSONDecoder()
+    buffer = file.read(CHUNK_SIZE)
+    position = SEPARATORS.match(buffer).end()
+    if not buffer.startswith('[', position):
+        raise CommandError('Ожидается JSON-массив')
+    position += 1
+    index = 0
+    while True:
+        position = SEPARATORS.match(buffer, position).end()
+        if buffer.startswith(']', position):
+            return
+        try:
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            chunk = file.read(CHUNK_SIZE)
+            if not chunk:
+                raise CommandError('Некорректный JSON')
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+        if not isinstance(item, dict):
+            raise CommandError(
+                f'Элемент {index} массива должен быть объектом JSON')
+        index += 1
+        yield item
+
+
+def iter_csv(file):
+    yield from csv.DictReader(file)
+
+
+READERS = {'json': iter_json_array, 'csv': iter_csv}
+
+
+class Command(BaseCommand):
+    help = ('Загружает справочник ингредиентов из JSON или CSV с полями '
+            'name и measurement_unit. Единицы измерения приводятся к ключам '
+            'UNITS, существующие ингредиенты обновляются по названию.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файла, по умолчанию по расширению',
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        file_format = (options['format']
+                       or os.path.splitext(path)[1].lstrip('.').lower())
+        if file_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат, укажите --format '
+                f'({", ".join(READERS)})')
+        self.verbosity = options['verbosity']
+        self.max_length = Ingredient._meta.get_field('name').max_length
+        self.processed = self.changed = self.skipped = 0
+        start = time.perf_counter()
+        batch = {}
+        with open(path, encoding='utf-8', newline='') as file:
+            for row in READERS[file_format](file):
+                self.processed += 1
+                ingredient = self.normalize(row)
+                if ingredient is None:
+                    self.skipped += 1
+                    continue
+                # Повтор названия в одной пачке ON CONFLICT не допускает.
+                batch[ingredient[0]] = ingredient[1]
+                if len(batch) >= options['batch_size']:
+                    self.upsert(batch)
+                    batch = {}
+                    self.report_progress(start)
+        if batch:
+            self.upsert(batch)
+        if self.changed:
+            bump_catalog_version('ingredients')
+            ingredient_index.invalidate()
+        elapsed = time.perf_counter() - start
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано {self.processed} строк за {elapsed:.2f} с '
+            f'({self.processed / max(elapsed, 1e-6):.0f} строк/с): '
+            f'изменено {self.changed}, пропущено {self.skipped}'))
+
+    def normalize(self, row):
+        name = str(row.get('name') or '').strip()
+        unit = UNIT_KEYS.get(str(row.get('measurement_unit') or '').strip())
+        if not name or len(name) > self.max_length or unit is None:
+            if self.verbosity > 1:
+                self.stderr.write(f'Пропущена строка: {row}')
+            return None
+        return name, unit
+
+    def upsert(self, batch):
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        values = ', '.join(['(%s, %s)'] * len(batch))
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                f'VALUES {values} '
+                f'ON CONFLICT (name) DO UPDATE '
+                f'SET measurement_unit = EXCLUDED.measurement_unit '
+                f'WHERE {table}.measurement_unit '
+                f'<> EXCLUDED.measurement_unit',
+                [value for item in batch.items() for value in item]
+            )
+            self.changed += max(cursor.rowcount, 0)
+
+    def report_progress(self, start):
+        if self.verbosity < 1:
+            return
+        elapsed = time.perf_counter() - start
+        self.stdout.write(
+            f'  {self.processed} строк, '
+            f'{self.processed / max(elapsed, 1e-6):.0f} строк/с')
@@ -0,0 +1,203 @@
+import base64
+import json
+import os
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.dateparse import parse_datetime
+from recipe_book.cache import bump_catalog_version
+from recipe_book.counters import change_counter
+from recipe_book.images import schedule_image_processing
+from recipe_book.ingredient_index import ingredient_index
+from recipe_book.models import (UNIT_KEYS, Ingredient, Recipe, Structure, Tag,
+                                directory_path)
+from recipe_book.pantry import pantry_index
+from recipe_book.search import update_search_vectors
+
+User = get_user_model()
+storage = Recipe._meta.get_field('image').storage
+
+
+class Command(BaseCommand):
+    help = ('Загружает рецепты из JSONL, выгруженного export_recipes. '
+            'Рецепты с уже существующими названиями пропускаются, после '
+            'каждой пачки сохраняется позиция в файле для продолжения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--checkpoint',
+            help='Файл с позицией продолжения, по умолчанию <path>.checkpoint',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать с начала файла, не читая сохраненную позицию',
+        )
+
+    def handle(self, *args, **options):
+        path = options['path']
+        self.verbosity = options['verbosity']
+        self.checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        state = {'offset': 0, 'stats': Counter()}
+        if not options['restart'] and os.path.exists(self.checkpoint):
+            with open(self.checkpoint) as file:
+                saved = json.load(file)
+            state = {'offset': saved['offset'],
+                     'stats': Counter(saved['stats'])}
+            self.stdout.write(f'Продолжение с позиции {state["offset"]}')
+        self.stats = state['stats']
+        self.tags = dict(Tag.objects.values_list('slug', 'pk'))
+        self.ingredients = dict(Ingredient.objects.values_list('name', 'pk'))
+        offset = state['offset']
+        batch = []
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            for line in file:
+                offset += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    batch.append(json.loads(line))
+                except ValueError:
+                    raise CommandError(
+                        f'Некорректная строка JSON до позиции {offset}')
+                if len(batch) >= options['batch_size']:
+                    self.import_batch(batch, offset)
+                    batch = []
+        if batch:
+            self.import_batch(batch, offset)
+        if self.stats['imported']:
+            pantry_index.reset()
+        if os.path.exists(self.checkpoint):
+            os.remove(self.checkpoint)
+        self.stdout.write(self.style.SUCCESS(', '.join(
+            f'{key}: {value}' for key, value in sorted(self.stats.items()))))
+
+    def import_batch(self, records, offset):
+        with transaction.atomic():
+            self.create_recipes(records)
+        self.save_checkpoint(offset)
+        if self.verbosity > 0:
+            self.stdout.write(f'  {offset} байт, загружено '
+                              f'{self.stats["imported"]}')
+
+    def save_checkpoint(self, offset):
+        temporary = f'{self.checkpoint}.tmp'
+        with open(temporary, 'w') as file:
+            json.dump({'offset': offset, 'stats': self.stats}, file)
+        os.replace(temporary, self.checkpoint)
+
+    def create_missing_ingredients(self, records):
+        missing = {}
+        for record in records:
+            for item in record['ingredients']:
+                if item['name'] not in self.ingredients:
+                    missing[item['name']] = UNIT_KEYS.get(
+                        item.get('measurement_unit'), 'g')
+        if not missing:
+            return
+        Ingredient.objects.bulk_create([
+            Ingredient(name=name, measurement_unit=unit)
+            for name, unit in missing.items()
+        ], ignore_conflicts=True)
+        self.ingredients.update(Ingredient.objects.filter(
+            name__in=missing).values_list('name', 'pk'))
+        self.stats['ingredients created'] += len(missing)
+        # bulk_create не отправляет post_save, справочник в кэше
+        # и индекс названий сбрасываются явно.
+        transaction.on_commit(self.ingredients_changed)
+
+    def ingredients_changed(self):
+        bump_catalog_version('ingredients')
+        ingredient_index.invalidate()
+
+    def store_image(self, record):
+        if not record.get('image_data'):
+            return record.get('image') or None
+        name = os.path.basename(record.get('image') or 'image.jpg')
+        return storage.save(
+            directory_path(None, name),
+            ContentFile(base64.b64decode(record['image_data'])))
+
+    def prepare(self, records):
+        """Рецепты для вставки и их теги и состав."""
+        existing = set(Recipe.objects.filter(
+            name__in=[record['name'] for record in records]
+        ).values_list('name', flat=True))
+        authors = dict(User.objects.filter(
+            email__in={record['author'] for record in records}
+        ).values_list('email', 'pk'))
+        prepared = []
+        for record in records:
+            if record['name'] in existing:
+                self.stats['skipped existing'] += 1
+                continue
+            if record['author'] not in authors:
+                self.stats['skipped unknown author'] += 1
+                continue
+            existing.add(record['name'])
+            amounts = Counter()
+            for item in record['ingredients']:
+                amounts[self.ingredients[item['name']]] += item['amount']
+            recipe = Recipe(
+                author_id=authors[record['author']],
+                name=record['name'],
+                text=record.get('text'),
+                cooking_time=record['cooking_time'],
+                image=self.store_image(record),
+                image_variants=record.get('image_variants') or {},
+            )
+            if record.get('image_data') and not recipe.image_variants:
+                self.unprocessed.append(recipe)
+            tags = [self.tags[slug] for slug in record['tags']
+                    if slug in self.tags]
+            self.stats['unknown tags'] += len(record['tags']) - len(tags)
+            prepared.append((recipe, record.get('pub_date'), tags, amounts))
+        return prepared
+
+    def create_recipes(self, records):
+        self.unprocessed = []
+        self.create_missing_ingredients(records)
+        prepared = self.prepare(records)
+        if not prepared:
+            return
+        recipes = [recipe for recipe, _, _, _ in prepared]
+        Recipe.objects.bulk_create(recipes)
+        if recipes[0].pk is None:
+            # Не все СУБД возвращают id из пакетной вставки.
+            ids = dict(Recipe.objects.filter(
+                name__in=[recipe.name for recipe in recipes]
+            ).values_list('name', 'pk'))
+            for recipe in recipes:
+                recipe.pk = ids[recipe.name]
+        dated = []
+        for recipe, pub_date, _, _ in prepared:
+            if pub_date:
+                recipe.pub_date = parse_datetime(pub_date)
+                dated.append(recipe)
+        Recipe.objects.bulk_update(dated, ['pub_date'])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+            for recipe, _, tags, _ in prepared for tag_id in tags
+        ])
+        Structure.objects.bulk_create([
+            Structure(recipe_id=recipe.pk, ingredients_id=ingredient_id,
+                      amount=amount)
+            for recipe, _, _, amounts in prepared
+            for ingredient_id, amount in amounts.items()
+        ])
+        for author_id, count in Counter(
+                recipe.author_id for recipe in recipes).items():
+            change_counter(User, author_id, 'recipes_count', count)
+        update_search_vectors(
+            Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes]))
+        # Изображения без уменьшенных копий обрабатываются так же, как
+        # при создании рецепта через API, после коммита пачки.
+        for recipe in self.unprocessed:
+            schedule_image_processing(recipe)
+        self.stats['images scheduled'] += len(self.unprocessed)
+        self.stats['imported'] += len(recipes)
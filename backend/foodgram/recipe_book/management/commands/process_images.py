@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from recipe_book.images import needs_processing, process_recipe_image
+from recipe_book.models import Recipe
+
+
+class Command(BaseCommand):
+    help = ('Обрабатывает изображения рецептов, обработка которых '
+            'потерялась, например, при перезапуске воркера: убирает '
+            'EXIF, ограничивает размер и строит уменьшенные копии. '
+            'Старые файлы остаются до запуска gc_media.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Проверять все рецепты, а не только рецепты без копий',
+        )
+        parser.add_argument('--dry-run', action='store_true')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True).only('pk', 'image', 'image_variants')
+        if not options['all']:
+            recipes = recipes.filter(image_variants={})
+        found = processed = 0
+        for recipe in recipes.order_by('pk').iterator():
+            name = recipe.image.name
+            try:
+                pending = needs_processing(name, recipe.image_variants)
+            except (OSError, SyntaxError) as error:
+                self.stderr.write(f'Не удалось открыть {name}: {error}')
+                continue
+            if not pending:
+                continue
+            found += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(name)
+            if (not options['dry_run']
+                    and process_recipe_image(recipe.pk, name)):
+                processed += 1
+        if options['dry_run']:
+            message = f'Будет обработано изображений рецептов: {found}'
+        else:
+            message = (f'Обработано изображений рецептов: {processed} '
+                       f'из {found}')
+        self.stdout.write(self.style.SUCCESS(message))
@@ -0,0 +1,51 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipe_book.models import ShoppingListItem
+from recipe_book.shopping_list import (aggregate_shopping_lists,
+                                       rebuild_shopping_lists)
+
+
+class Command(BaseCommand):
+    help = ('Пересобирает сводные списки покупок из корзин '
+            'или проверяет их расхождение с корзинами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user', type=int, nargs='+', dest='user_ids',
+            help='id пользователей, по умолчанию все',
+        )
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только сравнить с живой агрегацией, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options['user_ids']
+        if options['check']:
+            self.check_drift(user_ids)
+            return
+        rebuild_shopping_lists(user_ids)
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны'))
+
+    def check_drift(self, user_ids):
+        items = ShoppingListItem.objects.filter(total_amount__gt=0)
+        if user_ids is not None:
+            items = items.filter(user_id__in=user_ids)
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in items.values_list(
+                'user_id', 'ingredient_id', 'total_amount').order_by()
+        }
+        expected = aggregate_shopping_lists(user_ids)
+        drift = sorted(
+            key for key in set(stored) | set(expected)
+            if stored.get(key) != expected.get(key)
+        )
+        for user_id, ingredient_id in drift:
+            self.stdout.write(
+                f'user={user_id} ingredient={ingredient_id}: '
+                f'сохранено {stored.get((user_id, ingredient_id), 0)}, '
+                f'ожидается {expected.get((user_id, ingredient_id), 0)}'
+            )
+        if drift:
+            raise CommandError(f'Расхождений: {len(drift)}')
+        self.stdout.write(self.style.SUCCESS('Расхождений нет'))
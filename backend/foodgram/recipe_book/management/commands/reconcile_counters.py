@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from recipe_book.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = ('Сверяет счетчики избранного, корзин, рецептов и подписчиков '
+            'с таблицами и исправляет расхождения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Только показать расхождения, ничего не меняя',
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            drift = reconcile_counters(check=options['check'])
+        for label, count in drift.items():
+            self.stdout.write(f'{label}: {count}')
+        total = sum(drift.values())
+        if options['check'] and total:
+            raise CommandError(f'Расхождений: {total}')
+        self.stdout.write(self.style.SUCCESS(
+            'Расхождений нет' if not total else 'Счетчики исправлены'))
@@ -0,0 +1,50 @@
+import os
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from recipe_book.models import Recipe, directory_path
+
+storage = Recipe._meta.get_field('image').storage
+
+
+class Command(BaseCommand):
+    help = ('Переносит изображения рецептов и их копии в хранилище по хэшу '
+            'содержимого. Старые файлы остаются до запуска gc_media.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true')
+
+    def rehash(self, name, dry_run):
+        if not storage.exists(name):
+            self.stderr.write(f'Файл не найден: {name}')
+            return name
+        target = directory_path(None, os.path.basename(name))
+        with storage.open(name) as file:
+            if dry_run:
+                return storage.get_content_name(target, file)
+            return storage.save(target, file)
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        moved = 0
+        recipes = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True).only('pk', 'image', 'image_variants')
+        for recipe in recipes.order_by('pk').iterator():
+            image = self.rehash(recipe.image.name, dry_run)
+            variants = {
+                width: self.rehash(name, dry_run)
+                for width, name in recipe.image_variants.items()
+            }
+            if (image == recipe.image.name
+                    and variants == recipe.image_variants):
+                continue
+            moved += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(f'{recipe.image.name} -> {image}')
+            if not dry_run:
+                Recipe.objects.filter(pk=recipe.pk).update(
+                    image=image, image_variants=variants,
+                    updated_at=timezone.now())
+        action = 'Будет перенесено' if dry_run else 'Перенесено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} изображений рецептов: {moved}'))
@@ -0,0 +1,273 @@
+import io
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate, islice
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from PIL import Image
+from recipe_book.counters import reconcile_counters
+from recipe_book.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                                Structure, Subscription, Tag, directory_path)
+from recipe_book.pantry import pantry_index
+from recipe_book.search import update_search_vectors
+from recipe_book.shopping_list import rebuild_shopping_lists
+
+User = get_user_model()
+storage = Recipe._meta.get_field('image').storage
+
+DEFAULT_TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+FIRST_NAMES = ('Анна', 'Иван', 'Мария', 'Петр', 'Ольга', 'Сергей', 'Елена',
+               'Дмитрий', 'Наталья', 'Алексей')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев',
+              'Соколов', 'Михайлов', 'Новиков', 'Федоров', 'Морозов')
+DISHES = ('суп', 'салат', 'пирог', 'рагу', 'каша', 'омлет', 'паста',
+          'запеканка', 'плов', 'блины', 'котлеты', 'соус')
+ADJECTIVES = ('домашний', 'быстрый', 'летний', 'острый', 'сытный',
+              'легкий', 'праздничный', 'постный', 'деревенский')
+AMOUNTS = (1, 2, 3, 5, 10, 50, 100, 150, 200, 250, 300, 500)
+COOKING_TIMES = (5, 10, 15, 20, 30, 40, 45, 60, 90, 120, 180)
+PUBLICATION_DAYS = 730
+# Пользователи на пачку при пересборке списков покупок: ограничение
+# на число параметров запроса в SQLite.
+SHOPPING_LIST_CHUNK = 500
+
+
+def zipf_weights(count):
+    """Накопленные веса 1/ранг: несколько популярных элементов
+    и длинный хвост."""
+    return list(accumulate(1 / rank for rank in range(1, count + 1)))
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = ('Заполняет базу синтетическими пользователями, рецептами, '
+            'избранным, корзинами и подписками для нагрузочных замеров. '
+            'С тем же --seed на той же базе получаются те же данные.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число рецептов в избранном у пользователя',
+        )
+        parser.add_argument(
+            '--carts', type=int, default=3,
+            help='Среднее число рецептов в корзине у пользователя',
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=5,
+            help='Среднее число подписок у пользователя',
+        )
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument(
+            '--prefix', default='seed',
+            help='Префикс имен пользователей и рецептов',
+        )
+        parser.add_argument(
+            '--clear', action='store_true',
+            help='Удалить данные, ранее созданные с этим префиксом',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.prefix = f'{options["prefix"]}-'
+        self.batch_size = options['batch_size']
+        self.rng = random.Random(options['seed'])
+        self.ingredients = list(Ingredient.objects.order_by(
+            'pk').values_list('pk', flat=True))
+        if not self.ingredients:
+            raise CommandError('Справочник ингредиентов пуст, сначала '
+                               'выполните import_ingredients')
+        seeded = User.objects.filter(username__startswith=self.prefix)
+        if seeded.exists():
+            if not options['clear']:
+                raise CommandError(
+                    f'Данные с префиксом {options["prefix"]} уже есть, '
+                    f'используйте --clear или другой --prefix')
+            self.clear(seeded)
+        self.tags = self.get_tags()
+        with transaction.atomic():
+            users = self.create_users(options['users'])
+            recipes = self.create_recipes(options['recipes'], users)
+            self.create_links(users, recipes)
+        self.finish(users)
+
+    def report(self, label, count, start):
+        elapsed = time.perf_counter() - start
+        self.stdout.write(f'  {label:<16} {count:>10}  {elapsed:7.1f} s  '
+                          f'{count / max(elapsed, 1e-9):10.0f} строк/с')
+
+    def insert(self, model, rows, label):
+        start = time.perf_counter()
+        count = 0
+        for batch in batched(rows, self.batch_size):
+            model.objects.bulk_create(batch)
+            count += len(batch)
+        self.report(label, count, start)
+
+    def clear(self, seeded):
+        start = time.perf_counter()
+        count, _ = seeded.delete()
+        rebuild_shopping_lists()
+        reconcile_counters()
+        pantry_index.reset()
+        self.report('удалено', count, start)
+
+    def get_tags(self):
+        if not Tag.objects.exists():
+            Tag.objects.bulk_create([
+                Tag(name=name, color=color, slug=slug)
+                for name, color, slug in DEFAULT_TAGS
+            ])
+        return list(Tag.objects.order_by('pk').values_list('pk', flat=True))
+
+    def create_users(self, count):
+        # Хэш пароля общий: PBKDF2 для каждого пользователя занял бы
+        # большую часть времени заполнения.
+        password = make_password(self.options['prefix'])
+        rng = self.rng
+        self.insert(User, (User(
+            username=f'{self.prefix}user{number}',
+            email=f'{self.prefix}user{number}@example.com',
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES),
+            password=password,
+        ) for number in range(count)), 'пользователи')
+        return list(User.objects.filter(
+            username__startswith=self.prefix).order_by('pk').values_list(
+                'pk', flat=True))
+
+    def placeholder_image(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (640, 480), (230, 200, 160)).save(buffer, 'JPEG')
+        return storage.save(directory_path(None, 'seed.jpg'),
+                            ContentFile(buffer.getvalue()))
+
+    def new_recipe(self, number, author_id, image):
+        rng = self.rng
+        dish = f'{rng.choice(ADJECTIVES)} {rng.choice(DISHES)}'
+        return Recipe(
+            author_id=author_id,
+            name=f'{dish.capitalize()} {self.prefix}{number}',
+            text=f'{dish.capitalize()} за '
+                 f'{rng.choice(COOKING_TIMES)} минут.',
+            cooking_time=rng.choice(COOKING_TIMES),
+            image=image,
+        )
+
+    def create_recipes(self, count, users):
+        """Рецепты с авторами, тегами и составом по распределениям
+        с длинным хвостом. Возвращает id рецептов."""
+        start = time.perf_counter()
+        rng = self.rng
+        authors = rng.sample(users, len(users))
+        author_weights = zipf_weights(len(authors))
+        self.authors = (authors, author_weights)
+        rng.shuffle(self.ingredients)
+        self.ingredient_weights = zipf_weights(len(self.ingredients))
+        self.tag_weights = zipf_weights(len(self.tags))
+        image = self.placeholder_image()
+        ids = []
+        for numbers in batched(range(count), self.batch_size):
+            recipes = [
+                self.new_recipe(number, rng.choices(
+                    authors, cum_weights=author_weights)[0], image)
+                for number in numbers
+            ]
+            Recipe.objects.bulk_create(recipes)
+            if recipes[0].pk is None:
+                # Не все СУБД возвращают id из пакетной вставки.
+                names = dict(Recipe.objects.filter(
+                    name__in=[recipe.name for recipe in recipes]
+                ).values_list('name', 'pk'))
+                for recipe in recipes:
+                    recipe.pk = names[recipe.name]
+            self.fill_recipes(recipes)
+            ids.extend(recipe.pk for recipe in recipes)
+        self.report('рецепты', len(ids), start)
+        return ids
+
+    def fill_recipes(self, recipes):
+        """Дата публикации, теги и состав пачки рецептов."""
+        rng = self.rng
+        now = timezone.now()
+        for recipe in recipes:
+            recipe.pub_date = now - timedelta(
+                minutes=rng.randrange(PUBLICATION_DAYS * 24 * 60))
+        Recipe.objects.bulk_update(recipes, ['pub_date'], batch_size=1000)
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+            for recipe in recipes
+            for tag_id in set(rng.choices(
+                self.tags, cum_weights=self.tag_weights,
+                k=rng.choice((1, 1, 2, 2, 3))))
+        ])
+        Structure.objects.bulk_create([
+            Structure(recipe_id=recipe.pk, ingredients_id=ingredient_id,
+                      amount=rng.choice(AMOUNTS))
+            for recipe in recipes
+            for ingredient_id in set(rng.choices(
+                self.ingredients, cum_weights=self.ingredient_weights,
+                k=rng.randint(4, 12)))
+        ])
+        update_search_vectors(
+            Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes]))
+
+    def pick(self, population, cum_weights, average, exclude=None):
+        """Случайный набор элементов для одного пользователя."""
+        rng = self.rng
+        picked = set(rng.choices(
+            population, cum_weights=cum_weights,
+            k=rng.randint(0, 2 * average)))
+        picked.discard(exclude)
+        return picked
+
+    def create_links(self, users, recipes):
+        rng = self.rng
+        popular = rng.sample(recipes, len(recipes))
+        recipe_weights = zipf_weights(len(popular))
+        options = self.options
+        for model, label, average in (
+                (Favorite, 'избранное', options['favorites']),
+                (ShoppingCart, 'корзины', options['carts'])):
+            self.insert(model, (
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in users
+                for recipe_id in self.pick(popular, recipe_weights, average)
+            ), label)
+        authors, author_weights = self.authors
+        self.insert(Subscription, (
+            Subscription(user_id=user_id, author_id=author_id)
+            for user_id in users
+            for author_id in self.pick(
+                authors, author_weights, options['subscriptions'], user_id)
+        ), 'подписки')
+
+    def finish(self, users):
+        start = time.perf_counter()
+        for chunk in batched(users, SHOPPING_LIST_CHUNK):
+            rebuild_shopping_lists(chunk)
+        reconcile_counters()
+        pantry_index.reset()
+        self.report('списки, счетчики', len(users), start)
+        self.stdout.write(self.style.SUCCESS('Данные созданы'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from recipe_book.models import Recipe
+from recipe_book.search import is_supported, update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает поисковые векторы рецептов пачками по id.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if not is_supported():
+            raise CommandError('Полнотекстовый поиск работает только '
+                               'с PostgreSQL')
+        ids = Recipe.objects.order_by('pk').values_list('pk', flat=True)
+        batch_size = options['batch_size']
+        updated = 0
+        last = 0
+        while True:
+            batch = list(ids.filter(pk__gt=last)[:batch_size])
+            if not batch:
+                break
+            last = batch[-1]
+            updated += update_search_vectors(
+                Recipe.objects.filter(pk__gte=batch[0], pk__lte=last))
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено рецептов: {updated}'))
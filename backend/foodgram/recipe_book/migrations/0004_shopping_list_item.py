@@ -0,0 +1,51 @@
+# Generated by Django 3.2.13 on 2026-10-18 16:47
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    ShoppingCart = apps.get_model('recipe_book', 'ShoppingCart')
+    ShoppingListItem = apps.get_model('recipe_book', 'ShoppingListItem')
+    Structure = apps.get_model('recipe_book', 'Structure')
+    quote = schema_editor.connection.ops.quote_name
+    schema_editor.execute(
+        f'INSERT INTO {quote(ShoppingListItem._meta.db_table)} '
+        f'(user_id, ingredient_id, total_amount) '
+        f'SELECT cart.user_id, structure.ingredients_id, SUM(structure.amount) '
+        f'FROM {quote(ShoppingCart._meta.db_table)} cart '
+        f'INNER JOIN {quote(Structure._meta.db_table)} structure '
+        f'ON structure.recipe_id = cart.recipe_id '
+        f'GROUP BY cart.user_id, structure.ingredients_id'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('recipe_book', '0003_add_ingridients'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('total_amount', models.IntegerField(verbose_name='Количество')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='recipe_book.ingredient', verbose_name='Ингридиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Позиции списка покупок',
+                'ordering': ('user',),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_item'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 3.2.13 on 2026-10-18 17:32
+
+from datetime import timedelta
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+def backfill_pub_date(apps, schema_editor):
+    """Существующие рецепты получили бы одну дату — время миграции.
+    Восстанавливаем порядок публикации по id: по секунде на рецепт
+    назад от этой даты."""
+    Recipe = apps.get_model('recipe_book', 'Recipe')
+    recipes = list(Recipe.objects.only('pk', 'pub_date').order_by('-pk'))
+    for position, recipe in enumerate(recipes):
+        recipe.pub_date -= timedelta(seconds=position)
+    Recipe.objects.bulk_update(recipes, ['pub_date'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe_book', '0005_recipe_updated_at'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='recipe',
+            options={'ordering': ('-pub_date', '-id'), 'verbose_name': 'Рецепт', 'verbose_name_plural': 'Рецепты'},
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='pub_date',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, verbose_name='Дата публикации'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_pub_date, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 3.2.13 on 2026-10-18 17:01
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        "UPDATE recipe_book_recipe r SET search_vector = "
+        "setweight(to_tsvector('russian', coalesce(r.name, '')), 'A') || "
+        "setweight(to_tsvector('russian', coalesce(("
+        "SELECT string_agg(i.name, ' ') FROM recipe_book_structure s "
+        "JOIN recipe_book_ingredient i ON i.id = s.ingredients_id "
+        "WHERE s.recipe_id = r.id), '')), 'B') || "
+        "setweight(to_tsvector('russian', coalesce(r.text, '')), 'C')"
+    )
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS recipe_search_vector_idx '
+        'ON recipe_book_recipe USING gin (search_vector)'
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS recipe_search_vector_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe_book', '0008_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
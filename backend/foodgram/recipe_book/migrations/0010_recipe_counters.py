@@ -0,0 +1,51 @@
+# Generated by Django 3.2.13 on 2026-10-18 17:11
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipe_book', 'Recipe', 'favorites_count', 'Favorite', 'recipe'),
+    ('recipe_book', 'Recipe', 'in_carts_count', 'ShoppingCart', 'recipe'),
+    ('users', 'User', 'recipes_count', 'Recipe', 'author'),
+    ('users', 'User', 'subscribers_count', 'Subscription', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app_label, model_name, field, source_name, source_field in COUNTERS:
+        source = apps.get_model('recipe_book', source_name)
+        apps.get_model(app_label, model_name).objects.update(**{
+            field: Coalesce(Subquery(
+                source.objects.filter(**{source_field: OuterRef('pk')})
+                .order_by().values(source_field)
+                .annotate(total=Count('pk')).values('total'),
+                output_field=IntegerField(),
+            ), Value(0)),
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe_book', '0009_recipe_search_vector'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В избранном'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='В корзинах'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-favorites_count', '-pub_date', '-id'], name='recipe_popular_idx'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
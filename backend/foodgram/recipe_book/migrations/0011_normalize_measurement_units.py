@@ -0,0 +1,60 @@
+from django.db import migrations
+
+# Единицы на момент миграции: UNITS из models может измениться позже.
+UNITS = (
+    ('g', 'г'),
+    ('glass', 'стакан'),
+    ('as_your_taste', 'по вкусу'),
+    ('big_spoon', 'ст. л.'),
+    ('pc', 'шт.'),
+    ('ml', 'мл'),
+    ('little_cpoon', 'ч. л.'),
+    ('drop', 'капля'),
+    ('asterisk', 'звездочка'),
+    ('pinch', 'щепотка'),
+    ('handful', 'горсть'),
+    ('piece', 'кусок'),
+    ('kg', 'кг'),
+    ('package', 'пакет'),
+    ('bundle', 'пучок'),
+    ('slice', 'долька'),
+    ('pot', 'банка'),
+    ('packing', 'упаковка'),
+    ('tooth', 'зубчик'),
+    ('layer', 'пласт'),
+    ('pack', 'пачка'),
+    ('carcass', 'тушка'),
+    ('pod', 'стручок'),
+    ('twig', 'веточка'),
+    ('bottle', 'бутылка'),
+    ('l', 'л'),
+    ('loaf', 'батон'),
+    ('bag', 'пакетик'),
+    ('leaf', 'лист'),
+    ('stem', 'стебель'),
+)
+
+
+def labels_to_keys(apps, schema_editor):
+    Ingredient = apps.get_model('recipe_book', 'Ingredient')
+    for key, label in UNITS:
+        Ingredient.objects.filter(measurement_unit=label).update(
+            measurement_unit=key)
+
+
+def keys_to_labels(apps, schema_editor):
+    Ingredient = apps.get_model('recipe_book', 'Ingredient')
+    for key, label in UNITS:
+        Ingredient.objects.filter(measurement_unit=key).update(
+            measurement_unit=label)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe_book', '0010_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(labels_to_keys, keys_to_labels),
+    ]
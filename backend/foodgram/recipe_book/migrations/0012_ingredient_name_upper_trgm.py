@@ -0,0 +1,41 @@
+from django.db import migrations
+
+
+def create_upper_trigram_index(apps, schema_editor):
+    """Поиск подстроки в названии (icontains, istartswith) Django
+    строит как UPPER("name"::text) LIKE UPPER(%s), поэтому индекс
+    на самом name не используется — нужен индекс по тому же выражению."""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute('DROP INDEX IF EXISTS ingredient_name_trgm_idx')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS ingredient_name_upper_trgm_idx '
+        'ON recipe_book_ingredient '
+        'USING gin ((UPPER(name::text)) gin_trgm_ops)'
+    )
+
+
+def drop_upper_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(
+        'DROP INDEX IF EXISTS ingredient_name_upper_trgm_idx')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS ingredient_name_trgm_idx '
+        'ON recipe_book_ingredient USING gin (name gin_trgm_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipe_book', '0011_normalize_measurement_units'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            create_upper_trigram_index,
+            drop_upper_trigram_index,
+        ),
+    ]
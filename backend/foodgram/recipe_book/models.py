@@ -1,4 +1,5 @@
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from foodgram.settings import MAX_INGREDIENT_AMOUNT, MIN_INGREDIENT_AMOUNT
@@ -37,11 +38,55 @@ UNITS = (
     ('leaf', 'лист'),
     ('stem', 'стебель'),
 )
+UNIT_LABELS = dict(UNITS)
+# Ключ единицы измерения по подписи или по самому ключу.
+UNIT_KEYS = {label: key for key, label in UNITS}
+UNIT_KEYS.update((key, key) for key, _ in UNITS)
 
 
 def directory_path(instance, filename):
-    """Функция определяющая путь к сохраняемому файлу"""
-    return f'reciepts/{instance.name}/{filename}'
+    """Функция определяющая путь к сохраняемому файлу.
+
+    Имя файла внутри каталога задает хранилище по хэшу содержимого.
+    """
+    return f'recipes/{filename}'
+
+
+def recipe_read_prefetches():
+    """Подгрузка тегов и состава рецепта для чтения."""
+    return (
+        'tags',
+        models.Prefetch(
+            'structure',
+            queryset=Structure.objects.select_related(
+                'ingredients').order_by('pk'),
+            to_attr='prefetched_structure',
+        ),
+    )
+
+
+class RecipeQuerySet(models.QuerySet):
+    """Выборки рецептов."""
+
+    def with_read_relations(self):
+        """Подгружает автора, теги и состав рецепта для чтения
+        фиксированным числом запросов."""
+        return self.select_related('author').prefetch_related(
+            *recipe_read_prefetches())
+
+    def annotate_user_flags(self, user):
+        """Добавляет в выборку признаки избранного, корзины и подписки
+        на автора для пользователя одним запросом."""
+        if user.is_anonymous:
+            return self
+        return self.annotate(
+            is_favorited=models.Exists(Favorite.objects.filter(
+                recipe=models.OuterRef('pk'), user=user)),
+            is_in_shopping_cart=models.Exists(ShoppingCart.objects.filter(
+                recipe=models.OuterRef('pk'), user=user)),
+            is_subscribed=models.Exists(Subscription.objects.filter(
+                author=models.OuterRef('author'), user=user)),
+        )
 
 
 class Tag(models.Model):
@@ -93,6 +138,11 @@ class Recipe(models.Model):
         null=True,
         default=None,
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name='Уменьшенные копии изображения',
+    )
     text = models.CharField(max_length=500,
                             null=True,
                             blank=True,
@@ -111,9 +161,34 @@ class Recipe(models.Model):
         verbose_name="Время приготовления в минутах",
         validators=[MinValueValidator(1), MaxValueValidator(600)]
     )
+    pub_date = models.DateTimeField(auto_now_add=True,
+                                    verbose_name='Дата публикации')
+    updated_at = models.DateTimeField(auto_now=True,
+                                      verbose_name='Дата изменения')
+    search_vector = SearchVectorField(null=True, editable=False)
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В корзинах',
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
-        ordering = ('cooking_time',)
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=['-favorites_count', '-pub_date', '-id'],
+                         name='recipe_popular_idx'),
+        ]
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
 
@@ -166,6 +241,10 @@ class Subscription(models.Model):
                 name='unique_subscription'
             )
         ]
+        indexes = [
+            models.Index(fields=['author', 'user'],
+                         name='subscription_author_user_idx'),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
@@ -231,3 +310,34 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user.first_name} {self.user.last_name}: {self.recipe}'
+
+
+class ShoppingListItem(models.Model):
+    """Сводный список покупок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингридиент',
+    )
+    total_amount = models.IntegerField(verbose_name='Количество')
+
+    class Meta:
+        ordering = ('user',)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item'
+            )
+        ]
+        verbose_name = 'Позиция списка покупок'
+        verbose_name_plural = 'Позиции списка покупок'
+
+    def __str__(self):
+        return f'{self.user}: {self.ingredient} - {self.total_amount}'
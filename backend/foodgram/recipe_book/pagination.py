@@ -1,6 +1,198 @@
-from rest_framework.pagination import PageNumberPagination
+import base64
+import binascii
+import json
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import DateTimeField, IntegerField, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по курсору на уникальном составном ключе.
+
+    Курсор хранит значения полей сортировки последнего элемента страницы,
+    следующая страница выбирается условием по индексу без OFFSET и COUNT.
+    Все поля ordering должны быть отсортированы в одном направлении.
+    Параметры из ordering_query_params задают другую сортировку, поэтому
+    вместе с курсором не принимаются.
+    """
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Неверный курсор'
+    page_size = 6
+    page_size_query_param = 'limit'
+    max_page_size = 100
+    ordering = ()
+    ordering_query_params = ()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.check_ordering_params(request)
+        queryset = queryset.order_by(*self.ordering)
+        position = self.decode_cursor(request, queryset.model)
+        if position is not None:
+            queryset = queryset.filter(self.get_position_filter(position))
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        self.has_next = len(results) > self.page_size
+        return self.page
+
+    def check_ordering_params(self, request):
+        conflicting = [
+            param for param in self.ordering_query_params
+            if request.query_params.get(param, '').strip()
+        ]
+        if conflicting:
+            raise ValidationError({self.cursor_query_param: (
+                f'Курсор нельзя сочетать с параметрами: '
+                f'{", ".join(conflicting)}')})
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if page_size <= 0:
+            return self.page_size
+        return min(page_size, self.max_page_size)
+
+    def get_position_filter(self, position):
+        """Условие «строго после позиции» для сортировки ordering.
+
+        Кроме развернутого сравнения кортежей добавлена граница по первому
+        полю, чтобы БД начинала чтение индекса сразу с нужного места.
+        """
+        after = Q()
+        equal = {}
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            after |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        first = self.ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': position[0]}) & after
+
+    def get_position(self, instance):
+        return [getattr(instance, field.lstrip('-'))
+                for field in self.ordering]
+
+    def encode_cursor(self, position):
+        return base64.urlsafe_b64encode(
+            json.dumps(position, default=str).encode()).decode()
+
+    def decode_cursor(self, request, model):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if (not isinstance(position, list)
+                    or len(position) != len(self.ordering)):
+                raise ValueError(position)
+            return [
+                self.parse_value(
+                    model._meta.get_field(field.lstrip('-')), value)
+                for field, value in zip(self.ordering, position)
+            ]
+        except (binascii.Error, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def parse_value(self, field, value):
+        """Значение поля сортировки из курсора: дата со временем
+        с часовым поясом или целое число. ValueError — другое."""
+        if isinstance(field, DateTimeField) and isinstance(value, str):
+            parsed = parse_datetime(value)
+            if parsed is not None and timezone.is_aware(parsed):
+                return parsed
+        elif (isinstance(field, IntegerField) and isinstance(value, int)
+              and not isinstance(value, bool)):
+            return value
+        raise ValueError(value)
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(), self.cursor_query_param,
+            self.encode_cursor(self.get_position(self.page[-1])))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
+
+
+class RecipeKeysetPagination(KeysetPagination):
+    ordering = ('-pub_date', '-id')
+    ordering_query_params = ('search', 'ordering')
+
+
+class SubscriptionKeysetPagination(KeysetPagination):
+    ordering = ('-id',)
+
+
+class CursorOrPageNumberPagination(BasePagination):
+    """Пагинация по номеру страницы (limit/page), а при наличии
+    параметра ?cursor= — по курсору."""
+    cursor_pagination_class = None
+    page_number_pagination_class = LimitPageNumberPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if KeysetPagination.cursor_query_param in request.query_params:
+            self.paginator = self.cursor_pagination_class()
+        else:
+            self.paginator = self.page_number_pagination_class()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+    @property
+    def display_page_controls(self):
+        return getattr(self.paginator, 'display_page_controls', False)
+
+    def to_html(self):
+        return self.paginator.to_html()
+
+
+class RecipePagination(CursorOrPageNumberPagination):
+    cursor_pagination_class = RecipeKeysetPagination
+
+
+class SubscriptionPagination(CursorOrPageNumberPagination):
+    cursor_pagination_class = SubscriptionKeysetPagination
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор админки: для большой таблицы без фильтров число строк
+    берется из статистики PostgreSQL вместо COUNT(*)."""
+    estimate_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT reltuples FROM pg_class WHERE relname = %s',
+                    [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= self.estimate_threshold:
+                return int(row[0])
+        return super().count
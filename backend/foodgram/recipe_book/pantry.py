@@ -0,0 +1,216 @@
+"""Поиск рецептов по набору имеющихся у пользователя ингредиентов."""
+import heapq
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, transaction
+from recipe_book.cache import bump_catalog_version, get_catalog_version
+from recipe_book.models import Structure
+
+MODES = ('any', 'only', 'all')
+JOURNAL_TIMEOUT = 60 * 60
+RESET = 'reset'
+
+
+def _journal_key(version):
+    return f'pantry:journal:{version}'
+
+
+class PantryIndex:
+    """Инвертированный индекс «ингредиент -> id рецептов» в памяти процесса.
+
+    Списки рецептов хранятся отсортированными массивами array('I'),
+    обратное отображение «рецепт -> ингредиенты» нужно для подсчета
+    покрытия и точечного обновления. Изменения состава рецептов попадают
+    в журнал в кэше Django под номером версии, и индекс применяет только
+    изменившиеся рецепты. Между процессами журнал и версия общие только
+    при общем кэше (Redis), с кэшем в памяти изменения из других
+    процессов видны не раньше, чем истечет CATALOG_TIMEOUT. Если журнал
+    потерян или слишком отстал, индекс загружается заново.
+
+    Данные индекса не меняются на месте: обновление собирает новую пару
+    словарей, копируя только затронутые массивы, и подменяет ее целиком.
+    Блокировка нужна только для синхронизации, поиск идет по снимку
+    без нее и не ждет другие запросы.
+    """
+    journal_size = 1000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._data = ({}, {})
+
+    @property
+    def postings(self):
+        return self._data[0]
+
+    @property
+    def recipes(self):
+        return self._data[1]
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Индекс из пар (recipe_id, ingredient_id), упорядоченных
+        по recipe_id."""
+        index = cls()
+        index._fill(rows)
+        return index
+
+    def _fill(self, rows):
+        postings = {}
+        recipes = {}
+        for recipe_id, ingredient_id in rows:
+            posting = postings.setdefault(ingredient_id, array('I'))
+            if posting and posting[-1] == recipe_id:
+                continue
+            posting.append(recipe_id)
+            recipes.setdefault(recipe_id, array('I')).append(ingredient_id)
+        self._data = (postings, recipes)
+
+    def _load(self):
+        # Журнал ссылается на версии основной БД, реплика может отставать.
+        self._fill(Structure.objects.using(DEFAULT_DB_ALIAS).values_list(
+            'recipe_id', 'ingredients_id').order_by(
+                'recipe_id', 'ingredients_id').iterator())
+
+    @staticmethod
+    def _remove(postings, recipes, copied, recipe_id):
+        """Убирает рецепт из копий словарей. copied — id ингредиентов,
+        массивы которых уже скопированы и принадлежат новому снимку."""
+        for ingredient_id in recipes.pop(recipe_id, ()):
+            posting = postings[ingredient_id]
+            position = bisect_left(posting, recipe_id)
+            if position < len(posting) and posting[position] == recipe_id:
+                if ingredient_id not in copied:
+                    posting = postings[ingredient_id] = array('I', posting)
+                    copied.add(ingredient_id)
+                del posting[position]
+            if not posting:
+                del postings[ingredient_id]
+
+    @staticmethod
+    def _add(postings, recipes, copied, recipe_id, ingredient_ids):
+        ingredient_ids = sorted(set(ingredient_ids))
+        recipes[recipe_id] = array('I', ingredient_ids)
+        for ingredient_id in ingredient_ids:
+            if ingredient_id not in copied:
+                postings[ingredient_id] = array(
+                    'I', postings.get(ingredient_id, ()))
+                copied.add(ingredient_id)
+            posting = postings[ingredient_id]
+            posting.insert(bisect_left(posting, recipe_id), recipe_id)
+
+    def _reload_recipes(self, recipe_ids):
+        structure = {}
+        for recipe_id, ingredient_id in Structure.objects.using(
+                DEFAULT_DB_ALIAS).filter(recipe_id__in=recipe_ids).values_list(
+                    'recipe_id', 'ingredients_id').order_by():
+            structure.setdefault(recipe_id, []).append(ingredient_id)
+        postings, recipes = (dict(data) for data in self._data)
+        copied = set()
+        for recipe_id in recipe_ids:
+            self._remove(postings, recipes, copied, recipe_id)
+            if recipe_id in structure:
+                self._add(postings, recipes, copied, recipe_id,
+                          structure[recipe_id])
+        self._data = (postings, recipes)
+
+    def _read_journal(self, version):
+        """Id рецептов, измененных после версии индекса, и версия,
+        до которой журнал удалось прочитать. None — нужна полная
+        загрузка."""
+        if (self._version is None or version < self._version
+                or version - self._version > self.journal_size):
+            return None
+        versions = range(self._version + 1, version + 1)
+        entries = cache.get_many([_journal_key(v) for v in versions])
+        changed = set()
+        synced = self._version
+        for v in versions:
+            entry = entries.get(_journal_key(v))
+            if entry is None:
+                if v == version:
+                    # Запись о последнем изменении еще не сохранена.
+                    break
+                return None
+            if entry == RESET:
+                return None
+            changed.update(entry)
+            synced = v
+        return changed, synced
+
+    def _sync(self):
+        version = get_catalog_version('pantry')
+        if version == self._version:
+            return
+        journal = self._read_journal(version)
+        if journal is None:
+            self._load()
+            self._version = version
+            return
+        changed, self._version = journal
+        if changed:
+            self._reload_recipes(sorted(changed))
+
+    def recipes_changed(self, recipe_ids):
+        """Отмечает изменение состава рецептов после коммита."""
+        recipe_ids = list(recipe_ids)
+        transaction.on_commit(lambda: self._write_journal(recipe_ids))
+
+    def reset(self):
+        transaction.on_commit(lambda: self._write_journal(RESET))
+
+    def _write_journal(self, entry):
+        version = bump_catalog_version('pantry')
+        cache.set(_journal_key(version), entry, JOURNAL_TIMEOUT)
+
+    def search(self, ingredients, mode='any', exclude=(), min_coverage=0,
+               limit=100, sync=True):
+        """Лучшие рецепты как [(recipe_id, покрытие)].
+
+        Покрытие — доля ингредиентов рецепта, которые есть в наборе.
+        any — хотя бы один ингредиент из набора, only — только
+        ингредиенты из набора, all — все ингредиенты из набора.
+        """
+        if sync:
+            with self._lock:
+                self._sync()
+        return self._search(self._data, set(ingredients), mode,
+                            set(exclude), min_coverage, limit)
+
+    @staticmethod
+    def _search(data, ingredients, mode, exclude, min_coverage, limit):
+        postings, recipes = data
+        if mode == 'all':
+            if not ingredients or not ingredients <= postings.keys():
+                return []
+            lists = sorted((postings[i] for i in ingredients), key=len)
+            found = set(lists[0]).intersection(*lists[1:])
+            matched = len(ingredients)
+            candidates = ((recipe_id, matched) for recipe_id in found)
+        else:
+            counts = Counter()
+            for ingredient_id in ingredients:
+                counts.update(postings.get(ingredient_id, ()))
+            candidates = counts.items()
+            if mode == 'only':
+                candidates = ((recipe_id, matched)
+                              for recipe_id, matched in candidates
+                              if matched == len(recipes[recipe_id]))
+        excluded = set()
+        for ingredient_id in exclude:
+            excluded.update(postings.get(ingredient_id, ()))
+        ranked = heapq.nlargest(limit, (
+            (matched / len(recipes[recipe_id]), matched, recipe_id)
+            for recipe_id, matched in candidates
+            if recipe_id not in excluded
+        ))
+        return [(recipe_id, coverage)
+                for coverage, _, recipe_id in ranked
+                if coverage >= min_coverage]
+
+
+pantry_index = PantryIndex()
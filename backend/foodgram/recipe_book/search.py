@@ -0,0 +1,45 @@
+"""Полнотекстовый поиск рецептов (только PostgreSQL)."""
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import connection
+from django.db.models import F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from recipe_book.models import Recipe, Structure
+
+SEARCH_CONFIG = 'russian'
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def recipe_search_vector():
+    """Вектор рецепта: название (вес A), ингредиенты (B), описание (C)."""
+    ingredient_names = Structure.objects.filter(
+        recipe=OuterRef('pk')).order_by().values('recipe').annotate(
+            names=StringAgg('ingredients__name', ' ')).values('names')
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector(Coalesce(Subquery(ingredient_names), Value('')),
+                       weight='B', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(recipes):
+    """Пересчитывает поисковые векторы рецептов одним запросом."""
+    if not is_supported():
+        return 0
+    return recipes.update(search_vector=recipe_search_vector())
+
+
+def search_recipes(queryset, text):
+    """Рецепты по запросу в синтаксисе websearch, лучшие совпадения
+    первыми."""
+    if not is_supported():
+        return queryset.filter(name__icontains=text)
+    query = SearchQuery(text, config=SEARCH_CONFIG, search_type='websearch')
+    return queryset.filter(search_vector=query).annotate(
+        rank=SearchRank(F('search_vector'), query)
+    ).order_by('-rank', *Recipe._meta.ordering)
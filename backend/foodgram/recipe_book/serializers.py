@@ -1,14 +1,25 @@
 import base64
+from collections import OrderedDict
 
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.shortcuts import get_object_or_404
-from foodgram.settings import MAX_INGREDIENT_AMOUNT, MIN_INGREDIENT_AMOUNT
+from django.db import transaction
+from django.db.models import Manager, prefetch_related_objects
+from foodgram.settings import (MAX_BULK_RECIPES, MAX_INGREDIENT_AMOUNT,
+                               MIN_INGREDIENT_AMOUNT)
+from recipe_book.cache import (get_cached_recipes, invalidate_cached_recipes,
+                               set_cached_recipes)
+from recipe_book.counters import change_counter
+from recipe_book.images import schedule_image_processing
 from recipe_book.models import (Favorite, Ingredient, Recipe, ShoppingCart,
-                                Structure, Subscription, Tag)
-from rest_framework import serializers, status
-from rest_framework.exceptions import ValidationError
+                                Structure, Subscription, Tag,
+                                recipe_read_prefetches)
+from recipe_book.pantry import pantry_index
+from recipe_book.search import update_search_vectors
+from recipe_book.shopping_list import update_shopping_lists
+from rest_framework import serializers
 
 User = get_user_model()
 
@@ -45,20 +56,22 @@ class AuthorSerializer(serializers.ModelSerializer):
         user = request.user
         if user.is_anonymous:
             return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         return Subscription.objects.filter(author=obj, user=user).exists()
 
 
 class IngredientSerializer(serializers.ModelSerializer):
-    """Сериализатор ингредиентов."""
-    amount = serializers.SerializerMethodField()
+    """Сериализатор ингредиентов в составе рецепта."""
+    id = serializers.IntegerField(source='ingredients.id')
+    name = serializers.CharField(source='ingredients.name')
+    measurement_unit = serializers.CharField(
+        source='ingredients.get_measurement_unit_display')
 
     class Meta:
-        model = Ingredient
+        model = Structure
         fields = ('id', 'name', 'amount', 'measurement_unit',)
 
-    def get_amount(self, obj):
-        return obj.structure.first().amount
-
 
 class StructureSerializer(serializers.ModelSerializer):
     """Сериализатор состава рецепта."""
@@ -72,28 +85,107 @@ class StructureSerializer(serializers.ModelSerializer):
         fields = ('id', 'amount',)
 
 
+class RecipeListSerializer(serializers.ListSerializer):
+    """Список рецептов: общие части представлений читаются из кэша
+    одним запросом на всю страницу."""
+
+    def to_representation(self, data):
+        recipes = list(data.all() if isinstance(data, Manager) else data)
+        self.child.load_representations(recipes)
+        return [self.child.to_representation(recipe) for recipe in recipes]
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
     """Сериализатор рецептов для чтения данных"""
     tags = TagSerializer(read_only=True, many=True)
     author = AuthorSerializer(read_only=True, many=False)
-    ingredients = IngredientSerializer(read_only=True, many=True)
+    ingredients = serializers.SerializerMethodField()
     image = Base64ImageField(required=True, allow_null=False)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
+    image_variants = serializers.JSONField(read_only=True)
 
     class Meta:
         model = Recipe
         fields = (
             'id', 'tags', 'author', 'ingredients', 'is_favorited',
-            'is_in_shopping_cart', 'name', 'image', 'text', 'cooking_time')
+            'is_in_shopping_cart', 'name', 'image', 'image_variants', 'text',
+            'cooking_time')
         read_only_fields = ('author', 'ingredients', 'tags',)
         lookup_field = 'name'
+        list_serializer_class = RecipeListSerializer
+
+    def load_representations(self, recipes):
+        """Берет не зависящие от пользователя части представлений из кэша,
+        недостающие строит и кладет в кэш."""
+        representations = get_cached_recipes(recipes)
+        missing = [recipe for recipe in recipes
+                   if recipe.pk not in representations]
+        if missing:
+            prefetch_related_objects(missing, *recipe_read_prefetches())
+            built = {
+                recipe.pk: RecipeCacheSerializer(recipe).data
+                for recipe in missing
+            }
+            set_cached_recipes(missing, built)
+            representations.update(built)
+        self._representations = representations
+
+    def to_representation(self, instance):
+        representations = getattr(self, '_representations', {})
+        if instance.pk not in representations:
+            self.load_representations([instance])
+            representations = self._representations
+        representation = representations[instance.pk]
+        request_fields = {
+            'author': dict(representation['author'],
+                           is_subscribed=self.get_is_subscribed(instance)),
+            'is_favorited': self.get_is_favorited(instance),
+            'is_in_shopping_cart': self.get_is_in_shopping_cart(instance),
+            # Ссылки зависят от хоста и схемы запроса.
+            'image': self.build_url(representation['image']),
+            'image_variants': {
+                width: self.build_url(name)
+                for width, name in representation['image_variants'].items()
+            },
+        }
+        return OrderedDict(
+            (field, request_fields.get(field, representation.get(field)))
+            for field in self.Meta.fields
+        )
+
+    def build_url(self, name):
+        """Абсолютная ссылка на файл хранилища для текущего запроса."""
+        if not name:
+            return None
+        url = default_storage.url(name)
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_ingredients(self, obj):
+        structure = getattr(obj, 'prefetched_structure', None)
+        if structure is None:
+            structure = obj.structure.select_related(
+                'ingredients').order_by('pk')
+        return IngredientSerializer(structure, many=True).data
+
+    def get_is_subscribed(self, obj):
+        request = self.context.get('request')
+        user = request.user
+        if user.is_anonymous:
+            return False
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return Subscription.objects.filter(
+            author_id=obj.author_id, user=user).exists()
 
     def get_is_favorited(self, obj):
         request = self.context.get('request')
         user = request.user
         if user.is_anonymous:
             return False
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         return Favorite.objects.filter(recipe=obj, user=user).exists()
 
     def get_is_in_shopping_cart(self, obj):
@@ -101,9 +193,42 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         user = request.user
         if user.is_anonymous:
             return False
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         return ShoppingCart.objects.filter(recipe=obj, user=user).exists()
 
 
+class RecipeAuthorSerializer(AuthorSerializer):
+    """Сериализатор автора без признака подписки."""
+
+    class Meta(AuthorSerializer.Meta):
+        fields = ('email', 'id', 'username', 'first_name', 'last_name')
+
+
+class RecipeCacheSerializer(RecipeReadSerializer):
+    """Часть представления рецепта, не зависящая от пользователя
+    и запроса: вместо ссылок на изображения — имена файлов в хранилище."""
+    author = RecipeAuthorSerializer(read_only=True, many=False)
+    image = serializers.CharField(source='image.name', read_only=True)
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = ('id', 'tags', 'author', 'ingredients', 'name', 'image',
+                  'image_variants', 'text', 'cooking_time')
+        list_serializer_class = serializers.ListSerializer
+
+    def to_representation(self, instance):
+        return serializers.ModelSerializer.to_representation(self, instance)
+
+
+class RecipeShortSerializer(serializers.ModelSerializer):
+    """Сериализатор рецептов в сокращенном виде"""
+    image = Base64ImageField(read_only=True)
+
+    class Meta:
+        model = Recipe
+        fields = ('id', 'name', 'image', 'cooking_time')
+
+
 class RecipeWriteSerializer(serializers.ModelSerializer):
     """Сериализатор рецептов для записи данных"""
     author = AuthorSerializer(read_only=True, many=False)
@@ -117,48 +242,98 @@ class RecipeWriteSerializer(serializers.ModelSerializer):
 
     def create_ingredients(self, ingredients, recipe):
         Structure.objects.bulk_create([Structure(
-            ingredients=get_object_or_404(Ingredient, pk=ingredient.get('id')),
+            ingredients_id=ingredient.get('id'),
             recipe=recipe,
             amount=int(ingredient.get('amount'))
         ) for ingredient in ingredients])
 
+    def update_ingredients(self, ingredients, recipe):
+        """Приводит состав рецепта к переданному, меняя только
+        отличающиеся строки. Возвращает прежние количества."""
+        amounts = {ingredient.get('id'): int(ingredient.get('amount'))
+                   for ingredient in ingredients}
+        old_amounts = {}
+        current = {}
+        to_delete = []
+        for row in recipe.structure.order_by('pk'):
+            old_amounts[row.ingredients_id] = (
+                old_amounts.get(row.ingredients_id, 0) + row.amount)
+            if (row.ingredients_id in current
+                    or row.ingredients_id not in amounts):
+                to_delete.append(row.pk)
+            else:
+                current[row.ingredients_id] = row
+        to_update = []
+        for ingredient_id, row in current.items():
+            if row.amount != amounts[ingredient_id]:
+                row.amount = amounts[ingredient_id]
+                to_update.append(row)
+        if to_delete:
+            Structure.objects.filter(pk__in=to_delete).delete()
+        if to_update:
+            Structure.objects.bulk_update(to_update, ['amount'])
+        self.create_ingredients([
+            ingredient for ingredient in ingredients
+            if ingredient.get('id') not in current
+        ], recipe)
+        return old_amounts
+
     def validate_ingredients(self, ingredients):
         if not ingredients:
             raise serializers.ValidationError(
                 'Мин. 1 ингредиент в рецепте!')
-
-        if len(ingredients) > len(set(
-                dict(ingredient.items())['id'] for ingredient in
-                ingredients)):
-            # OrderDict напрямую в set не переводится, поэтому пришлось
-            # использовать такую ивзращенную конструкцию. Понимаю что это
-            # плохо, но цикла избежать не удалось
+        ids = [ingredient['id'] for ingredient in ingredients]
+        if len(ids) > len(set(ids)):
             raise serializers.ValidationError({
                 'ingredients': 'Ингредиенты дублируется в данном рецепте!'})
+        existing = Ingredient.objects.only('id').in_bulk(ids)
+        unknown = [str(pk) for pk in ids if pk not in existing]
+        if unknown:
+            raise serializers.ValidationError(
+                f'Несуществующие ингредиенты: {", ".join(unknown)}')
         return ingredients
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
         recipe = Recipe.objects.create(**validated_data)
-        recipe.tags.set(tags)
+        change_counter(User, recipe.author_id, 'recipes_count', 1)
+        recipe.tags.add(*tags)
         self.create_ingredients(ingredients, recipe)
+        update_search_vectors(Recipe.objects.filter(pk=recipe.pk))
+        pantry_index.recipes_changed([recipe.pk])
+        schedule_image_processing(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
         user = self.context.get('request').user
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.create_ingredients(ingredients, instance)
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        invalidate_cached_recipes([instance])
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            old_amounts = self.update_ingredients(ingredients, instance)
+            update_shopping_lists(instance, old_amounts, {
+                ingredient['id']: int(ingredient['amount'])
+                for ingredient in ingredients
+            })
+            pantry_index.recipes_changed([instance.pk])
         instance.name = validated_data.get('name', instance.name)
-        instance.image = validated_data.get('content', instance.image)
+        image = validated_data.get('image')
+        if image is not None:
+            instance.image = image
+            instance.image_variants = {}
         instance.text = validated_data.get('text', instance.text)
         instance.cooking_time = validated_data.get('cooking_time',
                                                    instance.cooking_time)
         instance.author_id = user.id
         instance.save()
+        update_search_vectors(Recipe.objects.filter(pk=instance.pk))
+        if image is not None:
+            schedule_image_processing(instance)
         return instance
 
     def to_representation(self, instance):
@@ -202,38 +377,17 @@ class SubscriptionReadSerializer(serializers.ModelSerializer):
 
     def get_recipes(self, obj):
         request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = Recipe.objects.filter(author=obj.author)
-        if limit:
-            recipes = recipes[:int(limit)]
+        recipes = getattr(obj.author, 'limited_recipes', None)
+        if recipes is None:
+            limit = request.GET.get('recipes_limit')
+            recipes = obj.author.recipes.all()
+            if limit and limit.isdigit():
+                recipes = recipes[:int(limit)]
         context = {'request': request}
-        return RecipeReadSerializer(recipes, context=context, many=True).data
+        return RecipeShortSerializer(recipes, context=context, many=True).data
 
     def get_recipes_count(self, obj):
-        return obj.author.recipes.count()
-
-
-class SubscriptionWriteSerializer(serializers.ModelSerializer):
-    """Сериализатор подписок для записи данных"""
-
-    class Meta:
-        fields = ('__all__')
-        model = Subscription
-
-    def validate(self, data):
-        user = data.get('user')
-        author = data.get('author')
-        if user.subscriber.filter(author=author).exists():
-            raise ValidationError(
-                detail='Вы уже подписаны на данного автора',
-                code=status.HTTP_400_BAD_REQUEST,
-            )
-        if user == author:
-            raise ValidationError(
-                detail='Нельзя подписаться на самого себя',
-                code=status.HTTP_400_BAD_REQUEST,
-            )
-        return data
+        return obj.author.recipes_count
 
 
 class ShoppingCartReadSerializer(serializers.ModelSerializer):
@@ -248,38 +402,10 @@ class ShoppingCartReadSerializer(serializers.ModelSerializer):
         model = ShoppingCart
 
 
-class ShoppingCartWriteSerializer(serializers.ModelSerializer):
-    """Сериализатор списка покупок для записи данных"""
-
-    class Meta:
-        fields = ('__all__')
-        model = ShoppingCart
-
-    def validate(self, data):
-        user = data.get('user')
-        recipe = data.get('recipe')
-        if user.shopping_carts.filter(recipe=recipe).exists():
-            raise serializers.ValidationError(
-                'Данный рецепт уже добавлен в корзину')
-        return data
-
-
-class FavoriteSerializer(serializers.ModelSerializer):
-    """Сериализатор избранных рецептов"""
-
-    class Meta:
-        fields = ('__all__')
-        model = Favorite
-
-    def validate(self, data):
-        user = data.get('user')
-        recipe = data.get('recipe')
-        if user.favorites.filter(recipe=recipe).exists():
-            raise ValidationError(
-                detail='Вы уже добавили данный рецепт',
-                code=status.HTTP_400_BAD_REQUEST)
-        if Recipe.objects.filter(pk=recipe.pk).count == 0:
-            raise ValidationError(
-                detail='Данного рецепта не существует',
-                code=status.HTTP_400_BAD_REQUEST)
-        return data
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетных операций с корзиной."""
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=MAX_BULK_RECIPES,
+    )
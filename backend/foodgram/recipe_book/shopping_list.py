@@ -0,0 +1,225 @@
+"""Формирование и выгрузка списка покупок."""
+import csv
+import hashlib
+import io
+import json
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import Sum
+from recipe_book.models import (UNIT_LABELS, Recipe, ShoppingCart,
+                                ShoppingListItem, Structure)
+
+DELTA_BATCH_SIZE = 1000
+
+EXPORT_FORMATS = {
+    'txt': 'text/plain; charset=utf-8',
+    'csv': 'text/csv; charset=utf-8',
+    'json': 'application/json; charset=utf-8',
+}
+
+
+def get_shopping_list(user):
+    """Сводный список покупок пользователя одним чтением по индексу.
+
+    Список возвращается целиком: по нему считается ETag выгрузки.
+    """
+    return [
+        (name, UNIT_LABELS.get(unit, unit), amount)
+        for name, unit, amount in ShoppingListItem.objects.filter(
+            user=user, total_amount__gt=0
+        ).values_list(
+            'ingredient__name', 'ingredient__measurement_unit',
+            'total_amount'
+        ).order_by('ingredient__name')
+    ]
+
+
+def aggregate_shopping_lists(user_ids=None, recipe_ids=None):
+    """Живая агрегация списков покупок по корзинам и составам рецептов,
+    по всем рецептам или только по recipe_ids.
+
+    Возвращает словарь {(user_id, ingredient_id): количество}.
+    """
+    # Условия в одном filter(), иначе корзины присоединятся дважды.
+    lookups = {'recipe__shopping_carts__isnull': False}
+    if user_ids is not None:
+        lookups = {'recipe__shopping_carts__user_id__in': user_ids}
+    if recipe_ids is not None:
+        lookups['recipe_id__in'] = recipe_ids
+    structure = Structure.objects.filter(**lookups)
+    return {
+        (user_id, ingredient_id): amount
+        for user_id, ingredient_id, amount in structure.values_list(
+            'recipe__shopping_carts__user_id', 'ingredients_id'
+        ).annotate(amount=Sum('amount')).order_by()
+    }
+
+
+def lock_recipes(recipe_ids):
+    """Блокирует строки рецептов до чтения состава или корзин.
+
+    Добавление в корзину и изменение состава того же рецепта иначе
+    читают данные друг друга до коммита и теряют или удваивают изменение
+    списка покупок. Блокировки берутся по возрастанию pk.
+    """
+    list(Recipe.objects.select_for_update().filter(
+        pk__in=recipe_ids).order_by('pk').values_list('pk', flat=True))
+
+
+def apply_shopping_list_deltas(deltas):
+    """Применяет изменения количеств {(user_id, ingredient_id): delta}
+    к сводным спискам покупок.
+
+    Строки обновляются по возрастанию ключа: транзакции с пересекающимися
+    строками блокируют их в одном порядке и не ждут друг друга по кругу.
+    """
+    rows = sorted((user_id, ingredient_id, delta)
+                  for (user_id, ingredient_id), delta in deltas.items()
+                  if delta)
+    if not rows:
+        return
+    quote = connection.ops.quote_name
+    table = quote(ShoppingListItem._meta.db_table)
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), DELTA_BATCH_SIZE):
+            batch = rows[start:start + DELTA_BATCH_SIZE]
+            values = ', '.join(['(%s, %s, %s)'] * len(batch))
+            cursor.execute(
+                f'INSERT INTO {table} (user_id, ingredient_id, total_amount) '
+                f'VALUES {values} '
+                f'ON CONFLICT (user_id, ingredient_id) DO UPDATE '
+                f'SET total_amount = {table}.total_amount '
+                f'+ EXCLUDED.total_amount',
+                [value for row in batch for value in row]
+            )
+    ShoppingListItem.objects.filter(
+        user_id__in={user_id for user_id, _, _ in rows},
+        total_amount__lte=0
+    ).delete()
+
+
+def get_recipe_amounts(recipe_ids):
+    """Суммарное количество каждого ингредиента в рецептах."""
+    amounts = defaultdict(int)
+    for ingredient_id, amount in Structure.objects.filter(
+            recipe_id__in=recipe_ids).values_list(
+                'ingredients_id', 'amount').order_by():
+        amounts[ingredient_id] += amount
+    return amounts
+
+
+def add_to_shopping_list(user, recipe_ids):
+    apply_shopping_list_deltas({
+        (user.pk, ingredient_id): amount
+        for ingredient_id, amount in get_recipe_amounts(recipe_ids).items()
+    })
+
+
+def remove_from_shopping_list(user, recipe_ids):
+    apply_shopping_list_deltas({
+        (user.pk, ingredient_id): -amount
+        for ingredient_id, amount in get_recipe_amounts(recipe_ids).items()
+    })
+
+
+def remove_recipes_from_shopping_lists(recipe_ids):
+    """Убирает рецепты из списков покупок всех пользователей, у которых
+    они лежат в корзине. Вызывается до удаления рецептов."""
+    lock_recipes(recipe_ids)
+    apply_shopping_list_deltas({
+        key: -amount
+        for key, amount in aggregate_shopping_lists(
+            recipe_ids=recipe_ids).items()
+    })
+
+
+def update_shopping_lists(recipe, old_amounts, new_amounts):
+    """Переносит изменение состава рецепта в списки покупок всех
+    пользователей, у которых рецепт лежит в корзине."""
+    changes = {
+        ingredient_id: (new_amounts.get(ingredient_id, 0)
+                        - old_amounts.get(ingredient_id, 0))
+        for ingredient_id in set(old_amounts) | set(new_amounts)
+    }
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if not changes:
+        return
+    lock_recipes([getattr(recipe, 'pk', recipe)])
+    user_ids = ShoppingCart.objects.filter(
+        recipe=recipe).values_list('user_id', flat=True)
+    apply_shopping_list_deltas({
+        (user_id, ingredient_id): delta
+        for user_id in user_ids
+        for ingredient_id, delta in changes.items()
+    })
+
+
+def rebuild_shopping_lists(user_ids=None):
+    """Пересобирает сводные списки покупок из корзин."""
+    quote = connection.ops.quote_name
+    items = ShoppingListItem.objects.all()
+    where, params = '', []
+    if user_ids is not None:
+        if not user_ids:
+            return
+        items = items.filter(user_id__in=user_ids)
+        placeholders = ', '.join(['%s'] * len(user_ids))
+        where = f'WHERE cart.user_id IN ({placeholders}) '
+        params = list(user_ids)
+    with transaction.atomic():
+        items.delete()
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(ShoppingListItem._meta.db_table)} '
+                f'(user_id, ingredient_id, total_amount) '
+                f'SELECT cart.user_id, structure.ingredients_id, '
+                f'SUM(structure.amount) '
+                f'FROM {quote(ShoppingCart._meta.db_table)} cart '
+                f'INNER JOIN {quote(Structure._meta.db_table)} structure '
+                f'ON structure.recipe_id = cart.recipe_id '
+                f'{where}'
+                f'GROUP BY cart.user_id, structure.ingredients_id',
+                params
+            )
+
+
+def get_shopping_list_etag(user, items, export_format, today):
+    """ETag выгрузки: меняется вместе с содержимым списка и датой."""
+    digest = hashlib.sha1(json.dumps(
+        [user.get_full_name(), export_format, f'{today:%Y-%m-%d}', items],
+        ensure_ascii=False,
+    ).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def render_txt(user, items, today):
+    lines = [f'- {name} ({unit}) - {amount}' for name, unit, amount in items]
+    return (f'Список покупок для: {user.get_full_name()}\n\n'
+            f'Дата: {today:%Y-%m-%d}\n\n' + '\n'.join(lines))
+
+
+def render_csv(user, items, today):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(('name', 'measurement_unit', 'amount'))
+    writer.writerows(items)
+    return buffer.getvalue()
+
+
+def render_json(user, items, today):
+    return json.dumps({
+        'user': user.get_full_name(),
+        'date': f'{today:%Y-%m-%d}',
+        'ingredients': [
+            {'name': name, 'measurement_unit': unit, 'amount': amount}
+            for name, unit, amount in items
+        ],
+    }, ensure_ascii=False)
+
+
+RENDERERS = {
+    'txt': render_txt,
+    'csv': render_csv,
+    'json': render_json,
+}
@@ -0,0 +1,45 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+from recipe_book.cache import bump_catalog_version
+from recipe_book.ingredient_index import ingredient_index
+from recipe_book.models import Ingredient, Recipe, Tag
+from recipe_book.pantry import pantry_index
+from recipe_book.search import update_search_vectors
+
+User = get_user_model()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tags_catalog(sender, **kwargs):
+    bump_catalog_version('tags')
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredients_catalog(sender, **kwargs):
+    bump_catalog_version('ingredients')
+    ingredient_index.invalidate()
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes(sender, instance, created, **kwargs):
+    # Названия ингредиентов входят в поисковые векторы рецептов.
+    if created:
+        return
+    update_search_vectors(Recipe.objects.filter(ingredients=instance))
+
+
+@receiver(post_delete, sender=Ingredient)
+def reset_pantry_index(sender, **kwargs):
+    # Удаление ингредиента каскадом меняет состав неизвестных рецептов.
+    pantry_index.reset()
+
+
+@receiver(post_save, sender=User)
+def invalidate_author_recipes(sender, instance, created, update_fields,
+                              **kwargs):
+    # Данные автора входят в кэшированное представление его рецептов.
+    if created or update_fields == frozenset({'last_login'}):
+        return
+    Recipe.objects.filter(author=instance).update(updated_at=timezone.now())
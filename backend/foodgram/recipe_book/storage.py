@@ -0,0 +1,45 @@
+"""Хранилище медиафайлов с адресацией по содержимому."""
+import hashlib
+import os
+
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """Называет файлы по sha256 содержимого: prefix/ab/cd/abcd…ext.
+
+    Одинаковые файлы хранятся один раз, а содержимое по ссылке никогда
+    не меняется, поэтому ее можно кэшировать бессрочно. Файлы не
+    удаляются вместе с рецептами: на них могут ссылаться другие записи,
+    неиспользуемые файлы удаляет команда gc_media.
+
+    Счетчиков ссылок на файлы нет: их пришлось бы менять при каждой
+    записи Recipe.image и image_variants, включая bulk_create, update(),
+    админку, импорт и фоновую обработку, и любой пропуск или гонка
+    приводили бы к удалению используемого файла. Вместо этого gc_media
+    собирает ссылки по самим рецептам (mark-and-sweep), а новые файлы
+    защищает порог возраста.
+    """
+
+    def get_content_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        digest = digest.hexdigest()
+        extension = os.path.splitext(name)[1].lower()
+        return os.path.join(os.path.dirname(name), digest[:2], digest[2:4],
+                            digest + extension)
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        if not hasattr(content, 'chunks'):
+            content = File(content, name)
+        name = self.get_content_name(name, content)
+        if self.exists(name):
+            # Повторная загрузка: файл снова получает порог возраста gc_media,
+            # иначе старый неиспользуемый файл удалят из-под нового рецепта.
+            os.utime(self.path(name))
+            return name
+        return super().save(name, content, max_length=max_length)
@@ -0,0 +1,1174 @@
+import base64
+import csv
+import io
+import ipaddress
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection
+from django.http import HttpResponse
+from django.test import (Client, RequestFactory, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from foodgram import db_router, metrics
+from foodgram.metrics import MetricsMiddleware
+from foodgram.settings import MAX_BULK_RECIPES
+from PIL import Image
+from recipe_book.counters import reconcile_counters
+from recipe_book.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                                ShoppingListItem, Structure, Subscription, Tag)
+from recipe_book.pantry import PantryIndex
+from recipe_book.search import search_recipes, update_search_vectors
+from recipe_book.shopping_list import (aggregate_shopping_lists,
+                                       rebuild_shopping_lists)
+from recipe_book.views import RecipesViewSet
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+from users.authentication import token_cache
+
+User = get_user_model()
+
+RECIPES = 30
+
+
+class RecipeDataMixin:
+    """Автор с рецептами и читатель, у которого часть рецептов
+    в избранном и в корзине."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(
+            username='author', email='author@example.com',
+            first_name='Автор', last_name='Рецептов')
+        cls.reader = User.objects.create(
+            username='reader', email='reader@example.com',
+            first_name='Читатель', last_name='Рецептов')
+        cls.tags = Tag.objects.bulk_create([
+            Tag(name='Тест 1', color='#000001', slug='test-1'),
+            Tag(name='Тест 2', color='#000002', slug='test-2'),
+        ])
+        cls.ingredients = Ingredient.objects.bulk_create([
+            Ingredient(name=f'тестовый ингредиент {number}',
+                       measurement_unit='g')
+            for number in range(10)
+        ])
+        Recipe.objects.bulk_create([
+            Recipe(author=cls.author, name=f'рецепт {number}', text='текст',
+                   cooking_time=10, image='recipes/test.jpg')
+            for number in range(RECIPES)
+        ])
+        cls.recipes = list(Recipe.objects.order_by('pk'))
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe=recipe, tag=tag)
+            for recipe in cls.recipes for tag in cls.tags
+        ])
+        Structure.objects.bulk_create([
+            Structure(recipe=recipe, ingredients=ingredient, amount=100)
+            for recipe in cls.recipes for ingredient in cls.ingredients[:3]
+        ])
+        Favorite.objects.bulk_create([
+            Favorite(user=cls.reader, recipe=recipe)
+            for recipe in cls.recipes[::2]
+        ])
+        ShoppingCart.objects.bulk_create([
+            ShoppingCart(user=cls.reader, recipe=recipe)
+            for recipe in cls.recipes[::3]
+        ])
+        Subscription.objects.create(user=cls.reader, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+
+class RecipeListQueriesTest(RecipeDataMixin, TestCase):
+    """Число запросов списка рецептов не зависит от размера страницы."""
+
+    def get_list(self, limit):
+        response = self.client.get('/api/recipes/', {'limit': limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), limit)
+        return response
+
+    def count_queries(self, limit):
+        with CaptureQueriesContext(connection) as context:
+            self.get_list(limit)
+        return len(context)
+
+    def test_cold_cache(self):
+        queries = self.count_queries(1)
+        for limit in (5, RECIPES):
+            cache.clear()
+            with self.assertNumQueries(queries):
+                self.get_list(limit)
+
+    def test_warm_cache(self):
+        self.get_list(RECIPES)
+        queries = self.count_queries(1)
+        with self.assertNumQueries(queries):
+            self.get_list(RECIPES)
+
+    def test_viewer_flags(self):
+        results = self.get_list(RECIPES).data['results']
+        favorited = {recipe.pk for recipe in self.recipes[::2]}
+        in_cart = {recipe.pk for recipe in self.recipes[::3]}
+        for item in results:
+            self.assertEqual(item['is_favorited'], item['id'] in favorited)
+            self.assertEqual(item['is_in_shopping_cart'],
+                             item['id'] in in_cart)
+            self.assertTrue(item['author']['is_subscribed'])
+
+
+class RecipeIngredientsTest(RecipeDataMixin, TestCase):
+    """Состав рецепта отдается с количеством из рецепта и подписью
+    единицы измерения, как в справочнике ингредиентов."""
+
+    def test_detail(self):
+        recipe = self.recipes[0]
+        Structure.objects.filter(
+            recipe=recipe, ingredients=self.ingredients[0]).update(amount=7)
+        response = self.client.get(f'/api/recipes/{recipe.pk}/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['ingredients'][0], {
+            'id': self.ingredients[0].pk,
+            'name': self.ingredients[0].name,
+            'amount': 7,
+            'measurement_unit': 'г',
+        })
+
+    def test_units_match_catalog(self):
+        catalog = {
+            item['id']: item['measurement_unit']
+            for item in self.client.get('/api/ingredients/').json()
+        }
+        response = self.client.get(f'/api/recipes/{self.recipes[0].pk}/')
+        for item in response.data['ingredients']:
+            self.assertEqual(item['measurement_unit'], catalog[item['id']])
+
+    def patch_ingredients(self, recipe, amounts):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        return client.patch(f'/api/recipes/{recipe.pk}/', {'ingredients': [
+            {'id': pk, 'amount': amount} for pk, amount in amounts]},
+            format='json')
+
+    def structure(self, recipe):
+        return {row.ingredients_id: (row.pk, row.amount)
+                for row in recipe.structure.all()}
+
+    def test_update_keeps_unchanged_rows(self):
+        recipe = self.recipes[0]
+        first, second = self.ingredients[:2]
+        before = self.structure(recipe)
+        response = self.patch_ingredients(recipe, [
+            (first.pk, 100), (second.pk, 150), (self.ingredients[5].pk, 20)])
+        self.assertEqual(response.status_code, 200)
+        after = self.structure(recipe)
+        self.assertEqual(set(after), {
+            first.pk, second.pk, self.ingredients[5].pk})
+        self.assertEqual(after[first.pk], before[first.pk])
+        self.assertEqual(after[second.pk], (before[second.pk][0], 150))
+        self.assertEqual(after[self.ingredients[5].pk][1], 20)
+
+    def test_unknown_ingredients(self):
+        recipe = self.recipes[0]
+        before = self.structure(recipe)
+        missing = [10 ** 9, 10 ** 9 + 1]
+        response = self.patch_ingredients(recipe, [
+            (self.ingredients[0].pk, 100), (missing[0], 1), (missing[1], 1)])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['ingredients'], [
+            f'Несуществующие ингредиенты: {missing[0]}, {missing[1]}'])
+        self.assertEqual(self.structure(recipe), before)
+
+
+class ShoppingListConsistencyTest(RecipeDataMixin, TestCase):
+    """Сводные списки покупок совпадают с живой агрегацией корзин
+    после каждого изменения корзины или состава рецепта."""
+
+    def setUp(self):
+        super().setUp()
+        rebuild_shopping_lists()
+        self.author_client = APIClient()
+        self.author_client.force_authenticate(self.author)
+
+    def assertConsistent(self):
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in
+            ShoppingListItem.objects.values_list(
+                'user_id', 'ingredient_id', 'total_amount')
+        }
+        self.assertEqual(stored, aggregate_shopping_lists())
+
+    def test_cart_toggles(self):
+        recipe = self.recipes[1]
+        response = self.client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.assertEqual(response.status_code, 201)
+        self.assertConsistent()
+        response = self.client.delete(
+            f'/api/recipes/{recipe.pk}/shopping_cart/')
+        self.assertEqual(response.status_code, 204)
+        self.assertConsistent()
+
+    def assertInCarts(self, recipes):
+        counts = dict(Recipe.objects.values_list('pk', 'in_carts_count'))
+        expected = {recipe.pk for recipe in recipes}
+        self.assertEqual(counts, {pk: int(pk in expected) for pk in counts})
+
+    def test_bulk_cart(self):
+        reconcile_counters()
+        url = '/api/recipes/shopping_cart/'
+        pks = [recipe.pk for recipe in self.recipes]
+        # В корзине уже лежат рецепты 0 и 3, повторы схлопываются.
+        response = self.client.post(url, {'recipes': [
+            *pks[:6], pks[0], pks[1], 10 ** 9]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            'added': [pks[1], pks[2], pks[4], pks[5]],
+            'skipped': [pks[0], pks[3], 10 ** 9]})
+        in_cart = set(self.recipes[:6]) | set(self.recipes[::3])
+        self.assertInCarts(in_cart)
+        self.assertConsistent()
+        response = self.client.delete(
+            url, {'recipes': [pks[0], pks[1], pks[0], pks[7]]},
+            format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {
+            'removed': [pks[0], pks[1]], 'skipped': [pks[7]]})
+        in_cart -= {self.recipes[0], self.recipes[1]}
+        self.assertInCarts(in_cart)
+        self.assertConsistent()
+        response = self.client.post(f'{url}clear/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data,
+                         {'removed': sorted(recipe.pk for recipe in in_cart)})
+        self.assertInCarts(())
+        self.assertConsistent()
+        response = self.client.post(f'{url}from_favorites/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'added': pks[::2]})
+        self.assertInCarts(self.recipes[::2])
+        self.assertConsistent()
+
+    def test_bulk_cart_limit(self):
+        response = self.client.post(
+            '/api/recipes/shopping_cart/',
+            {'recipes': list(range(1, MAX_BULK_RECIPES + 2))}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('recipes', response.data)
+        self.assertFalse(ShoppingCart.objects.exclude(
+            recipe__in=self.recipes[::3]).exists())
+
+    def test_recipe_edit(self):
+        recipe = self.recipes[0]
+        ingredients = self.ingredients
+        response = self.author_client.patch(
+            f'/api/recipes/{recipe.pk}/', {'ingredients': [
+                {'id': ingredients[0].pk, 'amount': 250},
+                {'id': ingredients[2].pk, 'amount': 100},
+                {'id': ingredients[5].pk, 'amount': 3},
+            ]}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertConsistent()
+
+    def test_recipe_delete(self):
+        response = self.author_client.delete(
+            f'/api/recipes/{self.recipes[0].pk}/')
+        self.assertEqual(response.status_code, 204)
+        self.assertConsistent()
+
+
+class ShoppingListExportTest(RecipeDataMixin, TestCase):
+    """Выгрузка списка покупок в каждом формате и ответ 304 по ETag."""
+    url = '/api/recipes/download_shopping_cart/'
+
+    def setUp(self):
+        super().setUp()
+        rebuild_shopping_lists()
+
+    def test_formats(self):
+        total = 100 * len(self.recipes[::3])
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'- тестовый ингредиент 0 (г) - {total}',
+                      response.content.decode())
+        rows = list(csv.reader(io.StringIO(
+            self.client.get(self.url, {'format': 'csv'}).content.decode())))
+        self.assertEqual(rows[0], ['name', 'measurement_unit', 'amount'])
+        self.assertEqual(rows[1], ['тестовый ингредиент 0', 'г', str(total)])
+        self.assertEqual(len(rows), 4)
+        data = json.loads(
+            self.client.get(self.url, {'format': 'json'}).content)
+        self.assertEqual(data['user'], 'Читатель Рецептов')
+        self.assertEqual(data['ingredients'][0], {
+            'name': 'тестовый ингредиент 0', 'measurement_unit': 'г',
+            'amount': total})
+        response = self.client.get(self.url, {'format': 'pdf'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_not_modified(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.client.delete(f'/api/recipes/{self.recipes[0].pk}/shopping_cart/')
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+
+def recipe_form_data(recipe, extra=0):
+    """Данные формы рецепта в админке с текущим составом и extra
+    пустыми строками состава."""
+    rows = list(recipe.structure.order_by('pk'))
+    data = {
+        'author': recipe.author_id,
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'image_variants': '{}',
+        'tags': list(recipe.tags.values_list('pk', flat=True)),
+        'structure-TOTAL_FORMS': len(rows) + extra,
+        'structure-INITIAL_FORMS': len(rows),
+        'structure-MIN_NUM_FORMS': 1,
+        'structure-MAX_NUM_FORMS': 1000,
+    }
+    for number, row in enumerate(rows):
+        data.update({
+            f'structure-{number}-id': row.pk,
+            f'structure-{number}-recipe': recipe.pk,
+            f'structure-{number}-ingredients': row.ingredients_id,
+            f'structure-{number}-amount': row.amount,
+        })
+    return data
+
+
+class AdminShoppingListTest(RecipeDataMixin, TestCase):
+    """Правки состава и удаление рецептов в админке меняют сводные
+    списки покупок так же, как API."""
+    assertConsistent = ShoppingListConsistencyTest.assertConsistent
+
+    def setUp(self):
+        super().setUp()
+        rebuild_shopping_lists()
+        self.admin = Client()
+        self.admin.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+
+    def test_recipe_inline_edit(self):
+        recipe = self.recipes[0]
+        rows = list(recipe.structure.order_by('pk'))
+        data = recipe_form_data(recipe, extra=1)
+        data['structure-0-amount'] = 300
+        data['structure-1-DELETE'] = 'on'
+        data.update({
+            f'structure-{len(rows)}-recipe': recipe.pk,
+            f'structure-{len(rows)}-ingredients': self.ingredients[7].pk,
+            f'structure-{len(rows)}-amount': 5,
+        })
+        response = self.admin.post(
+            f'/admin/recipe_book/recipe/{recipe.pk}/change/', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(recipe.structure.count(), len(rows))
+        self.assertConsistent()
+
+    def test_structure_edit(self):
+        row = self.recipes[0].structure.order_by('pk').first()
+        response = self.admin.post(
+            f'/admin/recipe_book/structure/{row.pk}/change/', {
+                'recipe': self.recipes[3].pk,
+                'ingredients': self.ingredients[8].pk,
+                'amount': 42,
+            })
+        self.assertEqual(response.status_code, 302)
+        self.assertConsistent()
+        response = self.admin.post(
+            f'/admin/recipe_book/structure/{row.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertConsistent()
+
+    def test_recipe_delete(self):
+        response = self.admin.post(
+            f'/admin/recipe_book/recipe/{self.recipes[0].pk}/delete/',
+            {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertConsistent()
+
+    def test_recipe_delete_selected(self):
+        response = self.admin.post('/admin/recipe_book/recipe/', {
+            'action': 'delete_selected',
+            '_selected_action': [recipe.pk for recipe in self.recipes[:7]],
+            'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertFalse(Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in self.recipes[:7]]).exists())
+        self.assertConsistent()
+
+    def test_cart_add_delete(self):
+        recipe = self.recipes[1]
+        response = self.admin.post('/admin/recipe_book/shoppingcart/add/', {
+            'user': self.author.pk, 'recipe': recipe.pk})
+        self.assertEqual(response.status_code, 302)
+        self.assertConsistent()
+        cart = ShoppingCart.objects.get(user=self.author, recipe=recipe)
+        response = self.admin.post(
+            f'/admin/recipe_book/shoppingcart/{cart.pk}/change/', {
+                'user': self.author.pk, 'recipe': self.recipes[2].pk})
+        self.assertEqual(response.status_code, 302)
+        self.assertConsistent()
+        response = self.admin.post(
+            f'/admin/recipe_book/shoppingcart/{cart.pk}/delete/',
+            {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertConsistent()
+        response = self.admin.post('/admin/recipe_book/shoppingcart/', {
+            'action': 'delete_selected',
+            '_selected_action': list(ShoppingCart.objects.filter(
+                user=self.reader).values_list('pk', flat=True)[:4]),
+            'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertConsistent()
+
+
+class AdminCountersTest(RecipeDataMixin, TestCase):
+    """Изменения избранного, корзин, подписок и рецептов в админке
+    не расходятся с денормализованными счетчиками."""
+
+    def setUp(self):
+        super().setUp()
+        reconcile_counters()
+        self.admin = Client()
+        self.admin.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+
+    def assertCounters(self):
+        drift = reconcile_counters(check=True)
+        self.assertEqual(drift, dict.fromkeys(drift, 0))
+
+    def check_links(self, model, target, targets, user):
+        """Добавление, смена цели, удаление и удаление действием."""
+        path = f'/admin/recipe_book/{model._meta.model_name}/'
+        response = self.admin.post(f'{path}add/', {
+            'user': user.pk, target: targets[0].pk})
+        self.assertEqual(response.status_code, 302)
+        self.assertCounters()
+        link = model.objects.get(user=user, **{target: targets[0]})
+        response = self.admin.post(f'{path}{link.pk}/change/', {
+            'user': user.pk, target: targets[1].pk})
+        self.assertEqual(response.status_code, 302)
+        self.assertCounters()
+        response = self.admin.post(
+            f'{path}{link.pk}/delete/', {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertCounters()
+        response = self.admin.post(path, {
+            'action': 'delete_selected',
+            '_selected_action': list(
+                model.objects.values_list('pk', flat=True)[:4]),
+            'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertCounters()
+
+    def test_favorites(self):
+        self.check_links(Favorite, 'recipe', self.recipes[1:3], self.author)
+
+    def test_shopping_carts(self):
+        self.check_links(
+            ShoppingCart, 'recipe', self.recipes[1:3], self.author)
+
+    def test_subscriptions(self):
+        other = User.objects.create(
+            username='other', email='other@example.com')
+        self.check_links(
+            Subscription, 'author', [self.reader, other], self.author)
+
+    def test_recipe_author(self):
+        recipe = self.recipes[0]
+        data = recipe_form_data(recipe)
+        data['author'] = self.reader.pk
+        response = self.admin.post(
+            f'/admin/recipe_book/recipe/{recipe.pk}/change/', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertCounters()
+
+    def test_recipe_add(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        buffer = io.BytesIO()
+        Image.new('RGB', (10, 10)).save(buffer, 'JPEG')
+        data = recipe_form_data(self.recipes[0])
+        data.update({
+            'name': 'новый рецепт',
+            'image': SimpleUploadedFile('new.jpg', buffer.getvalue()),
+            'structure-INITIAL_FORMS': 0,
+        })
+        for key in [key for key in data if key.endswith(('-id', '-recipe'))]:
+            del data[key]
+        with override_settings(MEDIA_ROOT=media.name):
+            response = self.admin.post('/admin/recipe_book/recipe/add/', data)
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(Recipe.objects.filter(name='новый рецепт').exists())
+        self.assertCounters()
+
+    def test_recipe_delete(self):
+        Recipe.objects.filter(pk=self.recipes[-1].pk).update(
+            author=self.reader)
+        reconcile_counters()
+        response = self.admin.post('/admin/recipe_book/recipe/', {
+            'action': 'delete_selected',
+            '_selected_action': [
+                recipe.pk for recipe in self.recipes[-5:]],
+            'post': 'yes',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertCounters()
+        response = self.admin.post(
+            f'/admin/recipe_book/recipe/{self.recipes[0].pk}/delete/',
+            {'post': 'yes'})
+        self.assertEqual(response.status_code, 302)
+        self.assertCounters()
+
+
+class AdminChangelistQueriesTest(RecipeDataMixin, TestCase):
+    """Число запросов страниц списков в админке не растет с числом
+    строк на странице."""
+    CHANGELISTS = ('recipe_book/recipe', 'recipe_book/ingredient',
+                   'recipe_book/structure', 'recipe_book/subscription',
+                   'recipe_book/favorite', 'recipe_book/shoppingcart',
+                   'users/user')
+
+    def setUp(self):
+        super().setUp()
+        self.admin = Client()
+        self.admin.force_login(User.objects.create_superuser(
+            'admin', 'admin@example.com', 'password'))
+
+    def count_queries(self, changelist):
+        with CaptureQueriesContext(connection) as context:
+            response = self.admin.get(f'/admin/{changelist}/')
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def add_rows(self):
+        authors = User.objects.bulk_create([
+            User(username=f'extra{number}', email=f'extra{number}@ex.com')
+            for number in range(20)
+        ])
+        recipes = Recipe.objects.bulk_create([
+            Recipe(author=author, name=f'еще рецепт {number}', text='текст',
+                   cooking_time=5, image='recipes/test.jpg')
+            for number, author in enumerate(authors)
+        ])
+        Structure.objects.bulk_create([
+            Structure(recipe=recipe, ingredients=ingredient, amount=1)
+            for recipe in recipes for ingredient in self.ingredients[5:]
+        ])
+        for model in (Favorite, ShoppingCart):
+            model.objects.bulk_create([
+                model(user=author, recipe=recipe)
+                for author in authors for recipe in self.recipes[:3]
+            ])
+        Subscription.objects.bulk_create([
+            Subscription(user=author, author=self.author)
+            for author in authors
+        ])
+
+    def test_changelists(self):
+        queries = {changelist: self.count_queries(changelist)
+                   for changelist in self.CHANGELISTS}
+        self.add_rows()
+        for changelist, count in queries.items():
+            with self.subTest(changelist=changelist):
+                self.assertEqual(self.count_queries(changelist), count)
+
+
+class RecipeImageUrlTest(RecipeDataMixin, TestCase):
+    """Общий кэш представлений не переносит хост и схему ссылок
+    на изображения из одного запроса в другой."""
+
+    def test_urls_follow_request(self):
+        recipe = self.recipes[0]
+        Recipe.objects.filter(pk=recipe.pk).update(
+            image_variants={'320': 'recipes/test_320w.webp'})
+        path = f'/api/recipes/{recipe.pk}/'
+        first = self.client.get(path, HTTP_HOST='localhost').data
+        second = self.client.get(
+            path, HTTP_HOST='127.0.0.1', secure=True).data
+        self.assertEqual(first['image'],
+                         'http://localhost/media/recipes/test.jpg')
+        self.assertEqual(second['image'],
+                         'https://127.0.0.1/media/recipes/test.jpg')
+        self.assertEqual(second['image_variants'], {
+            '320': 'https://127.0.0.1/media/recipes/test_320w.webp'})
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+
+class RecipeCursorTest(RecipeDataMixin, TestCase):
+    """Курсор проверяется до запроса к базе, а параметры другой
+    сортировки вместе с курсором отклоняются."""
+
+    def get(self, cursor, **params):
+        return self.client.get('/api/recipes/', {
+            'cursor': encode_cursor(cursor), **params})
+
+    def test_pages(self):
+        response = self.client.get('/api/recipes/', {'cursor': ''})
+        self.assertEqual(response.status_code, 200)
+        seen = [item['id'] for item in response.data['results']]
+        while response.data['next']:
+            response = self.client.get(response.data['next'])
+            seen.extend(item['id'] for item in response.data['results'])
+        self.assertEqual(seen, [recipe.pk for recipe in reversed(
+            Recipe.objects.order_by('pub_date', 'id'))])
+
+    def test_invalid(self):
+        for cursor in (['x', 'y'], [{'a': 1}, 1], ['2022-01-01T00:00', 1],
+                       ['2022-01-01T00:00:00+00:00', '1'],
+                       ['2022-01-01T00:00:00+00:00', True], [1, 2], {}):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(self.get(cursor).status_code, 404)
+        response = self.client.get('/api/recipes/', {'cursor': '!!'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_valid(self):
+        response = self.get(['2122-01-01T00:00:00+00:00', 1])
+        self.assertEqual(response.status_code, 200)
+
+    def test_conflicting_params(self):
+        for params in ({'search': 'рецепт'}, {'ordering': 'popular'}):
+            with self.subTest(params=params):
+                response = self.client.get(
+                    '/api/recipes/', {'cursor': '', **params})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('cursor', response.data)
+
+
+class SubscriptionRecipesLimitTest(RecipeDataMixin, TestCase):
+    """recipes_limit отдает первые рецепты каждого автора в порядке
+    модели, а число запросов не зависит от числа подписок."""
+    url = '/api/users/subscriptions/'
+
+    def get(self):
+        response = self.client.get(self.url, {'recipes_limit': 2})
+        self.assertEqual(response.status_code, 200)
+        return response.data['results']
+
+    def test_limit(self):
+        with CaptureQueriesContext(connection) as context:
+            self.get()
+        authors = [User.objects.create(username=f'author-{number}',
+                                       email=f'author-{number}@example.com')
+                   for number in range(3)]
+        for number, author in enumerate(authors):
+            for index in range(number + 1):
+                Recipe.objects.create(
+                    author=author, name=f'рецепт {number}-{index}',
+                    text='текст', cooking_time=5, image='recipes/test.jpg')
+            Subscription.objects.create(user=self.reader, author=author)
+        with self.assertNumQueries(len(context)) as queries:
+            results = self.get()
+        # Лишние рецепты отсекает подзапрос в БД, а не срез в Python.
+        recipe_queries = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT "recipe_book_recipe"')]
+        self.assertEqual(len(recipe_queries), 1)
+        self.assertIn('LIMIT 2', recipe_queries[0])
+        self.assertEqual(len(results), 4)
+        for item in results:
+            expected = list(Recipe.objects.filter(
+                author=item['id']).values_list('pk', flat=True)[:2])
+            self.assertEqual(
+                [recipe['id'] for recipe in item['recipes']], expected)
+
+
+class SubscriptionOrderTest(RecipeDataMixin, TestCase):
+    """Подписки в режиме номера страницы и курсора идут в одном
+    порядке: новые первыми."""
+
+    def test_same_order(self):
+        authors = [User.objects.create(username=f'author-{number}',
+                                       email=f'author-{number}@example.com')
+                   for number in range(4)]
+        for author in authors:
+            Subscription.objects.create(user=self.reader, author=author)
+        expected = [author.pk for author in reversed(authors)]
+        expected.append(self.author.pk)
+        pages = []
+        for page in (1, 2, 3):
+            response = self.client.get(
+                '/api/users/subscriptions/', {'limit': 2, 'page': page})
+            pages.extend(item['id'] for item in response.data['results'])
+        self.assertEqual(pages, expected)
+        cursors = []
+        url = '/api/users/subscriptions/?limit=2&cursor='
+        while url:
+            response = self.client.get(url)
+            cursors.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(cursors, expected)
+
+
+class ProcessImagesTest(RecipeDataMixin, TestCase):
+    """process_images доделывает обработку, потерянную при перезапуске
+    воркера, и не трогает уже обработанные изображения."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def test_lost_job(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), (200, 100, 50)).save(buffer, 'JPEG')
+        name = default_storage.save(
+            'recipes/lost.jpg', ContentFile(buffer.getvalue()))
+        recipe = self.recipes[0]
+        Recipe.objects.filter(pk=recipe.pk).update(image=name)
+        output, errors = io.StringIO(), io.StringIO()
+        call_command('process_images', stdout=output, stderr=errors)
+        self.assertIn('Обработано изображений рецептов: 1 из 1',
+                      output.getvalue())
+        # У остальных рецептов файла recipes/test.jpg нет.
+        missing = errors.getvalue().splitlines()
+        self.assertEqual(len(missing), RECIPES - 1)
+        self.assertTrue(all(line.startswith(
+            'Не удалось открыть recipes/test.jpg') for line in missing))
+        recipe.refresh_from_db()
+        self.assertEqual(set(recipe.image_variants), {'320', '640'})
+        processed = recipe.image.name
+        self.assertNotEqual(processed, name)
+        output, errors = io.StringIO(), io.StringIO()
+        call_command('process_images', '--all', '--dry-run',
+                     stdout=output, stderr=errors)
+        self.assertIn(': 0', output.getvalue())
+        self.assertNotIn(processed, errors.getvalue())
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.image.name, processed)
+
+
+class GcMediaTest(TestCase):
+    """gc_media не удаляет старый неиспользуемый файл, если его только
+    что загрузили заново для еще не сохраненного рецепта."""
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def test_reupload_of_orphan(self):
+        content = b'image'
+        name = default_storage.save('recipes/a.jpg', ContentFile(content))
+        old = time.time() - 7 * 24 * 60 * 60
+        os.utime(default_storage.path(name), (old, old))
+        self.assertEqual(
+            default_storage.save('recipes/b.jpg', ContentFile(content)), name)
+        call_command('gc_media', stdout=io.StringIO())
+        self.assertTrue(default_storage.exists(name))
+        os.utime(default_storage.path(name), (old, old))
+        call_command('gc_media', stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(name))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'поиск работает только '
+            'с PostgreSQL')
+class RecipeSearchTest(TestCase):
+    """Поиск по нескольким сотням тысяч рецептов ранжирует совпадения
+    в названии, составе и описании и идет по GIN-индексу."""
+    SEED_RECIPES = 200_000
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create(
+            username='author', email='author@example.com')
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "INSERT INTO recipe_book_recipe (author_id, name, text, "
+                "image, image_variants, cooking_time, pub_date, updated_at, "
+                "favorites_count, in_carts_count, search_vector) "
+                "SELECT %s, 'Блюдо ' || n, 'Описание блюда номер ' || n, "
+                "'', '{}', 10, now(), now(), 0, 0, "
+                "setweight(to_tsvector('russian', 'Блюдо ' || n), 'A') || "
+                "setweight(to_tsvector('russian', "
+                "'Описание блюда номер ' || n), 'C') "
+                "FROM generate_series(1, %s) AS n",
+                [author.pk, cls.SEED_RECIPES])
+        ingredient = Ingredient.objects.create(
+            name='тестовая заправка для борща', measurement_unit='g')
+        cls.by_name, cls.by_ingredient, cls.by_text = [
+            Recipe.objects.create(
+                author=author, name=name, text=text, cooking_time=10)
+            for name, text in (('Борщ украинский', 'Суп на говядине.'),
+                               ('Суп со свеклой', 'Густой суп.'),
+                               ('Щи', 'Почти как борщ.'))
+        ]
+        Structure.objects.create(
+            recipe=cls.by_ingredient, ingredients=ingredient, amount=1)
+        update_search_vectors(Recipe.objects.filter(pk__in=[
+            cls.by_name.pk, cls.by_ingredient.pk, cls.by_text.pk]))
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE recipe_book_recipe')
+
+    def test_ranked(self):
+        response = self.client.get('/api/recipes/', {'search': 'борщи'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['id'] for item in response.data['results']],
+            [self.by_name.pk, self.by_ingredient.pk, self.by_text.pk])
+
+    def test_index(self):
+        plan = search_recipes(Recipe.objects.all(), 'борщ').explain()
+        self.assertIn('recipe_search_vector_idx', plan)
+        self.assertNotIn('Seq Scan on recipe_book_recipe', plan)
+
+    def test_single_query(self):
+        queryset = search_recipes(Recipe.objects.all(), 'блюдо 4242')
+        with self.assertNumQueries(1):
+            names = [recipe.name for recipe in queryset[:10]]
+        self.assertEqual(names, ['Блюдо 4242'])
+
+
+class PantryIndexSnapshotTest(RecipeDataMixin, TestCase):
+    """Обновление индекса не меняет снимок, по которому может идти
+    поиск в другом потоке."""
+
+    def test_update_keeps_snapshot(self):
+        index = PantryIndex()
+        index._load()
+        snapshot = index._data
+        before = {ingredient_id: list(posting)
+                  for ingredient_id, posting in snapshot[0].items()}
+        recipe = self.recipes[0]
+        first, new = self.ingredients[0].pk, self.ingredients[9].pk
+        Structure.objects.filter(
+            recipe=recipe, ingredients_id=first).update(ingredients_id=new)
+        index._reload_recipes([recipe.pk])
+        self.assertEqual({ingredient_id: list(posting)
+                          for ingredient_id, posting in snapshot[0].items()},
+                         before)
+        self.assertIn(recipe.pk, snapshot[0][first])
+        self.assertNotIn(recipe.pk, index.postings[first])
+        self.assertEqual(list(index.postings[new]), [recipe.pk])
+        self.assertEqual(
+            PantryIndex._search(snapshot, {new}, 'any', set(), 0, 10), [])
+
+
+class ImportIngredientsTest(TestCase):
+    """Некорректный элемент JSON-файла — понятная ошибка команды
+    с его номером."""
+
+    def test_not_object(self):
+        with tempfile.NamedTemporaryFile(
+                'w', suffix='.json', encoding='utf-8') as file:
+            json.dump([{'name': 'тестовая мука', 'measurement_unit': 'г'},
+                       ['тестовая соль', 'г']], file, ensure_ascii=False)
+            file.flush()
+            with self.assertRaisesMessage(CommandError, 'Элемент 1'):
+                call_command('import_ingredients', file.name,
+                             stdout=io.StringIO())
+
+
+class ImportRecipesTest(RecipeDataMixin, TestCase):
+    """Ингредиенты, созданные импортом рецептов, сразу видны
+    в справочнике и поиске по названию, а загруженные изображения
+    обрабатываются после коммита."""
+
+    def test_new_ingredient_in_catalog(self):
+        self.assertEqual(self.client.get(
+            '/api/ingredients/', {'name': 'тестовый шафран'}).json(), [])
+        record = {
+            'name': 'импортированный рецепт', 'author': self.author.email,
+            'text': 'текст', 'cooking_time': 5, 'tags': [],
+            'ingredients': [{'name': 'тестовый шафран', 'amount': 1,
+                             'measurement_unit': 'г'}],
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'recipes.jsonl')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command('import_recipes', path, stdout=io.StringIO())
+        names = [item['name'] for item in self.client.get(
+            '/api/ingredients/', {'name': 'тестовый шафран'}).json()]
+        self.assertEqual(names, ['тестовый шафран'])
+
+    def test_image_processed(self):
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 600), (200, 100, 50)).save(buffer, 'JPEG')
+        record = {
+            'name': 'рецепт с изображением', 'author': self.author.email,
+            'text': 'текст', 'cooking_time': 5, 'tags': [],
+            'ingredients': [], 'image': 'recipes/imported.jpg',
+            'image_data': base64.b64encode(buffer.getvalue()).decode(),
+        }
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'recipes.jsonl')
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(json.dumps(record, ensure_ascii=False) + '\n')
+            with override_settings(MEDIA_ROOT=directory), \
+                    mock.patch('recipe_book.images.executor', None), \
+                    self.captureOnCommitCallbacks(execute=True):
+                call_command('import_recipes', path, stdout=io.StringIO())
+            recipe = Recipe.objects.get(name=record['name'])
+            self.assertEqual(set(recipe.image_variants), {'320', '640'})
+
+
+class TokenCacheTest(TestCase):
+    """Закэшированный токен перестает работать сразу после выхода,
+    блокировки пользователя и смены пароля."""
+    password = 'Xq7-lw93-Pzk'
+
+    def setUp(self):
+        token_cache.clear()
+        self.user = User.objects.create(
+            username='reader', email='reader@example.com')
+        self.user.set_password(self.password)
+        self.user.save()
+        self.token = Token.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token.key}')
+        self.assertEqual(self.me().status_code, 200)
+        self.assertIsNotNone(token_cache.get(self.token.key))
+
+    def me(self):
+        return self.client.get('/api/users/me/')
+
+    def test_logout(self):
+        response = self.client.post('/api/auth/token/logout/')
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_deactivated(self):
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_password_changed(self):
+        response = self.client.post('/api/users/set_password/', {
+            'current_password': self.password,
+            'new_password': 'Nw4-gk27-Lmq'})
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.me().status_code, 401)
+
+    def test_user_saved(self):
+        self.user.last_login = timezone.now()
+        self.user.save(update_fields=['last_login'])
+        self.assertIsNotNone(token_cache.get(self.token.key))
+        self.user.first_name = 'Читатель'
+        self.user.save()
+        self.assertIsNone(token_cache.get(self.token.key))
+        self.assertEqual(self.me().data['first_name'], 'Читатель')
+
+
+class MetricsTest(TestCase):
+    """Заголовок Server-Timing, выдача /metrics только разрешенным
+    адресам и отпечатки повторяющихся запросов в логе медленных."""
+
+    def test_server_timing(self):
+        response = self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'],
+                         r'^db;dur=[\d.]+;desc="\d+ queries", view;dur=')
+
+    def test_metrics(self):
+        self.client.get('/api/tags/')
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('foodgram_request_queries_count'
+                      '{view="TagsViewSet.list"}', response.content.decode())
+
+    def test_metrics_forbidden(self):
+        response = self.client.get('/metrics', REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(
+            '/metrics', REMOTE_ADDR='10.1.2.3',
+            HTTP_X_FORWARDED_FOR='127.0.0.1')
+        self.assertEqual(response.status_code, 403)
+        with mock.patch('foodgram.metrics.METRICS_NETWORKS',
+                        (ipaddress.ip_network('10.0.0.0/8'),)):
+            response = self.client.get('/metrics', REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response.status_code, 200)
+
+    def test_slow_request_log(self):
+        def view(request):
+            for pk in (1, 2, 3):
+                Tag.objects.filter(pk__in=[pk] * pk).exists()
+            return HttpResponse()
+
+        middleware = MetricsMiddleware(view)
+        with mock.patch('foodgram.metrics.SLOW_REQUEST_QUERIES', 3), \
+                self.assertLogs(metrics.logger, 'WARNING') as logs:
+            middleware(RequestFactory().get('/'))
+        self.assertIn('SQL 3 за', logs.output[0])
+        self.assertRegex(logs.output[0], r'\n  3 x SELECT .* IN \(\?\)')
+        with mock.patch('foodgram.metrics.SLOW_REQUEST_QUERIES', 4), \
+                mock.patch.object(metrics.logger, 'warning') as warning:
+            middleware(RequestFactory().get('/'))
+        warning.assert_not_called()
+
+
+class ReplicaRoutingTest(TestCase):
+    """Закрепление за основной БД после входа и повтор чтения
+    на основной БД после ошибки реплики."""
+
+    def test_login_pins_issued_token(self):
+        User.objects.create_user(
+            username='login', email='login@example.com', password='secret')
+        response = self.client.post('/api/auth/token/login/', {
+            'email': 'login@example.com', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        request = RequestFactory().get(
+            '/api/recipes/',
+            HTTP_AUTHORIZATION=f'Token {response.json()["auth_token"]}')
+        self.assertTrue(cache.get_many(db_router._read_pin_keys(request)))
+
+    def test_replica_error_retried_on_primary(self):
+        aliases = []
+
+        def view(request):
+            alias = db_router._read_alias.get()
+            aliases.append(alias)
+            if alias is not None:
+                raise OperationalError('replica is gone')
+            return HttpResponse('primary')
+        view.cls = RecipesViewSet
+
+        def handler(request):
+            # Порядок вызовов BaseHandler: process_view, вьюха,
+            # process_exception при ошибке.
+            middleware.process_view(request, view, (), {})
+            try:
+                return view(request)
+            except OperationalError as error:
+                response = middleware.process_exception(request, error)
+                if response is None:
+                    raise
+                return response
+
+        middleware = db_router.ReplicaRoutingMiddleware(handler)
+        request = RequestFactory().get('/api/recipes/')
+        request.user = AnonymousUser()
+        with mock.patch.object(db_router, 'get_replicas',
+                               return_value=['replica_test']), \
+                mock.patch.object(db_router.replica_health, 'is_healthy',
+                                  return_value=True), \
+                mock.patch.object(db_router.replica_health, 'mark_down') \
+                as mark_down, self.assertLogs(db_router.logger, 'WARNING'):
+            response = middleware(request)
+        self.assertEqual(response.content, b'primary')
+        self.assertEqual(aliases, ['replica_test', None])
+        mark_down.assert_called_once_with('replica_test')
+        self.assertIsNone(db_router._read_alias.get())
+
+
+@skipUnless(connection.vendor == 'postgresql', 'одновременные запросы '
+            'проверяются на PostgreSQL')
+class ConcurrentToggleTest(TransactionTestCase):
+    """Одновременные нажатия «в избранное», «в корзину» и «подписаться»
+    из разных потоков: ровно одно добавление и одно удаление, без 500
+    и без расхождения счетчиков и списков покупок."""
+    THREADS = 8
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(
+            username='reader', email='reader@example.com')
+        self.author = User.objects.create(
+            username='author', email='author@example.com')
+        self.recipe = Recipe.objects.create(
+            author=self.author, name='рецепт', text='текст', cooking_time=5,
+            image='recipes/test.jpg')
+        self.ingredient = Ingredient.objects.create(
+            name='тестовый ингредиент', measurement_unit='g')
+        Structure.objects.create(
+            recipe=self.recipe, ingredients=self.ingredient, amount=100)
+        reconcile_counters()
+
+    def request(self, barrier, method, path, user=None, data=None):
+        client = APIClient()
+        client.force_authenticate(user or self.user)
+        try:
+            barrier.wait()
+            return getattr(client, method)(
+                path, data, format='json').status_code
+        finally:
+            connection.close()
+
+    def run_concurrently(self, method, path):
+        barrier = threading.Barrier(self.THREADS)
+        with ThreadPoolExecutor(self.THREADS) as executor:
+            return Counter(executor.map(
+                lambda _: self.request(barrier, method, path),
+                range(self.THREADS)))
+
+    def test_toggles(self):
+        for path in (f'/api/recipes/{self.recipe.pk}/favorite/',
+                     f'/api/recipes/{self.recipe.pk}/shopping_cart/',
+                     f'/api/users/{self.recipe.author_id}/subscribe/'):
+            with self.subTest(path=path):
+                self.assertEqual(self.run_concurrently('post', path),
+                                 {201: 1, 400: self.THREADS - 1})
+                self.assertConsistent(1)
+                self.assertEqual(self.run_concurrently('delete', path),
+                                 {204: 1, 404: self.THREADS - 1})
+                self.assertConsistent(0)
+
+    def test_cart_during_structure_edit(self):
+        readers = [User.objects.create(username=f'reader-{number}',
+                                       email=f'reader-{number}@example.com')
+                   for number in range(self.THREADS - 1)]
+        cart = f'/api/recipes/{self.recipe.pk}/shopping_cart/'
+        detail = f'/api/recipes/{self.recipe.pk}/'
+        for amount, (method, expected) in enumerate(
+                [('post', 201), ('delete', 204)] * 3, 200):
+            barrier = threading.Barrier(self.THREADS)
+            edit = {'ingredients': [
+                {'id': self.ingredient.pk, 'amount': amount}]}
+            with ThreadPoolExecutor(self.THREADS) as executor:
+                statuses = Counter(executor.map(
+                    lambda args: self.request(barrier, *args),
+                    [(method, cart, reader) for reader in readers]
+                    + [('patch', detail, self.author, edit)]))
+            self.assertEqual(statuses,
+                             {expected: self.THREADS - 1, 200: 1})
+            stored = dict(((user_id, ingredient_id), total)
+                          for user_id, ingredient_id, total in
+                          ShoppingListItem.objects.values_list(
+                              'user_id', 'ingredient_id', 'total_amount'))
+            self.assertEqual(stored, aggregate_shopping_lists())
+
+    def assertConsistent(self, links):
+        drift = reconcile_counters(check=True)
+        self.assertEqual(drift, dict.fromkeys(drift, 0))
+        stored = dict(((user_id, ingredient_id), amount)
+                      for user_id, ingredient_id, amount in
+                      ShoppingListItem.objects.values_list(
+                          'user_id', 'ingredient_id', 'total_amount'))
+        self.assertEqual(stored, aggregate_shopping_lists())
+        self.assertEqual(
+            Favorite.objects.count() + ShoppingCart.objects.count()
+            + Subscription.objects.count(), links)
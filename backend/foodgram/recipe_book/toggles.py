@@ -0,0 +1,178 @@
+"""Добавление и удаление связей пользователя с рецептами и авторами
+(избранное, корзина, подписки) одной командой SQL.
+
+Вставка идет через INSERT ... SELECT ... ON CONFLICT DO NOTHING RETURNING:
+несуществующие объекты отсекает SELECT, повторы — уникальное ограничение,
+а RETURNING возвращает только действительно добавленные строки. Поэтому
+одновременные запросы не проходят общую проверку exists() и не падают
+на IntegrityError. Счетчики и списки покупок меняются в той же
+транзакции и только для добавленных или удаленных строк.
+"""
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from recipe_book.counters import change_counters
+from recipe_book.models import Favorite, Recipe, ShoppingCart, Subscription
+from recipe_book.shopping_list import (add_to_shopping_list, lock_recipes,
+                                       remove_from_shopping_list)
+from rest_framework.settings import api_settings
+
+User = get_user_model()
+
+
+class Toggle:
+    """Связь пользователя с объектами поля field модели model
+    и денормализованный счетчик этих объектов."""
+
+    def __init__(self, model, field, counter, duplicate_message):
+        self.model = model
+        self.field = model._meta.get_field(field)
+        self.user_column = model._meta.get_field('user').column
+        self.counter = counter
+        self.duplicate_message = duplicate_message
+
+    def _placeholders(self, ids):
+        return ', '.join(['%s'] * len(ids))
+
+    def insert(self, user, target_ids):
+        """Добавляет связи с существующими объектами, которых еще нет.
+
+        Возвращает {id объекта: id новой строки}.
+        """
+        if not target_ids:
+            return {}
+        quote = connection.ops.quote_name
+        target = self.field.related_model._meta
+        column = quote(self.field.column)
+        # WHERE обязателен: без него SQLite не разбирает ON CONFLICT
+        # после INSERT ... SELECT.
+        sql = (
+            f'INSERT INTO {quote(self.model._meta.db_table)} '
+            f'({quote(self.user_column)}, {column}) '
+            f'SELECT %s, {quote(target.pk.column)} '
+            f'FROM {quote(target.db_table)} '
+            f'WHERE {quote(target.pk.column)} IN '
+            f'({self._placeholders(target_ids)}) '
+            f'ON CONFLICT DO NOTHING '
+            f'RETURNING {column}, {quote(self.model._meta.pk.column)}'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [user.pk, *target_ids])
+            return dict(cursor.fetchall())
+
+    def delete(self, user, target_ids=None):
+        """Удаляет связи (все, если target_ids не передан), возвращает
+        id объектов, связи с которыми были."""
+        if target_ids is not None and not target_ids:
+            return []
+        quote = connection.ops.quote_name
+        column = quote(self.field.column)
+        sql = (f'DELETE FROM {quote(self.model._meta.db_table)} '
+               f'WHERE {quote(self.user_column)} = %s')
+        params = [user.pk]
+        if target_ids is not None:
+            sql += f' AND {column} IN ({self._placeholders(target_ids)})'
+            params.extend(target_ids)
+        with connection.cursor() as cursor:
+            cursor.execute(f'{sql} RETURNING {column}', params)
+            return [row[0] for row in cursor.fetchall()]
+
+    def insert_from(self, user, source):
+        """Добавляет связи с объектами, связанными с пользователем
+        через source, одним INSERT ... SELECT."""
+        quote = connection.ops.quote_name
+        column = quote(self.field.column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {quote(self.model._meta.db_table)} '
+                f'({quote(self.user_column)}, {column}) '
+                f'SELECT {quote(source.user_column)}, '
+                f'{quote(source.field.column)} '
+                f'FROM {quote(source.model._meta.db_table)} '
+                f'WHERE {quote(source.user_column)} = %s '
+                f'ON CONFLICT DO NOTHING '
+                f'RETURNING {column}, {quote(self.model._meta.pk.column)}',
+                [user.pk]
+            )
+            return dict(cursor.fetchall())
+
+    def changed(self, user, target_ids, delta):
+        if target_ids:
+            model, field = self.counter
+            change_counters(model, target_ids, field, delta)
+
+    @transaction.atomic
+    def add(self, user, target_ids):
+        created = self.insert(user, list(target_ids))
+        self.changed(user, list(created), 1)
+        return created
+
+    @transaction.atomic
+    def remove(self, user, target_ids):
+        removed = self.delete(user, list(target_ids))
+        self.changed(user, removed, -1)
+        return removed
+
+    @transaction.atomic
+    def clear(self, user):
+        removed = self.delete(user)
+        self.changed(user, removed, -1)
+        return removed
+
+    @transaction.atomic
+    def copy_from(self, user, source):
+        """Переносит связи пользователя из source (например, избранное
+        в корзину), уже существующие пропускаются."""
+        created = self.insert_from(user, source)
+        self.changed(user, list(created), 1)
+        return created
+
+    def validate(self, user, target_id):
+        """Сообщение об ошибке до вставки или None."""
+        return None
+
+    def missing_message(self, target_id):
+        return (f'Недопустимый первичный ключ "{target_id}" - '
+                f'объект не существует.')
+
+    def explain_failure(self, target_id):
+        """Причина, по которой связь не добавилась: {поле: [сообщение]}.
+
+        Вызывается только на редком пути ошибки, поэтому может
+        сделать дополнительный запрос.
+        """
+        if self.field.related_model.objects.filter(pk=target_id).exists():
+            return {api_settings.NON_FIELD_ERRORS_KEY: [
+                self.duplicate_message]}
+        return {self.field.name: [self.missing_message(target_id)]}
+
+
+class ShoppingCartToggle(Toggle):
+    """Корзина: вместе со связью меняется сводный список покупок."""
+
+    def changed(self, user, target_ids, delta):
+        if not target_ids:
+            return
+        lock_recipes(target_ids)
+        super().changed(user, target_ids, delta)
+        if delta > 0:
+            add_to_shopping_list(user, target_ids)
+        else:
+            remove_from_shopping_list(user, target_ids)
+
+
+class SubscriptionToggle(Toggle):
+    def validate(self, user, target_id):
+        if user.pk == target_id:
+            return 'Нельзя подписаться на самого себя'
+        return None
+
+
+favorites = Toggle(
+    Favorite, 'recipe', (Recipe, 'favorites_count'),
+    'Вы уже добавили данный рецепт')
+shopping_carts = ShoppingCartToggle(
+    ShoppingCart, 'recipe', (Recipe, 'in_carts_count'),
+    'Данный рецепт уже добавлен в корзину')
+subscriptions = SubscriptionToggle(
+    Subscription, 'author', (User, 'subscribers_count'),
+    'Вы уже подписаны на данного автора')
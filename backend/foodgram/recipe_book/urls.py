@@ -12,6 +12,15 @@ v1_router.register('users/subscriptions', SubscriptionsViewSet,
                    basename='subscriptions')
 
 urlpatterns = [
+    path(r'recipes/shopping_cart/',
+         ShoppingCartViewSet.as_view(
+             {'post': 'shopping_cart_bulk', 'delete': 'shopping_cart_bulk'}),
+         ),
+    path(r'recipes/shopping_cart/clear/',
+         ShoppingCartViewSet.as_view({'post': 'clear_shopping_cart'}), ),
+    path(r'recipes/shopping_cart/from_favorites/',
+         ShoppingCartViewSet.as_view(
+             {'post': 'shopping_cart_from_favorites'}), ),
     path(r'recipes/download_shopping_cart/',
          ShoppingCartViewSet.as_view(
              {'get': 'download_shopping_cart'}), ),
@@ -0,0 +1,25 @@
+from django.utils.http import parse_etags
+from rest_framework.exceptions import ValidationError
+
+
+def etag_matches(request, etag):
+    """Проверяет, совпадает ли ETag с заголовком If-None-Match."""
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags
+
+
+def parse_id_list(params, name):
+    """Список id из параметра запроса: ?name=1,2&name=3."""
+    ids = []
+    for value in params.getlist(name):
+        for item in value.split(','):
+            if not item.strip():
+                continue
+            try:
+                ids.append(int(item))
+            except ValueError:
+                raise ValidationError({name: 'Ожидается список id'})
+    return ids
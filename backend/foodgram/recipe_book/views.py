@@ -1,44 +1,85 @@
 from datetime import datetime
 
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import OuterRef, Prefetch, Subquery
+from django.http import HttpResponse, HttpResponseNotModified
 from django_filters import rest_framework as filters
+from foodgram.settings import INGREDIENT_SEARCH_LIMIT, PANTRY_SEARCH_LIMIT
+from recipe_book.cache import invalidate_cached_recipes
+from recipe_book.catalog import catalog_response
+from recipe_book.counters import change_counter
 from recipe_book.filters import IngredientFilter, RecipeFilter
+from recipe_book.ingredient_index import ingredient_index
 from recipe_book.models import (Favorite, Ingredient, Recipe, ShoppingCart,
                                 Subscription, Tag)
-from recipe_book.pagination import LimitPageNumberPagination
+from recipe_book.pagination import (LimitPageNumberPagination,
+                                    RecipePagination,
+                                    SubscriptionKeysetPagination,
+                                    SubscriptionPagination)
+from recipe_book.pantry import MODES, pantry_index
 from recipe_book.permission import IsAdminOrReadOnly, IsAuthorOrReadOnly
-from recipe_book.serializers import (FavoriteSerializer, IngredientSerializers,
-                                     RecipeReadSerializer,
+from recipe_book.serializers import (IngredientSerializers,
+                                     RecipeIdsSerializer, RecipeReadSerializer,
                                      RecipeWriteSerializer,
                                      ShoppingCartReadSerializer,
-                                     ShoppingCartWriteSerializer,
-                                     SubscriptionReadSerializer,
-                                     SubscriptionWriteSerializer,
-                                     TagSerializer)
+                                     SubscriptionReadSerializer, TagSerializer)
+from recipe_book.shopping_list import (EXPORT_FORMATS, RENDERERS,
+                                       get_recipe_amounts, get_shopping_list,
+                                       get_shopping_list_etag,
+                                       update_shopping_lists)
+from recipe_book.toggles import favorites, shopping_carts, subscriptions
+from recipe_book.utils import etag_matches, parse_id_list
 from rest_framework import mixins, permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
 from rest_framework.permissions import SAFE_METHODS
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.viewsets import GenericViewSet
 
 User = get_user_model()
 
 
+def toggle_response(toggle, request, pk):
+    """Добавление (POST) или удаление (DELETE) одной связи
+    пользователя одной командой вставки или удаления."""
+    user = request.user
+    if request.method == 'DELETE':
+        if not toggle.remove(user, [pk]):
+            raise NotFound()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    error = toggle.validate(user, pk)
+    if error:
+        raise ValidationError({api_settings.NON_FIELD_ERRORS_KEY: [error]})
+    created = toggle.add(user, [pk])
+    if not created:
+        raise ValidationError(toggle.explain_failure(pk))
+    return Response({'id': created[pk], 'user': user.pk,
+                     toggle.field.name: pk},
+                    status=status.HTTP_201_CREATED)
+
+
 class RecipesViewSet(viewsets.ModelViewSet):
     """
     Вьюсет рецептов.
     Права доступа: Администратор или только чтение.
     """
     queryset = Recipe.objects.all()
-    pagination_class = LimitPageNumberPagination
+    pagination_class = RecipePagination
     http_method_names = ('post', 'get', 'delete', 'patch')
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = RecipeFilter
     permission_classes = (IsAuthorOrReadOnly,)
 
+    def get_queryset(self):
+        if self.request.method in SAFE_METHODS:
+            # Теги и состав подгружает сериализатор только для рецептов,
+            # которых нет в кэше.
+            return Recipe.objects.select_related(
+                'author').annotate_user_flags(self.request.user)
+        return Recipe.objects.all()
+
     def get_serializer_class(self):
         if self.request.method in SAFE_METHODS:
             return RecipeReadSerializer
@@ -47,6 +88,46 @@ class RecipesViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        update_shopping_lists(
+            instance, get_recipe_amounts([instance.pk]), {})
+        invalidate_cached_recipes([instance])
+        pantry_index.recipes_changed([instance.pk])
+        change_counter(User, instance.author_id, 'recipes_count', -1)
+        instance.delete()
+
+    @action(detail=False, methods=['get'])
+    def pantry(self, request):
+        """Рецепты, которые можно приготовить из имеющихся ингредиентов,
+        по убыванию покрытия."""
+        ingredients = parse_id_list(request.query_params, 'ingredients')
+        if not ingredients:
+            raise ValidationError({'ingredients': 'Укажите ингредиенты'})
+        mode = request.query_params.get('mode', 'any')
+        if mode not in MODES:
+            raise ValidationError(
+                {'mode': f'Допустимые значения: {", ".join(MODES)}'})
+        try:
+            min_coverage = float(
+                request.query_params.get('min_coverage', 0))
+        except ValueError:
+            raise ValidationError({'min_coverage': 'Ожидается число'})
+        ranked = pantry_index.search(
+            ingredients, mode, parse_id_list(request.query_params, 'exclude'),
+            min_coverage, PANTRY_SEARCH_LIMIT)
+        paginator = LimitPageNumberPagination()
+        page = paginator.paginate_queryset(ranked, request, view=self)
+        recipes = self.get_queryset().in_bulk(
+            [recipe_id for recipe_id, _ in page])
+        page = [(recipes[recipe_id], coverage)
+                for recipe_id, coverage in page if recipe_id in recipes]
+        data = self.get_serializer(
+            [recipe for recipe, _ in page], many=True).data
+        for item, (_, coverage) in zip(data, page):
+            item['coverage'] = round(coverage, 3)
+        return paginator.get_paginated_response(data)
+
 
 class TagsViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -60,6 +141,9 @@ class TagsViewSet(viewsets.ReadOnlyModelViewSet):
     http_method_names = ['get', ]
     search_fields = ('name', 'slug')
 
+    def list(self, request, *args, **kwargs):
+        return catalog_response(request, 'tags')
+
 
 class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     """
@@ -75,73 +159,59 @@ class IngredientsViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_class = IngredientFilter
     search_fields = ('name',)
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            return Response(
+                ingredient_index.search(name, INGREDIENT_SEARCH_LIMIT))
+        return catalog_response(request, 'ingredients')
 
-class SubscriptionsViewSet(mixins.CreateModelMixin,
-                           mixins.DestroyModelMixin,
-                           mixins.ListModelMixin,
-                           GenericViewSet):
+
+class SubscriptionsViewSet(mixins.ListModelMixin, GenericViewSet):
     """
     Вьюсет Подписок
     Права доступа: Всем авторизованным.
     """
     serializer_class = SubscriptionReadSerializer
     permission_classes = (permissions.IsAuthenticated,)
-    http_method_names = ['post', 'get', 'delete']
-    pagination_class = LimitPageNumberPagination
+    pagination_class = SubscriptionPagination
 
     def get_queryset(self):
-        return Subscription.objects.select_related().filter(
-            user=self.request.user).all()
+        recipes = Recipe.objects.all()
+        limit = self.request.query_params.get('recipes_limit')
+        if limit and limit.isdigit():
+            # Первые N рецептов каждого автора выбираются коррелированным
+            # подзапросом в том же запросе, что и остальная подгрузка.
+            recipes = recipes.filter(pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')).values('pk')[:int(limit)]))
+        # Тот же порядок (новые подписки первыми), что и в режиме курсора.
+        return Subscription.objects.filter(
+            user=self.request.user
+        ).select_related('author').order_by(
+            *SubscriptionKeysetPagination.ordering
+        ).prefetch_related(
+            Prefetch('author__recipes', queryset=recipes,
+                     to_attr='limited_recipes')
+        )
 
     @action(detail=True, methods=['post', 'delete'])
     def subscribe(self, request, pk=None):
-        if request.method == 'DELETE':
-            instance = get_object_or_404(Subscription,
-                                         user_id=request.user.id,
-                                         author_id=pk)
-            self.perform_destroy(instance)
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        if request.method == 'POST':
-            serializer = SubscriptionWriteSerializer(
-                data={'user': request.user.pk, 'author': pk},
-                context={'request': self.request})
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
-        return Response(
-            status=status.HTTP_400_BAD_REQUEST)
+        return toggle_response(subscriptions, request, pk)
 
 
-class FavoriteViewSet(mixins.CreateModelMixin,
-                      mixins.DestroyModelMixin,
-                      GenericViewSet):
+class FavoriteViewSet(GenericViewSet):
     """
     Вьюсет Избранного
     Права доступа: Всем авторизованным.
     """
     queryset = Favorite.objects.all()
     permission_classes = (permissions.IsAuthenticated,)
-    serializer_class = FavoriteSerializer
     http_method_names = ['post', 'delete']
 
     @action(detail=True, methods=['post', 'delete'], )
     def favorite(self, request, pk=None):
-        if request.method == 'DELETE':
-            instance = get_object_or_404(Favorite,
-                                         user_id=request.user.id,
-                                         recipe_id=pk)
-            self.perform_destroy(instance)
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        if request.method == 'POST':
-            serializer = self.serializer_class(
-                data={'user': request.user.pk, 'recipe': pk},
-                context={'request': self.request})
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(
-            status=status.HTTP_400_BAD_REQUEST)
+        return toggle_response(favorites, request, pk)
 
 
 class ShoppingCartViewSet(viewsets.ModelViewSet):
@@ -156,42 +226,63 @@ class ShoppingCartViewSet(viewsets.ModelViewSet):
 
     @action(detail=True, methods=['post', 'delete'])
     def shopping_cart(self, request, pk=None):
+        return toggle_response(shopping_carts, request, pk)
+
+    @action(detail=False, methods=['post', 'delete'])
+    def shopping_cart_bulk(self, request):
+        """Добавление (POST) или удаление (DELETE) списка рецептов
+        одной командой. Ответ — какие id обработаны, какие пропущены."""
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = list(dict.fromkeys(serializer.validated_data['recipes']))
         if request.method == 'DELETE':
-            instance = get_object_or_404(ShoppingCart,
-                                         user_id=request.user.id,
-                                         recipe_id=pk)
-            self.perform_destroy(instance)
-            return Response(status=status.HTTP_204_NO_CONTENT)
-        if request.method == 'POST':
-            serializer = ShoppingCartWriteSerializer(
-                data={'user': request.user.id, 'recipe': pk},
-                context={'request': self.request})
-            serializer.is_valid(raise_exception=True)
-            serializer.save()
-            return Response(serializer.data,
-                            status=status.HTTP_201_CREATED)
+            key, done = 'removed', shopping_carts.remove(
+                request.user, recipe_ids)
+        else:
+            key, done = 'added', shopping_carts.add(request.user, recipe_ids)
+        return Response({
+            key: [pk for pk in recipe_ids if pk in done],
+            'skipped': [pk for pk in recipe_ids if pk not in done],
+        })
+
+    @action(detail=False, methods=['post'])
+    def clear_shopping_cart(self, request):
         return Response(
-            status=status.HTTP_400_BAD_REQUEST)
+            {'removed': sorted(shopping_carts.clear(request.user))})
+
+    @action(detail=False, methods=['post'])
+    def shopping_cart_from_favorites(self, request):
+        """Копирует в корзину все избранные рецепты."""
+        return Response({'added': sorted(
+            shopping_carts.copy_from(request.user, favorites))})
+
+    def perform_content_negotiation(self, request, force=False):
+        # Параметр format выгрузки задает формат файла, а не рендерер DRF.
+        if self.action == 'download_shopping_cart':
+            force = True
+        return super().perform_content_negotiation(request, force)
 
     @action(detail=False, methods=['get'])
     def download_shopping_cart(self, request):
-        ingredients = Ingredient.objects.filter(
-            recipe__shopping_carts__user=request.user).values(
-            'name',
-            'measurement_unit'
-        ).annotate(amount=Sum('structure__amount'))
+        export_format = request.query_params.get('format', 'txt')
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'format': f'Доступные форматы: {", ".join(EXPORT_FORMATS)}'},
+                status=status.HTTP_400_BAD_REQUEST)
+        user = request.user
+        items = get_shopping_list(user)
         today = datetime.today()
-        shopping_list = (
-            f'Список покупок для: {request.user.get_full_name()}\n\n'
-            f'Дата: {today:%Y-%m-%d}\n\n'
-        )
-        shopping_list += '\n'.join([
-            f'- {ingredient["name"]} '
-            f'({ingredient["measurement_unit"]})'
-            f' - {ingredient["amount"]}'
-            for ingredient in ingredients
-        ])
-        filename = f'{request.user.username}_shopping_list.txt'
-        response = HttpResponse(shopping_list, content_type='text/plain')
+        etag = get_shopping_list_etag(user, items, export_format, today)
+        if etag_matches(request, etag):
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            return response
+        # Список уже прочитан целиком ради ETag, поэтому выгрузка
+        # собирается в памяти: потоковая отдача не уменьшила бы память.
+        response = HttpResponse(
+            RENDERERS[export_format](user, items, today),
+            content_type=EXPORT_FORMATS[export_format])
+        filename = f'{user.username}_shopping_list.{export_format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
+        response['ETag'] = etag
         return response
@@ -1,16 +1,20 @@
 from django.contrib import admin
 from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
+from recipe_book.pagination import EstimatedCountPaginator
 
 User = get_user_model()
 
 
 class CustomUserAdmin(UserAdmin):
-    list_editable = ('first_name', 'last_name', 'email',)
-    ordering = ('first_name', 'last_name',)
-    search_fields = ('email', 'first_name', 'last_name')
-    list_filter = ('email', 'first_name', 'last_name')
+    list_display = ('username', 'email', 'first_name', 'last_name',
+                    'recipes_count', 'subscribers_count', 'is_staff')
+    ordering = ('username',)
+    search_fields = ('username', 'email', 'first_name', 'last_name')
+    list_filter = ('is_staff', 'is_active')
     empty_value_display = '-пусто-'
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 admin.site.register(User, CustomUserAdmin)
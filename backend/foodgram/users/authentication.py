@@ -0,0 +1,91 @@
+"""Аутентификация по токену с кэшем токенов и пользователей."""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+from foodgram.settings import (AUTH_TOKEN_CACHE_SHARED, AUTH_TOKEN_CACHE_SIZE,
+                               AUTH_TOKEN_CACHE_TIMEOUT)
+from rest_framework.authentication import TokenAuthentication
+
+
+class TokenCache:
+    """Кэш ключ токена -> токен с пользователем.
+
+    По умолчанию это LRU в памяти процесса с ограниченным временем жизни
+    записей, с shared=True записи хранятся в общем кэше Django. Токен
+    хранится сериализованным, чтобы каждый запрос получал свою копию
+    пользователя.
+    """
+
+    def __init__(self, size, timeout, shared=False):
+        self.size = size
+        self.timeout = timeout
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+
+    @staticmethod
+    def _cache_key(key):
+        return f'auth:token:{key}'
+
+    def _get_local(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            data, expires = entry
+            if expires <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return data
+
+    def get(self, key):
+        if self.shared:
+            data = cache.get(self._cache_key(key))
+        else:
+            data = self._get_local(key)
+        return None if data is None else pickle.loads(data)
+
+    def set(self, key, token):
+        data = pickle.dumps(token, pickle.HIGHEST_PROTOCOL)
+        if self.shared:
+            cache.set(self._cache_key(key), data, self.timeout)
+            return
+        with self._lock:
+            self._data[key] = (data, time.monotonic() + self.timeout)
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys):
+        if self.shared:
+            cache.delete_many([self._cache_key(key) for key in keys])
+            return
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+token_cache = TokenCache(
+    AUTH_TOKEN_CACHE_SIZE, AUTH_TOKEN_CACHE_TIMEOUT, AUTH_TOKEN_CACHE_SHARED)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication, который обращается к БД только при промахе
+    кэша. Те же токены и тот же заголовок Authorization: Token <ключ>."""
+
+    def authenticate_credentials(self, key):
+        token = token_cache.get(key)
+        if token is None:
+            # Недействительный токен и неактивный пользователь не
+            # кэшируются: родительский метод выбрасывает исключение.
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, token)
+        return token.user, token
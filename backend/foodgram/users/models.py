@@ -10,6 +10,16 @@ class User(AbstractUser):
         unique=True,
         verbose_name='email',
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Рецептов',
+    )
+    subscribers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Подписчиков',
+    )
     REQUIRED_FIELDS = ['first_name', 'last_name', 'email', ]
 
     def __str__(self):
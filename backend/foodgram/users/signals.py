@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+from users.authentication import token_cache
+
+User = get_user_model()
+
+
+@receiver(post_delete, sender=Token)
+def forget_token(sender, instance, **kwargs):
+    """Выход из системы (удаление токена) сразу закрывает доступ."""
+    token_cache.delete(instance.key)
+
+
+@receiver(post_save, sender=User)
+def forget_user_tokens(sender, instance, created, update_fields, **kwargs):
+    """Смена пароля, блокировка и любое другое изменение пользователя
+    сбрасывают его закэшированные токены."""
+    if created or (update_fields and set(update_fields) <= {'last_login'}):
+        return
+    token_cache.delete(*Token.objects.filter(
+        user=instance).values_list('key', flat=True))